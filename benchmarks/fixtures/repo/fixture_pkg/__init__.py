@@ -0,0 +1,5 @@
+from fixture_pkg.base import Runnable, RunnableBinding, RunnableSequence
+from fixture_pkg.passthrough import RunnablePassthrough
+from fixture_pkg.retry import RunnableRetry
+
+__all__ = ["Runnable", "RunnableBinding", "RunnableSequence", "RunnablePassthrough", "RunnableRetry"]
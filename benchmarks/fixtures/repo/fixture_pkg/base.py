@@ -0,0 +1,112 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator, List, Mapping, Optional
+
+from fixture_pkg.config import RunnableConfig, ensure_config, merge_configs
+
+
+class Runnable:
+    """A unit of work that can be invoked, batched, streamed and composed with ``|``."""
+
+    name: Optional[str] = None
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None) -> Any:
+        raise NotImplementedError
+
+    def batch(self, inputs: List[Any], config: Optional[RunnableConfig] = None) -> List[Any]:
+        config = ensure_config(config)
+        if len(inputs) <= 1:
+            return [self.invoke(input, config) for input in inputs]
+        with ThreadPoolExecutor(max_workers=config["max_concurrency"]) as pool:
+            return list(pool.map(lambda input: self.invoke(input, config), inputs))
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None) -> Iterator[Any]:
+        yield self.invoke(input, config)
+
+    def bind(self, **kwargs: Any) -> "RunnableBinding":
+        """Return a runnable that always calls this one with ``kwargs``."""
+        return RunnableBinding(bound=self, kwargs=kwargs)
+
+    def with_config(self, config: Optional[RunnableConfig] = None, **kwargs: Any) -> "RunnableBinding":
+        return RunnableBinding(bound=self, config=merge_configs(config, kwargs))
+
+    def with_retry(self, stop_after_attempt: int = 3) -> "Runnable":
+        from fixture_pkg.retry import RunnableRetry
+
+        return RunnableRetry(bound=self, max_attempt_number=stop_after_attempt)
+
+    def __or__(self, other: Any) -> "RunnableSequence":
+        return RunnableSequence(self, coerce_to_runnable(other))
+
+    def __ror__(self, other: Any) -> "RunnableSequence":
+        return RunnableSequence(coerce_to_runnable(other), self)
+
+
+class RunnableSequence(Runnable):
+    """Runs its steps one after another, each step receiving the previous step's output."""
+
+    def __init__(self, *steps: Runnable):
+        flattened: List[Runnable] = []
+        for step in steps:
+            flattened.extend(step.steps if isinstance(step, RunnableSequence) else [step])
+        self.steps = flattened
+
+    @property
+    def first(self) -> Runnable:
+        return self.steps[0]
+
+    @property
+    def last(self) -> Runnable:
+        return self.steps[-1]
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None) -> Any:
+        config = ensure_config(config)
+        for step in self.steps:
+            input = step.invoke(input, config)
+        return input
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None) -> Iterator[Any]:
+        config = ensure_config(config)
+        for step in self.steps[:-1]:
+            input = step.invoke(input, config)
+        yield from self.last.stream(input, config)
+
+
+class RunnableBinding(Runnable):
+    """Wraps another runnable and forwards calls to it with bound kwargs and config.
+
+    ``bind``, ``with_config`` and ``with_retry`` all return bindings, so the wrapped
+    runnable itself is never mutated.
+    """
+
+    def __init__(
+            self,
+            bound: Runnable,
+            kwargs: Optional[Mapping[str, Any]] = None,
+            config: Optional[RunnableConfig] = None,
+    ):
+        self.bound = bound
+        self.kwargs = dict(kwargs or {})
+        self.config = config or {}
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None) -> Any:
+        return self.bound.invoke(input, merge_configs(self.config, config), **self.kwargs)
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None) -> Iterator[Any]:
+        yield from self.bound.stream(input, merge_configs(self.config, config), **self.kwargs)
+
+
+class RunnableLambda(Runnable):
+    def __init__(self, func: Callable[[Any], Any]):
+        self.func = func
+        self.name = getattr(func, "__name__", "lambda")
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return self.func(input, **kwargs)
+
+
+def coerce_to_runnable(thing: Any) -> Runnable:
+    if isinstance(thing, Runnable):
+        return thing
+    if callable(thing):
+        return RunnableLambda(thing)
+    raise TypeError(f"Expected a Runnable or callable, got {type(thing).__name__}")
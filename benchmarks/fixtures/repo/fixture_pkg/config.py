@@ -0,0 +1,31 @@
+from typing import Any, Dict, List, Optional, TypedDict
+
+
+class RunnableConfig(TypedDict, total=False):
+    tags: List[str]
+    metadata: Dict[str, Any]
+    max_concurrency: Optional[int]
+    recursion_limit: int
+
+
+def ensure_config(config: Optional[RunnableConfig] = None) -> RunnableConfig:
+    """Fill in the defaults every runnable relies on."""
+    merged: RunnableConfig = {"tags": [], "metadata": {}, "max_concurrency": None, "recursion_limit": 25}
+    if config:
+        merged.update(config)
+    return merged
+
+
+def merge_configs(*configs: Optional[RunnableConfig]) -> RunnableConfig:
+    merged: RunnableConfig = {}
+    for config in configs:
+        if not config:
+            continue
+        for key, value in config.items():
+            if key == "tags":
+                merged["tags"] = sorted(set(merged.get("tags", []) + list(value)))
+            elif key == "metadata":
+                merged["metadata"] = {**merged.get("metadata", {}), **value}
+            else:
+                merged[key] = value
+    return merged
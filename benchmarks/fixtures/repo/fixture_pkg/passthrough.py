@@ -0,0 +1,30 @@
+from typing import Any, Callable, Dict, Optional
+
+from fixture_pkg.base import Runnable
+from fixture_pkg.config import RunnableConfig
+
+
+class RunnablePassthrough(Runnable):
+    """Returns its input unchanged, optionally calling ``func`` on it first for side effects."""
+
+    def __init__(self, func: Optional[Callable[[Any], None]] = None):
+        self.func = func
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        if self.func is not None:
+            self.func(input)
+        return input
+
+    @classmethod
+    def assign(cls, **mappers: Callable[[Dict[str, Any]], Any]) -> "RunnableAssign":
+        return RunnableAssign(mappers)
+
+
+class RunnableAssign(Runnable):
+    """Adds the outputs of ``mappers`` as new keys of a dict input."""
+
+    def __init__(self, mappers: Dict[str, Callable[[Dict[str, Any]], Any]]):
+        self.mappers = mappers
+
+    def invoke(self, input: Dict[str, Any], config: Optional[RunnableConfig] = None, **kwargs: Any) -> Dict[str, Any]:
+        return {**input, **{key: mapper(input) for key, mapper in self.mappers.items()}}
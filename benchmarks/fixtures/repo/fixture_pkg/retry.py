@@ -0,0 +1,36 @@
+import random
+import time
+from typing import Any, Optional, Tuple, Type
+
+from fixture_pkg.base import RunnableBinding
+from fixture_pkg.config import RunnableConfig
+
+
+class RunnableRetry(RunnableBinding):
+    """Retries the bound runnable on the given exception types with exponential backoff and jitter."""
+
+    def __init__(
+            self,
+            bound,
+            max_attempt_number: int = 3,
+            retry_exception_types: Tuple[Type[BaseException], ...] = (Exception,),
+            wait_exponential_jitter: bool = True,
+            **kwargs: Any,
+    ):
+        super().__init__(bound, **kwargs)
+        self.max_attempt_number = max_attempt_number
+        self.retry_exception_types = retry_exception_types
+        self.wait_exponential_jitter = wait_exponential_jitter
+
+    def _sleep(self, attempt: int):
+        delay = min(10.0, 0.5 * 2 ** attempt)
+        time.sleep(random.uniform(0, delay) if self.wait_exponential_jitter else delay)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None) -> Any:
+        for attempt in range(self.max_attempt_number):
+            try:
+                return super().invoke(input, config)
+            except self.retry_exception_types:
+                if attempt == self.max_attempt_number - 1:
+                    raise
+                self._sleep(attempt)
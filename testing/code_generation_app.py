@@ -1,53 +1,51 @@
 import streamlit as st
-from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
-from langchain_groq import ChatGroq
-from langchain_core.output_parsers import StrOutputParser
 import os
 from dotenv import load_dotenv
+from tools.code_generation import code_gen_chain, generate, repair, response_cache, write_tests
+from tools.llm_scheduler import shared_scheduler
+from tools.streaming import StreamTimer
+from tools.sandbox import SandboxUnavailable
+from tools.verify import generate_verified
 
 load_dotenv()
-GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
-
-# Define the system message for the assistant's behavior
-system_message = SystemMessagePromptTemplate.from_template(
-    "You are a highly skilled code assistant. Your task is to generate accurate and functional code based on the user's input or query. "
-    "If the user specifies a programming language, use that language; otherwise, default to Python. Ensure the code is correct and free from errors. "
-    "In addition to the code, provide comments that explain the main functionality of each part. "
-    "Offer a step-by-step explanation of the code, including the reasoning behind the chosen approach or methods used to solve the problem. "
-    "Keep explanations concise and informative. Avoid any incorrect or hallucinated information. "
-    "If applicable, also generate boilerplate code to help the user get started with the necessary structure and setup."
-)
-
-# Define the human message for the user's query
-human_message = HumanMessagePromptTemplate.from_template(
-    "{user_query}"
-)
-
-# Combine the system and human messages into a chat prompt template
-code_gen_prompt = ChatPromptTemplate(
-    messages=[
-        system_message,
-        human_message
-    ]
-)
-
-# Initialize the ChatGroq model
-llm = ChatGroq(model_name="llama3-8b-8192", groq_api_key=GROQ_API_KEY)
-
-# Create the chain using the chat prompt and the ChatGroq model
-code_gen_chain = code_gen_prompt | llm | StrOutputParser()
+# Sample several answers, test them in the sandbox and show the first that passes
+VERIFY_CODE = os.getenv("SAGE_VERIFY_CODE", "false").lower() == "true"
 
 # Streamlit app code
 st.title("LLM Agent Chatbot using LangChain")
 
 # User input for the chatbot query
 user_input = st.text_input("Enter your query:")
+verify = st.checkbox("Verify the code by running tests", value=VERIFY_CODE)
+user_tests = st.text_area("Tests (optional, assert statements; written automatically when empty):") if verify else ""
 
 if st.button("Submit"):
-    if user_input:
-        # Invoke the chain with the user's query
-        response = code_gen_chain.invoke({"user_query": user_input})
+    if user_input and verify:
+        try:
+            with st.spinner("Generating and testing candidates..."):
+                verification = generate_verified(user_input, generate, user_tests.strip() or None, write_tests, repair)
+        except SandboxUnavailable as e:
+            st.error(f"Code cannot be verified on this host: {e}")
+        else:
+            if verification.answer is None:
+                # Every generation failed or the budget ran out, say which
+                st.error(verification.describe())
+            else:
+                st.write("Response from the LLM:")
+                st.write(verification.answer)
+                st.caption(verification.describe())
+                if verification.status == "untested":
+                    st.warning("No usable tests for this request, this answer is untested.")
+                elif not verification.passed:
+                    st.warning("None of the candidates passed the tests, this answer is unverified.")
+    elif user_input:
+        # Stream the chain's answer to the user's query as it is generated
         st.write("Response from the LLM:")
-        st.write(response)
+        response = StreamTimer(code_gen_chain.stream({"user_query": user_input}), "code_gen_chain")
+        st.write_stream(response)
+        st.caption(response.summary())
     else:
         st.write("Please enter a query.")
+
+st.sidebar.caption("Response cache: {exact_hits} exact hits, {semantic_hits} semantic hits, {misses} misses ({hit_rate:.0%} hit rate)".format(**response_cache.stats()))
+st.sidebar.caption("LLM scheduler: {calls} calls, {coalesced} coalesced, {rate_limited} rate limited, {queued_seconds:.1f}s queued".format(**shared_scheduler().stats()))
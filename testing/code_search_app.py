@@ -1,8 +1,7 @@
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
-import requests
-from bs4 import BeautifulSoup
 from langchain_groq import ChatGroq
 from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
 from langchain_core.messages import SystemMessage
@@ -16,31 +15,18 @@ from langchain_core.runnables import (
 )
 import streamlit as st
 from dotenv import load_dotenv
+from tools.json_stream import StringArrayStreamParser
+from tools.llm_scheduler import scheduled
+from tools.scraper import fetch_failed, scrape_text, scrape_texts
 
 load_dotenv()
 
-os.environ["LANGCHAIN_TRACING_V2"]="true"
-os.environ["LANGCHAIN_API_KEY"]=os.getenv("LANGCHAIN_API_KEY")
-
 GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
 RESULTS_PER_QUESTION = 3
 
 ddg_search = DuckDuckGoSearchAPIWrapper()
 
-chat_model = ChatGroq(model="llama3-8b-8192", temperature=0)
-
-
-def scrape_text(url: str):
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, "html.parser")
-            page_text = soup.get_text(separator=" ", strip=True)
-            return page_text
-        else:
-            return f"Failed to retrieve the webpage: Status code {response.status_code}"
-    except Exception as e:
-        return f"Failed to retrieve the webpage: {e}"
+chat_model = scheduled(ChatGroq(model="llama3-8b-8192", temperature=0, max_retries=0))
 
 
 def web_search(query: str, num_results: int):
@@ -58,6 +44,15 @@ get_links: Runnable[Any, Any] = (
 )
 )
 
+
+def attach_page_texts(link_groups):
+    # Fetch every page of every query in one concurrent batch; failed fetches are not summarized
+    urls = [link["url"] for links in link_groups for link in links]
+    texts = iter(scrape_texts(urls))
+    groups = [[{**link, "text": next(texts)} for link in links] for links in link_groups]
+    return [[page for page in pages if not fetch_failed(page["text"])] for pages in groups]
+
+
 SEARCH_PROMPT = ChatPromptTemplate.from_messages(
     [
         ("system", "{agent_prompt}"),
@@ -108,7 +103,7 @@ scrape_and_summarize: Runnable[Any, Any] = (
         RunnableParallel(
             {
                 "question": lambda x: x["question"],
-                "text": lambda x: scrape_text(x["url"])[:10000],
+                "text": lambda x: (x["text"] if "text" in x else scrape_text(x["url"]))[:10000],
                 "url": lambda x: x["url"],
             }
         )
@@ -121,7 +116,9 @@ scrape_and_summarize: Runnable[Any, Any] = (
         | RunnableLambda(lambda x: f"Source Url: {x['url']}\nSummary: {x['summary']}")
 )
 
-multi_search = get_links | scrape_and_summarize.map() | (lambda x: "\n".join(x))
+summarize_pages = scrape_and_summarize.map() | (lambda x: "\n".join(x))
+
+multi_search = get_links | (lambda x: attach_page_texts([x])[0]) | summarize_pages
 
 
 def load_json(s):
@@ -131,25 +128,43 @@ def load_json(s):
         return {}
 
 
-search_query = SEARCH_PROMPT | chat_model | StrOutputParser() | load_json
+search_query = SEARCH_PROMPT | chat_model | StrOutputParser()
 choose_agent = (
         CHOOSE_AGENT_PROMPT | chat_model | StrOutputParser() | load_json
 )
 
-get_search_queries = (
+get_search_inputs = (
         RunnablePassthrough().assign(
             agent_prompt=RunnableParallel({"task": lambda x: x})
                          | choose_agent
                          | (lambda x: x.get("agent_role_prompt"))
         )
         | RunnableLambda(lambda x: {"agent_prompt": x["agent_prompt"], "question": x["task"]})
-        | search_query
 )
 
+
+def stream_search_queries(inputs):
+    parser = StringArrayStreamParser()
+    for chunk in search_query.stream(inputs):
+        yield from parser.feed(chunk)
+    yield from parser.close()
+    if not parser.emitted:
+        # Nothing usable came back, search the task itself
+        yield inputs["question"]
+
+
+def search_links(inputs):
+    # Each query is searched as soon as the model finishes writing it
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(get_links.invoke, {"question": q}) for q in stream_search_queries(inputs)]
+        return [future.result() for future in futures]
+
+
 chain = (
-        get_search_queries
-        | (lambda x: [{"question": q} for q in x])
-        | multi_search.map()
+        get_search_inputs
+        | RunnableLambda(search_links)
+        | attach_page_texts
+        | summarize_pages.map()
         | (lambda x: "\n\n".join(x))
 )
 
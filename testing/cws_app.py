@@ -1,7 +1,8 @@
 import json
+import threading
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError, as_completed, wait
 from typing import Any
-import requests
-from bs4 import BeautifulSoup
 from langchain_groq import ChatGroq
 from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
 from langchain_core.messages import SystemMessage
@@ -9,6 +10,7 @@ from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import (
     Runnable,
+    RunnableGenerator,
     RunnableLambda,
     RunnableParallel,
     RunnablePassthrough,
@@ -16,36 +18,46 @@ from langchain_core.runnables import (
 import streamlit as st
 import os
 from dotenv import load_dotenv
+from tools.deadline import Deadline, DeadlineExceeded, deadline_scope
+from tools.dedup import near_duplicates, normalize_url
+from tools.json_stream import StringArrayStreamParser, parse_string_array
+from tools.llm_scheduler import BACKGROUND, scheduled, shared_scheduler
+from tools.passages import TokenSavings, select_passages
+from tools.router import route_task
+from tools.scraper import fetch_failed, page_cache, scrape_text, scrape_texts
+from tools.streaming import StreamTimer
+from tools.tracing import in_current_context, span, start_metrics_server
 
 load_dotenv()
 
-os.environ["LANGCHAIN_TRACING_V2"]="true"
-os.environ["LANGCHAIN_API_KEY"]=os.getenv("LANGCHAIN_API_KEY")
+start_metrics_server()
 
 GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
 
 RESULTS_PER_QUESTION = 3
+SUMMARY_TOKEN_BUDGET = 1500
+# Below this confidence the local router defers to the LLM router, if enabled
+ROUTER_MIN_CONFIDENCE = 0.3
+LLM_ROUTER_FALLBACK = os.getenv("SAGE_LLM_ROUTER_FALLBACK", "false").lower() == "true"
+# Search the raw task while the agent is routed and the queries are generated
+SPECULATIVE_SEARCH = os.getenv("SAGE_SPECULATIVE_SEARCH", "false").lower() == "true"
+# Whole-request budget; sources not summarized by then are dropped and the result is labeled partial
+SEARCH_DEADLINE_SECONDS = float(os.getenv("SAGE_SEARCH_DEADLINE", "45"))
+SUMMARY_WORKERS = 8
+PARTIAL_RESULTS_LABEL = "[Partial results]"
 
 ddg_search = DuckDuckGoSearchAPIWrapper()
 
-chat_model = ChatGroq(model="llama3-8b-8192", temperature=0)
-
-
-def scrape_text(url: str):
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, "html.parser")
-            page_text = soup.get_text(separator=" ", strip=True)
-            return page_text
-        else:
-            return f"Failed to retrieve the webpage: Status code {response.status_code}"
-    except Exception as e:
-        return f"Failed to retrieve the webpage: {e}"
+# Routing and queries go ahead of the many page summaries in the shared LLM scheduler
+groq_model = ChatGroq(model="llama3-8b-8192", temperature=0, max_retries=0)
+chat_model = scheduled(groq_model)
+summary_model = scheduled(groq_model, BACKGROUND)
 
 
 def web_search(query: str, num_results: int):
-    results = ddg_search.results(query, num_results)
+    with span("search") as current:
+        results = ddg_search.results(query, num_results)
+        current.set("results", len(results))
     return [r["link"] for r in results]
 
 
@@ -59,6 +71,7 @@ get_links: Runnable[Any, Any] = (
 )
 )
 
+
 SEARCH_PROMPT = ChatPromptTemplate.from_messages(
     [
         ("system", "{agent_prompt}"),
@@ -79,7 +92,7 @@ task: "How to implement a binary search in Python?"
 response: 
 {
     "agent": "🖥️ Code Search Agent",
-    "agent_role_prompt: "You are a seasoned software development assistant AI. Your primary goal is to compose comprehensive, insightful, and methodically arranged search queries to find relevant code snippets and documentation."
+    "agent_role_prompt": "You are a seasoned software development assistant AI. Your primary goal is to compose comprehensive, insightful, and methodically arranged search queries to find relevant code snippets and documentation."
 }
 task: "Python requests library documentation"
 response: 
@@ -105,47 +118,321 @@ Using the above text, answer in short the following question:
 If the question cannot be answered using the text, simply summarize the text. Include all factual information, numbers, stats etc if available."""
 SUMMARY_PROMPT = ChatPromptTemplate.from_template(SUMMARY_TEMPLATE)
 
+token_savings = TokenSavings()
+
+
+def select_page_text(page):
+    # Only the passages most relevant to the question go into SUMMARY_PROMPT
+    selection = select_passages(page["text"], page["question"], SUMMARY_TOKEN_BUDGET)
+    token_savings.add(selection)
+    return {**page, "text": selection.text, "prompt_tokens": selection.tokens_out}
+
+
 scrape_and_summarize: Runnable[Any, Any] = (
         RunnableParallel(
             {
                 "question": lambda x: x["question"],
-                "text": lambda x: scrape_text(x["url"])[:10000],
+                "text": lambda x: (x["text"] if "text" in x else scrape_text(x["url"], x.get("deadline")))[:10000],
                 "url": lambda x: x["url"],
             }
         )
         | RunnableParallel(
     {
-        "summary": SUMMARY_PROMPT | chat_model | StrOutputParser(),
+        "summary": SUMMARY_PROMPT | summary_model | StrOutputParser(),
         "url": lambda x: x["url"],
     }
 )
         | RunnableLambda(lambda x: f"Source Url: {x['url']}\nSummary: {x['summary']}")
 )
 
-multi_search = get_links | scrape_and_summarize.map() | (lambda x: "\n".join(x))
+
+def request_deadline(x):
+    return x.get("deadline") or Deadline()
+
+
+def partial_results_label(dropped, total, deadline):
+    reason = "the request was cancelled" if deadline.cancelled else f"the {deadline.seconds:g}s budget ran out"
+    return f"{PARTIAL_RESULTS_LABEL} {dropped} of {total} sources were not summarized before {reason}."
+
+
+def summarize_page(page, deadline):
+    # Streaming lets the scheduled model stop generating as soon as the deadline passes
+    with deadline_scope(deadline), span("summarize", prompt_tokens=page.get("prompt_tokens", 0)):
+        deadline.check()
+        return "".join(scrape_and_summarize.stream(page))
+
+
+def chain_future(source, target):
+    # A summary cancelled with the pool counts as dropped at the deadline
+    def copy(done):
+        if done.cancelled():
+            target.set_exception(DeadlineExceeded())
+        elif done.exception() is not None:
+            target.set_exception(done.exception())
+        else:
+            target.set_result(done.result())
+
+    source.add_done_callback(copy)
+
+
+class PageSummaries:
+    """Fetches and summarizes each distinct page once, in one pool bounded by ``deadline``.
+
+    Queries often return the same or mirrored pages. ``add`` can be called again,
+    from any thread, while earlier summaries are still running: pages already
+    added, or near-duplicates of them, share the summary in flight.
+    """
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self._pool = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS)
+        self._lock = threading.Lock()
+        # Normalized url -> its page summary, None for pages that could not be fetched
+        self._summaries = {}
+        # Fetched page texts in the order they arrived, the first of near-duplicates is summarized
+        self._texts = {}
+
+    def add(self, links):
+        """Fetch the new pages of ``links`` and start their summaries; returns the links' normalized urls."""
+        keys = [normalize_url(link["url"]) for link in links]
+        new = {}
+        with self._lock:
+            for key, link in zip(keys, links):
+                if key not in self._summaries:
+                    self._summaries[key] = Future()
+                    new[key] = link
+        texts = scrape_texts((link["url"] for link in new.values()), self.deadline)
+        with self._lock:
+            for (key, link), text in zip(new.items(), texts):
+                if fetch_failed(text):
+                    # Its error text is not page content, the page is left out
+                    self._summaries[key].set_result(None)
+                else:
+                    self._texts[key] = text
+            representative = near_duplicates(list(self._texts), list(self._texts.values()))
+            for key, link in new.items():
+                if key not in self._texts:
+                    continue
+                if representative[key] != key:
+                    chain_future(self._summaries[representative[key]], self._summaries[key])
+                    continue
+                page = select_page_text({**link, "text": self._texts[key]})
+                try:
+                    summary = self._pool.submit(in_current_context(summarize_page), page, self.deadline)
+                except RuntimeError:
+                    # Closed at the deadline while this page was being fetched
+                    summary = Future()
+                    summary.set_exception(DeadlineExceeded())
+                chain_future(summary, self._summaries[key])
+        return keys
+
+    def as_completed(self, keys):
+        """Yields (key, summary) for ``keys`` as summaries finish and (key, None) for those dropped at the deadline."""
+        waiting = defaultdict(list)
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                waiting[self._summaries[key]].append(key)
+        try:
+            for future in as_completed(list(waiting), timeout=self.deadline.remaining()):
+                try:
+                    summary = future.result()
+                except DeadlineExceeded:
+                    continue
+                for key in waiting.pop(future):
+                    if summary is not None:
+                        yield key, summary
+        except TimeoutError:
+            pass
+        for dropped in waiting.values():
+            for key in dropped:
+                yield key, None
+
+    def close(self):
+        # Unstarted summaries are cancelled, running ones stop at their next chunk
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_summaries(links, deadline=None):
+    summaries = PageSummaries(deadline or Deadline())
+    try:
+        yield from summaries.as_completed(summaries.add(links))
+    finally:
+        summaries.close()
+
+
+def summarize_links(links, deadline=None):
+    return {key: summary for key, summary in iter_summaries(links, deadline) if summary is not None}
+
+
+def summarize_deduplicated(link_groups, deadline=None, summaries=None):
+    # Fan each page summary back out to every query that linked it
+    deadline = deadline or Deadline()
+    owned = summaries is None
+    summaries = summaries or PageSummaries(deadline)
+    result = {}
+    dropped = 0
+    try:
+        links = [link for group in link_groups for link in group]
+        for key, summary in summaries.as_completed(summaries.add(links)):
+            if summary is None:
+                dropped += 1
+            else:
+                result[key] = summary
+    finally:
+        if owned:
+            summaries.close()
+    results = [
+        "\n".join(dict.fromkeys(
+            result[normalize_url(link["url"])] for link in group if normalize_url(link["url"]) in result
+        ))
+        for group in link_groups
+    ]
+    if dropped:
+        results.append(partial_results_label(dropped, dropped + len(result), deadline))
+    return results
+
+
+multi_search = RunnableLambda(
+    lambda x: summarize_deduplicated([get_links.invoke(x)], deadline=request_deadline(x))[0]
+)
+
+
+def load_json(s):
+    try:
+        return json.loads(s[s.find("{"):s.rfind("}") + 1])
+    except ValueError:
+        return {}
+
 
 search_query = SEARCH_PROMPT | chat_model | StrOutputParser()
 choose_agent = (
-        CHOOSE_AGENT_PROMPT | chat_model | StrOutputParser()
+        CHOOSE_AGENT_PROMPT | chat_model | StrOutputParser() | load_json
 )
 
+
+def choose_agent_prompt(task: str):
+    with span("route") as current:
+        route = route_task(task)
+        current.set("confidence", route.confidence)
+        if LLM_ROUTER_FALLBACK and route.confidence < ROUTER_MIN_CONFIDENCE:
+            current.set("llm_fallback", True)
+            # Malformed LLM output falls back to the local pick
+            return choose_agent.invoke({"task": task}).get("agent_role_prompt") or route.agent_role_prompt
+        return route.agent_role_prompt
+
+
 get_search_queries = (
-        RunnablePassthrough().assign(
-            agent_prompt=RunnableParallel({"task": lambda x: x})
-                         | choose_agent
-                         | (lambda x: x.get("agent_role_prompt"))
-        )
-        | RunnableLambda(lambda x: {"agent_prompt": x["agent_prompt"], "question": x["task"]})
+        RunnableLambda(lambda x: {"agent_prompt": choose_agent_prompt(x["task"]), "question": x["task"]})
         | search_query
+        | parse_string_array
 )
 
+
+def stream_search_queries(task: str):
+    inputs = {"agent_prompt": choose_agent_prompt(task), "question": task}
+    parser = StringArrayStreamParser()
+    for chunk in search_query.stream(inputs):
+        yield from parser.feed(chunk)
+    yield from parser.close()
+    if not parser.emitted:
+        # Nothing usable came back: retry once, then fall back to searching the task itself
+        yield from parse_string_array(search_query.invoke(inputs)) or [task]
+
+
+def search_links(x):
+    # Each query is searched as soon as the model finishes writing it
+    deadline = request_deadline(x)
+    pool = ThreadPoolExecutor(max_workers=3)
+    futures = []
+    try:
+        with deadline_scope(deadline), span("query_gen") as current:
+            for q in stream_search_queries(x["task"]):
+                current.add("queries")
+                futures.append(pool.submit(in_current_context(get_links.invoke), {"question": q}))
+    except DeadlineExceeded:
+        # Keep the queries written so far
+        pass
+    done, _ = wait(futures, timeout=deadline.remaining())
+    pool.shutdown(wait=False, cancel_futures=True)
+    return [future.result() for future in futures if future in done and future.exception() is None]
+
+
+def search_and_summarize(x):
+    deadline = request_deadline(x)
+    if not SPECULATIVE_SEARCH:
+        return summarize_deduplicated(search_links(x), deadline)
+    summaries = PageSummaries(deadline)
+    try:
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            def speculate():
+                # The raw task's pages start summarizing while the queries are still being written
+                links = get_links.invoke({"question": x["task"]})
+                pool.submit(in_current_context(summaries.add), links)
+                return links
+
+            speculative = pool.submit(in_current_context(speculate))
+            link_groups = search_links(x)
+            # Only the links are waited for, their summaries share the pool with the expanded queries' pages
+            return summarize_deduplicated([speculative.result()] + link_groups, deadline, summaries)
+    finally:
+        summaries.close()
+
+
 chain = (
-        get_search_queries
-        | (lambda x: [{"question": q} for q in x])
-        | multi_search.map()
+        RunnableLambda(search_and_summarize)
         | (lambda x: "\n\n".join(x))
 )
 
+
+def iter_search_results(x):
+    # Unlike chain, summaries come out per page in the order they finish
+    deadline = request_deadline(x)
+    summaries = PageSummaries(deadline)
+    seen = set()
+    summarized = {}
+    dropped = set()
+    linked = set()
+
+    def collect(keys):
+        linked.update(keys)
+        for key, summary in summaries.as_completed(keys):
+            if summary is None:
+                dropped.add(key)
+                continue
+            summarized[key] = summary
+            if summary not in seen:
+                seen.add(summary)
+                yield summary
+
+    pool = ThreadPoolExecutor(max_workers=1)
+    try:
+        if SPECULATIVE_SEARCH:
+            # The expanded queries' pages join the same pool as soon as they are found,
+            # while the raw task's summaries are still coming out
+            expanded = pool.submit(in_current_context(lambda: summaries.add(
+                [link for group in search_links(x) for link in group]
+            )))
+            yield from collect(summaries.add(get_links.invoke({"question": x["task"]})))
+            yield from collect(expanded.result())
+        else:
+            yield from collect(summaries.add([link for group in search_links(x) for link in group]))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        summaries.close()
+    dropped -= summarized.keys()
+    if dropped:
+        total = len(dropped | summarized.keys() | linked)
+        yield partial_results_label(len(dropped), total, deadline)
+
+
+def stream_search_results(inputs):
+    for x in inputs:
+        for summary in iter_search_results(x):
+            yield summary + "\n\n"
+
+
+stream_chain = RunnableGenerator(stream_search_results)
+
 # Streamlit app
 st.title("Code and Documentation Search")
 
@@ -153,11 +440,34 @@ user_query = st.text_input("Enter your programming query:")
 
 if st.button("Search"):
     if user_query:
-        result = chain.invoke({"task": user_query})
-        st.text_area("Search Results", result, height=400)
+        # A new search supersedes the previous one of this session, stop its fetches and LLM calls
+        previous = st.session_state.get("search_deadline")
+        if previous is not None:
+            previous.cancel()
+        deadline = st.session_state["search_deadline"] = Deadline(SEARCH_DEADLINE_SECONDS)
+        tokens_saved = token_savings.tokens_saved
+        st.subheader("Search Results")
+        # Each source is shown as soon as its summary is ready
+        try:
+            with span("request", app="cws"):
+                results = StreamTimer(stream_chain.stream({"task": user_query, "deadline": deadline}), "search")
+                for summary in results:
+                    if summary.startswith(PARTIAL_RESULTS_LABEL):
+                        st.warning(summary.strip())
+                    else:
+                        st.text(summary.strip())
+        finally:
+            # Also reached when Streamlit interrupts this run, so abandoned work stops too
+            deadline.cancel()
+        st.caption(results.summary())
+        st.caption(f"Passage selection saved {token_savings.tokens_saved - tokens_saved} prompt tokens")
     else:
         st.error("Please enter a query.")
 
+st.sidebar.caption("Page cache: {hits} hits, {revalidated} revalidated, {misses} misses, {entries} pages".format(**page_cache.stats()))
+st.sidebar.caption(f"Passage selection: {token_savings.tokens_saved} tokens saved over {token_savings.pages} pages")
+st.sidebar.caption("LLM scheduler: {calls} calls, {coalesced} coalesced, {rate_limited} rate limited, {queued_seconds:.1f}s queued".format(**shared_scheduler().stats()))
+
 # # Streamlit app
 # st.title("Code and Documentation Search")
 #
@@ -4,12 +4,15 @@ from langchain_groq import ChatGroq
 from langchain_core.output_parsers import StrOutputParser
 import os
 from dotenv import load_dotenv
+from tools.llm_scheduler import INTERACTIVE, scheduled, shared_scheduler
+from tools.response_cache import shared_response_cache
+from tools.streaming import StreamTimer
 
 load_dotenv()
 
 # Get the Groq API key from environment variables
 GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
-llm = ChatGroq(model_name="llama3-8b-8192", groq_api_key=GROQ_API_KEY)
+llm = scheduled(ChatGroq(model_name="llama3-8b-8192", groq_api_key=GROQ_API_KEY, max_retries=0), INTERACTIVE)
 
 # Define system and human messages for error handling
 system_message_start = SystemMessagePromptTemplate.from_template(
@@ -48,7 +51,13 @@ error_handling_prompt = ChatPromptTemplate(
     ]
 )
 
-error_handling_chain = error_handling_prompt | llm | StrOutputParser()
+# Identical errors are pasted often, answer them from the response cache; a similar
+# snippet only counts as a hit for exactly the same error message
+response_cache = shared_response_cache()
+error_handling_chain = response_cache.wrap(
+    error_handling_prompt | llm | StrOutputParser(), "error_handling_chain", error_handling_prompt, llm,
+    exact_fields=("error_message",),
+)
 
 # Streamlit app layout
 st.title("Code Error Handling Assistant")
@@ -60,8 +69,15 @@ error_message = st.text_area("Enter the error message here:")
 
 if st.button("Analyze Error"):
     if code_snippet and error_message:
-        response = error_handling_chain.invoke({'code_snippet': code_snippet, 'error_message': error_message})
         st.subheader("Analysis and Resolution:")
-        st.write(response)
+        response = StreamTimer(
+            error_handling_chain.stream({'code_snippet': code_snippet, 'error_message': error_message}),
+            "error_handling_chain",
+        )
+        st.write_stream(response)
+        st.caption(response.summary())
     else:
         st.error("Please provide both a code snippet and an error message.")
+
+st.sidebar.caption("Response cache: {exact_hits} exact hits, {semantic_hits} semantic hits, {misses} misses ({hit_rate:.0%} hit rate)".format(**response_cache.stats()))
+st.sidebar.caption("LLM scheduler: {calls} calls, {coalesced} coalesced, {rate_limited} rate limited, {queued_seconds:.1f}s queued".format(**shared_scheduler().stats()))
@@ -1,62 +1,38 @@
-from git import Repo
-from langchain_community.document_loaders.generic import GenericLoader
-from langchain_community.document_loaders.parsers import LanguageParser
-from langchain_text_splitters import Language
 from langchain_huggingface import HuggingFaceEmbeddings
+from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_groq import ChatGroq
 import os
+import time
 from dotenv import load_dotenv
+from tools.embedding_cache import CachedEmbeddings
+from tools.git_clone import MIRROR_DIR, CloneOptions
+from tools.hybrid_retriever import CrossEncoderReranker, HybridRetriever
+from tools.jobs import JobQueue, current_index_dir, ensure_worker
+from tools.llm_scheduler import INTERACTIVE, scheduled
+from tools.repo_index import RepoIndex
+from tools.tracing import span, start_metrics_server
 load_dotenv()
 
-os.environ["LANGCHAIN_TRACING_V2"]="true"
-os.environ["LANGCHAIN_API_KEY"]=os.getenv("LANGCHAIN_API_KEY")
 GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
 HUGGINGFACE_API_TOKEN = os.getenv("HUGGINGFACE_API_TOKEN")
-# Clone
-repo_path = "test_repo"
-repo = Repo.clone_from("https://github.com/langchain-ai/langchain", to_path=repo_path)
-
-# Load
-loader = GenericLoader.from_filesystem(
-    repo_path + "/libs/core/langchain_core",
-    glob="**/*",
-    suffixes=[".py"],
-    exclude=["**/non-utf8-encoding.py"],
-    parser=LanguageParser(language=Language.PYTHON, parser_threshold=500),
-)
-documents = loader.load()
-len(documents)
-
-# Create embeddings
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-
-python_splitter = RecursiveCharacterTextSplitter.from_language(
-    language=Language.PYTHON, chunk_size=2000, chunk_overlap=200
-)
-texts = python_splitter.split_documents(documents)
-len(texts)
-
-from langchain_chroma import Chroma
-# from langchain_openai import OpenAIEmbeddings
 
-# db = Chroma.from_documents(texts, OpenAIEmbeddings(disallowed_special=()))
-db = Chroma.from_documents(texts, embeddings=embeddings)
-retriever = db.as_retriever(
-    search_type="mmr",  # Also test "similarity"
-    search_kwargs={"k": 8},
-)
-
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_groq import ChatGroq
+repo_url = "https://github.com/langchain-ai/langchain"
+repo_path = "test_repo"
+repo_subpath = "libs/core/langchain_core"
+embedding_model = "sentence-transformers/all-MiniLM-L6-v2"
+INDEX_NAME = "langchain_core"
+# Local cross-encoder pass over the fused BM25 + vector candidates, loaded before the first question
+RERANK = os.getenv("SAGE_RERANK", "false").lower() == "true"
+# int8 vectors with an IVF index in memory-mapped files instead of Chroma
+QUANTIZED_INDEX = os.getenv("SAGE_QUANTIZED_INDEX", "false").lower() == "true"
 
-llm = ChatGroq(model="llama3-8b-8192", temperature=0)
+llm = scheduled(ChatGroq(model="llama3-8b-8192", temperature=0, max_retries=0), INTERACTIVE)
 
 # First we need a prompt that we can pass into an LLM to generate this search query
 
-prompt = ChatPromptTemplate.from_messages(
+rewrite_prompt = ChatPromptTemplate.from_messages(
     [
         ("placeholder", "{chat_history}"),
         ("user", "{input}"),
@@ -67,9 +43,7 @@ prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-retriever_chain = create_history_aware_retriever(llm, retriever, prompt)
-
-prompt = ChatPromptTemplate.from_messages(
+answer_prompt = ChatPromptTemplate.from_messages(
     [
         (
             "system",
@@ -79,20 +53,108 @@ prompt = ChatPromptTemplate.from_messages(
         ("user", "{input}"),
     ]
 )
-document_chain = create_stuff_documents_chain(llm, prompt)
 
-qa = create_retrieval_chain(retriever_chain, document_chain)
 
-question = "What is a RunnableBinding?"
-result = qa.invoke({"input": question})
-print(result["answer"])
+def open_index(index_dir=None):
+    # Create embeddings, reusing cached vectors for chunks embedded before by any repo or branch
+    embeddings = CachedEmbeddings(HuggingFaceEmbeddings(model_name=embedding_model), embedding_model)
+
+    # Shallow, blobless clone of only the indexed subpath, served from a local mirror between runs
+    clone_options = CloneOptions(
+        depth=1,
+        blob_filter="blob:none",
+        sparse_paths=[repo_subpath],
+        suffixes=[".py"],
+        mirror_dir=MIRROR_DIR,
+    )
+    return RepoIndex(
+        repo_url, repo_path, repo_subpath, embeddings,
+        index_dir=index_dir, clone_options=clone_options, quantized=QUANTIZED_INDEX,
+    )
+
+
+def build_index():
+    # Clone or fetch and index only the files changed since the last indexed commit, in a background worker
+    queue = JobQueue()
+    job = queue.submit(INDEX_NAME, "testing.git_repo_app:open_index")
+    ensure_worker(queue, INDEX_NAME)
+    index_dir = current_index_dir(INDEX_NAME)
+    if index_dir is not None:
+        print(f"Serving the last completed index, re-index {job.describe()} "
+              f"(cancel with python -m tools.jobs --cancel {INDEX_NAME})")
+    else:
+        # Nothing to serve before the first build completes; Ctrl+C cancels it
+        try:
+            while job.active:
+                print(f"Waiting for the first index: {job.describe()}")
+                time.sleep(5)
+                job = queue.get(job.id)
+        except KeyboardInterrupt:
+            queue.cancel(job.id)
+            print(f"Cancelled indexing job {job.id}")
+            raise
+        if job.status != "done":
+            raise RuntimeError(f"Indexing {job.status}: {job.error or ''}")
+        index_dir = current_index_dir(INDEX_NAME)
+
+    index = open_index(index_dir)
+    print(f"Index at {index.state.commit[:12]}: {index.state.files} files, {index.state.chunks} chunks")
+    if QUANTIZED_INDEX:
+        store = index.db.stats()
+        print(f"Vector store: {store['alive']} vectors in {store['lists']} lists, "
+              f"{store['vector_bytes'] / 2**20:.1f} MiB on disk vs {store['float32_bytes'] / 2**20:.1f} MiB as float32")
+        for row in index.db.recall_report():
+            print(", ".join(f"{name}: {value:.3f}" if isinstance(value, float) else f"{name}: {value}" for name, value in row.items()))
+    return index
+
+
+def build_qa(index):
+    # Identifier-heavy questions need exact term matches that MiniLM vectors miss
+    retriever = HybridRetriever(
+        vectorstore=index.db,
+        bm25=index.bm25,
+        reranker=CrossEncoderReranker() if RERANK else None,
+        k=4,
+    )
+    if retriever.reranker is not None:
+        retriever.reranker.model()
+    retriever_chain = create_history_aware_retriever(llm, retriever, rewrite_prompt)
+    document_chain = create_stuff_documents_chain(llm, answer_prompt)
+    qa = create_retrieval_chain(retriever_chain, document_chain)
+
+    def ask(question):
+        with span("request", app="git_repo"):
+            # Questions naming known classes/functions skip the query rewrite and vector search
+            with span("resolve_symbols") as resolved:
+                context = index.symbols.resolve(question)
+                resolved.set("symbol_hit", bool(context))
+            if context:
+                answer = document_chain.invoke({"input": question, "context": context})
+                return {"input": question, "context": context, "answer": answer}
+            return qa.invoke({"input": question})
+
+    return ask
+
+
+def main():
+    # Ingestion runs worker processes, so nothing may run at import time
+    start_metrics_server()
+    ask = build_qa(build_index())
+
+    question = "What is a RunnableBinding?"
+    result = ask(question)
+    print(result["answer"])
+
+    questions = [
+        "What classes are derived from the Runnable class?",
+        "What one improvement do you propose in code in relation to the class hierarchy for the Runnable class?",
+    ]
+
+    for question in questions:
+        result = ask(question)
+        print(f"-> **Question**: {question} \n")
+        print(f"**Answer**: {result['answer']} \n")
 
-questions = [
-    "What classes are derived from the Runnable class?",
-    "What one improvement do you propose in code in relation to the class hierarchy for the Runnable class?",
-]
 
-for question in questions:
-    result = qa.invoke({"input": question})
-    print(f"-> **Question**: {question} \n")
-    print(f"**Answer**: {result['answer']} \n")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
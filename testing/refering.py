@@ -5,37 +5,21 @@ from langchain_groq import ChatGroq
 from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
 import os
 from typing import Any
-import requests
-from bs4 import BeautifulSoup
 import streamlit as st
 from dotenv import load_dotenv
+from tools.json_stream import iter_string_array
+from tools.llm_scheduler import scheduled
+from tools.scraper import scrape_text
 
 # Load environment variables
 load_dotenv()
 
-# Set environment variables for LangChain
-os.environ["LANGCHAIN_TRACING_V2"] = "true"
-os.environ["LANGCHAIN_API_KEY"] = os.getenv("LANGCHAIN_API_KEY")
-
 GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
 RESULTS_PER_QUESTION = 3
 
 ddg_search = DuckDuckGoSearchAPIWrapper()
 
-chat_model = ChatGroq(model="llama3-8b-8192", temperature=0)
-
-
-def scrape_text(url: str):
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, "html.parser")
-            page_text = soup.get_text(separator=" ", strip=True)
-            return page_text
-        else:
-            return f"Failed to retrieve the webpage: Status code {response.status_code}"
-    except Exception as e:
-        return f"Failed to retrieve the webpage: {e}"
+chat_model = scheduled(ChatGroq(model="llama3-8b-8192", temperature=0, max_retries=0))
 
 
 def web_search(query: str, num_results: int):
@@ -136,10 +120,9 @@ def choose_agent(task: str):
 
 def search_query(task: str, agent_prompt: str):
     search_prompt = SEARCH_PROMPT.format_prompt(agent_prompt=agent_prompt, question=task)
-    search_response = chat_model.invoke(search_prompt)
-    search_response_cleaned = clean_json_response(search_response.content)
-    queries = JsonOutputParser().parse_result(search_response_cleaned)
-    return queries
+    # The queries are a JSON array of strings, parsed as they stream instead of cut out of the buffered reply
+    queries = list(iter_string_array(chunk.content for chunk in chat_model.stream(search_prompt)))
+    return queries or [task]
 
 
 def main():
@@ -0,0 +1,73 @@
+import pytest
+
+pytest.importorskip("git")
+pytest.importorskip("langchain_core")
+
+from tools.code_chunker import AstChunker
+
+SOURCE = '''\
+import os
+
+
+# Reads the config
+def load(path):
+    return open(path).read()
+
+
+class Store:
+    """Key-value store."""
+
+    def get(self, key):
+        return self.data[key]
+
+    @property
+    def size(self):
+        return len(self.data)
+'''
+
+
+def covered_lines(documents):
+    return [line for d in documents for line in range(d.metadata["start_line"], d.metadata["end_line"] + 1)]
+
+
+def test_small_definitions_are_packed_into_one_chunk():
+    (document,) = AstChunker(max_chars=2000).split(SOURCE, "store.py")
+
+    assert document.page_content == SOURCE.rstrip("\n")
+    assert document.metadata["symbols"] == "<module>, load, Store"
+    assert document.metadata["kinds"] == "statement, function, class"
+
+
+def test_chunks_follow_definition_boundaries_without_overlap():
+    documents = AstChunker(max_chars=120).split(SOURCE, "store.py")
+
+    assert covered_lines(documents) == list(range(1, len(SOURCE.splitlines()) + 1))
+    # The comment above a definition stays with it
+    assert "# Reads the config\ndef load(path):" in documents[0].page_content
+    assert documents[1].metadata["symbols"] == "Store.get, Store.size"
+
+
+def test_oversized_classes_are_split_at_their_methods():
+    documents = AstChunker(max_chars=80).split(SOURCE, "store.py")
+
+    assert [d.metadata["symbols"] for d in documents] == ["<module>, load", "Store", "Store.get", "Store.size"]
+    # The class header stays with its first piece, decorators with their method
+    assert documents[1].page_content.strip() == 'class Store:\n    """Key-value store."""'
+    assert documents[3].page_content.strip().startswith("@property")
+
+
+def test_files_that_do_not_parse_fall_back_to_line_windows():
+    source = "def broken(:\n" + "x = 1\n" * 30
+
+    documents = AstChunker(max_chars=50).split(source, "broken.py")
+
+    assert all(len(d.page_content) <= 50 for d in documents)
+    assert covered_lines(documents) == list(range(1, 32))
+
+
+def test_analyze_returns_the_symbols_from_the_same_parse(tmp_path):
+    (tmp_path / "store.py").write_text(SOURCE)
+
+    documents, symbols = AstChunker().analyze(str(tmp_path), "store.py")
+
+    assert documents and {s.qualname for s in symbols} >= {"load", "Store", "Store.get", "Store.size"}
@@ -0,0 +1,70 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tools.deadline import Deadline, DeadlineExceeded, current_deadline, deadline_scope
+from tools.tracing import in_current_context
+
+
+def test_deadline_expires_after_its_budget():
+    deadline = Deadline(0.05)
+    deadline.check()
+
+    time.sleep(0.06)
+
+    assert deadline.expired and deadline.remaining() == 0.0
+    with pytest.raises(DeadlineExceeded, match="0.05s"):
+        deadline.check()
+
+
+def test_no_budget_never_expires():
+    deadline = Deadline()
+
+    assert deadline.remaining() is None and not deadline.expired
+    deadline.check()
+
+
+def test_cancel_runs_callbacks_once_and_wakes_waiters():
+    deadline = Deadline(10)
+    calls = []
+    deadline.on_cancel(lambda: calls.append("registered"))
+    unregister = deadline.on_cancel(lambda: calls.append("unregistered"))
+    unregister()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        waiter = pool.submit(deadline.wait, 10)
+
+        deadline.cancel()
+        deadline.cancel()
+
+        assert waiter.result(timeout=1) is True
+    assert calls == ["registered"]
+    with pytest.raises(DeadlineExceeded, match="cancelled"):
+        deadline.check()
+
+
+def test_callbacks_registered_after_cancel_run_at_once():
+    deadline = Deadline()
+    deadline.cancel()
+    called = threading.Event()
+
+    deadline.on_cancel(called.set)
+
+    assert called.is_set()
+
+
+def test_wait_is_cut_short_by_the_deadline():
+    start = time.monotonic()
+
+    assert Deadline(0.05).wait(5) is False
+    assert time.monotonic() - start < 1
+
+
+def test_scope_is_visible_in_threads_started_from_it():
+    deadline = Deadline(10)
+    with deadline_scope(deadline), ThreadPoolExecutor(max_workers=1) as pool:
+        seen = pool.submit(in_current_context(current_deadline.get)).result()
+
+    assert seen is deadline
+    assert current_deadline.get() is None
@@ -0,0 +1,49 @@
+import random
+
+import pytest
+
+from tools.dedup import near_duplicates, normalize_url, simhash
+
+
+@pytest.mark.parametrize("url", [
+    "http://www.example.com/docs/",
+    "https://example.com:443/docs",
+    "https://example.com//docs/index.html#install",
+    "https://example.com/docs?utm_source=ddg&fbclid=abc",
+])
+def test_variants_of_a_url_normalize_to_the_same_page(url):
+    assert normalize_url(url) == "https://example.com/docs"
+
+
+def test_meaningful_url_differences_are_kept():
+    assert normalize_url("https://example.com/docs?b=2&a=1") == "https://example.com/docs?a=1&b=2"
+    assert normalize_url("https://example.com:8080/docs") == "https://example.com:8080/docs"
+    assert normalize_url("https://example.com/docs?page=2") != normalize_url("https://example.com/docs?page=3")
+
+
+def words(seed, count=300):
+    rng = random.Random(seed)
+    return [rng.choice(["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta", "iota", "kappa"])
+            + str(rng.randrange(50)) for _ in range(count)]
+
+
+def test_simhash_is_close_for_small_edits_and_far_for_other_text():
+    text = words(1)
+    edited = text[:150] + ["changed"] + text[151:]
+
+    assert bin(simhash(" ".join(text)) ^ simhash(" ".join(edited))).count("1") <= 3
+    assert bin(simhash(" ".join(text)) ^ simhash(" ".join(words(2)))).count("1") > 10
+
+
+def test_near_duplicates_map_to_the_first_page():
+    page = " ".join(words(1))
+    mirror = "Mirrored from the docs. " + page
+    other = " ".join(words(2))
+
+    representatives = near_duplicates(["a", "b", "c"], [page, mirror, other])
+
+    assert representatives == {"a": "a", "b": "a", "c": "c"}
+
+
+def test_short_pages_are_never_merged():
+    assert near_duplicates(["a", "b"], ["403 Forbidden", "403 Forbidden"]) == {"a": "a", "b": "b"}
@@ -0,0 +1,59 @@
+from math import comb
+
+import pytest
+
+from tools import evaluate, sandbox
+from tools.evaluate import SAMPLE_PROBLEMS, load_problems, pass_at_k, program, summarize
+
+HELPER_PROBLEM = {
+    "task_id": "Helper/0",
+    "entry_point": "make_palindrome",
+    "prompt": (
+        "def is_palindrome(s: str) -> bool:\n    return s == s[::-1]\n\n\n"
+        "def make_palindrome(s: str) -> str:\n    \"\"\" Shortest palindrome that begins with s. \"\"\"\n"
+    ),
+    "test": "def check(candidate):\n    assert candidate('ab') == 'aba'\n    assert candidate('') == ''\n",
+}
+
+
+def run(problem, completion):
+    return sandbox.run_tests(program(problem, completion), evaluate.test_code(problem),
+                             allow_unisolated=not sandbox.isolation())
+
+
+@pytest.mark.parametrize("n, c, k", [(10, 3, 1), (10, 3, 5), (5, 0, 2), (20, 19, 3)])
+def test_pass_at_k_matches_the_combinatorial_formula(n, c, k):
+    assert pass_at_k(n, c, k) == pytest.approx(1 - comb(n - c, k) / comb(n, k))
+
+
+def test_pass_at_k_is_one_when_every_draw_must_hit_a_pass():
+    assert pass_at_k(5, 4, 2) == 1.0
+
+
+def test_summarize_averages_only_problems_with_enough_samples():
+    results = {
+        "a": [{"status": "passed"}, {"status": "failed"}],
+        "b": [{"status": "failed"}],
+    }
+
+    summary = summarize(results, [1, 2])
+
+    assert summary["pass@1"] == pytest.approx((0.5 + 0.0) / 2)
+    assert summary["pass@2"] == pytest.approx(1.0)
+    assert summary["statuses"] == {"passed": 1, "failed": 2}
+
+
+def test_program_keeps_the_prompt_helpers_for_a_complete_function():
+    answer = (
+        "Sure:\n```python\ndef make_palindrome(s: str) -> str:\n"
+        "    for i in range(len(s)):\n        if is_palindrome(s[i:]):\n            return s + s[:i][::-1]\n"
+        "    return s\n```"
+    )
+
+    assert run(HELPER_PROBLEM, answer).passed
+
+
+def test_program_continues_the_prompt_for_a_body_only_completion():
+    problem = load_problems(SAMPLE_PROBLEMS)[0]
+
+    assert run(problem, "```python\n" + problem["canonical_solution"] + "```").passed
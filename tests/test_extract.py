@@ -0,0 +1,49 @@
+from tools.extract import PlainTextExtractor, TextExtractor, extractor_for
+
+PAGE = """<html><head><title>asyncio</title><style>p { color: red }</style></head><body>
+<nav><ul><li>Home</li><li>Docs</li></ul></nav>
+<div role="navigation">Skip to content</div>
+<main><h1>Timeouts</h1><p>Use <code>asyncio.wait_for</code> to bound a coroutine.<br>It raises TimeoutError.</p>
+<img src="x.png"><div><div>nested</div></div></main>
+<script>var nav = "<div>not text</div>";</script>
+<footer>Copyright</footer></body></html>"""
+
+
+def extract(chunks, max_chars=10000):
+    extractor = TextExtractor(max_chars)
+    for chunk in chunks:
+        extractor.feed(chunk)
+        if extractor.done:
+            break
+    extractor.close()
+    return extractor.text()
+
+
+def test_boilerplate_elements_are_skipped():
+    assert extract([PAGE]) == "asyncio Timeouts Use asyncio.wait_for to bound a coroutine. It raises TimeoutError. nested"
+
+
+def test_chunk_boundaries_do_not_change_the_text():
+    chunks = [PAGE[i:i + 7] for i in range(0, len(PAGE), 7)]
+
+    assert extract(chunks) == extract([PAGE])
+
+
+def test_nested_skipped_tags_close_at_their_own_end_tag():
+    html = "<aside><aside>inner</aside>still aside</aside><p>kept</p>"
+
+    assert extract([html]) == "kept"
+
+
+def test_extraction_stops_at_max_chars():
+    extractor = TextExtractor(max_chars=20)
+    extractor.feed("<p>" + "word " * 10 + "</p>")
+
+    assert extractor.done
+    assert extractor.text() == "word word word word "
+
+
+def test_extractor_for_picks_by_content_type():
+    assert isinstance(extractor_for("text/html"), TextExtractor)
+    assert isinstance(extractor_for("text/plain"), PlainTextExtractor)
+    assert extractor_for("application/pdf") is None
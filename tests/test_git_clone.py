@@ -0,0 +1,67 @@
+import os
+import subprocess
+
+import pytest
+
+git = pytest.importorskip("git")
+
+from tools.git_clone import CloneOptions, clone, fetch, mirror_path
+
+
+def run(*args, cwd):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout
+
+
+def commit(path, files, message):
+    for name, text in files.items():
+        os.makedirs(os.path.join(path, os.path.dirname(name)), exist_ok=True)
+        with open(os.path.join(path, name), "w") as f:
+            f.write(text)
+    run("add", "-A", cwd=path)
+    run("-c", "user.name=test", "-c", "user.email=test@example.com", "commit", "-q", "-m", message, cwd=path)
+
+
+def missing_objects(path):
+    listing = run("rev-list", "--objects", "--all", "--missing=print", cwd=path)
+    return {line[1:] for line in listing.splitlines() if line.startswith("?")}
+
+
+@pytest.fixture
+def upstream(tmp_path):
+    path = tmp_path / "upstream"
+    path.mkdir()
+    run("init", "-q", "-b", "main", cwd=path)
+    # Like GitHub, serve partial clones
+    run("config", "uploadpack.allowFilter", "true", cwd=path)
+    run("config", "uploadpack.allowAnySHA1InWant", "true", cwd=path)
+    commit(path, {"pkg/a.py": "a = 1\n", "pkg/notes.md": "notes\n", "docs/big.py": "big = 1\n"}, "init")
+    return "file://" + str(path)
+
+
+def test_sparse_clone_through_mirror_downloads_only_checked_out_blobs(upstream, tmp_path):
+    options = CloneOptions(sparse_paths=["pkg"], suffixes=[".py"], mirror_dir=str(tmp_path / "mirrors"))
+    repo = clone(upstream, str(tmp_path / "work"), options)
+
+    assert os.path.exists(os.path.join(repo.working_dir, "pkg", "a.py"))
+    assert not os.path.exists(os.path.join(repo.working_dir, "docs"))
+    mirror = mirror_path(upstream, options.mirror_dir)
+    assert len(missing_objects(mirror)) == 2
+
+
+def test_fetch_through_mirror_brings_new_files(upstream, tmp_path):
+    options = CloneOptions(sparse_paths=["pkg"], suffixes=[".py"], mirror_dir=str(tmp_path / "mirrors"))
+    repo = clone(upstream, str(tmp_path / "work"), options)
+    commit(upstream[len("file://"):], {"pkg/b.py": "b = 2\n", "docs/other.py": "other = 1\n"}, "second")
+
+    fetch(upstream, repo, options)
+
+    with open(os.path.join(repo.working_dir, "pkg", "b.py")) as f:
+        assert f.read() == "b = 2\n"
+    assert not os.path.exists(os.path.join(repo.working_dir, "docs"))
+
+
+def test_full_clone_without_options(upstream, tmp_path):
+    repo = clone(upstream, str(tmp_path / "work"), CloneOptions(depth=None, blob_filter=None))
+
+    assert sorted(os.listdir(os.path.join(repo.working_dir, "pkg"))) == ["a.py", "notes.md"]
+    assert not missing_objects(repo.working_dir)
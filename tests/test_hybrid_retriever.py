@@ -0,0 +1,75 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.documents import Document
+
+from tools.hybrid_retriever import CodeBM25, CrossEncoderReranker, HybridRetriever, code_terms, reciprocal_rank_fusion
+
+
+def chunk(source, text, start=1, **metadata):
+    return Document(page_content=text, metadata={"source": source, "start_line": start, "end_line": start, **metadata})
+
+
+CHUNKS = [
+    chunk("runnables/base.py", "class RunnableBinding(RunnableSerializable):\n    bound: Runnable", symbols="RunnableBinding"),
+    chunk("runnables/base.py", "def invoke(self, input, config=None):\n    return self.bound.invoke(input)", 40),
+    chunk("runnables/config.py", "def ensure_config(config=None):\n    return config or {}"),
+]
+
+
+class FakeVectorStore:
+    def __init__(self, ranking):
+        self.ranking = ranking
+
+    def similarity_search(self, query, k):
+        return self.ranking[:k]
+
+
+class FakeReranker(CrossEncoderReranker):
+    def rerank(self, query, documents, top_n):
+        return sorted(documents, key=lambda d: d.metadata["source"])[:top_n]
+
+
+@pytest.fixture
+def bm25(tmp_path):
+    index = CodeBM25(str(tmp_path / "bm25.sqlite"))
+    index.add(CHUNKS)
+    return index
+
+
+def test_code_terms_split_identifiers_and_drop_stopwords():
+    assert code_terms("How does RunnableBinding use ensure_config?") == [
+        "runnablebinding", "runnable", "binding", "use", "ensure_config", "ensure", "config",
+    ]
+
+
+def test_bm25_matches_identifier_parts(bm25):
+    assert [d.page_content for d, _ in bm25.search("RunnableBinding", k=1)] == [CHUNKS[0].page_content]
+    assert bm25.search("ensure config", k=1)[0][0].metadata["source"] == "runnables/config.py"
+    assert bm25.search("the of is") == []
+
+
+def test_bm25_postings_persist_and_follow_deletes(bm25, tmp_path):
+    bm25.delete_sources(["runnables/config.py"])
+
+    reopened = CodeBM25(str(tmp_path / "bm25.sqlite"))
+
+    assert len(reopened) == 2
+    assert reopened.search("ensure") == []
+
+
+def test_reciprocal_rank_fusion_rewards_documents_ranked_by_both():
+    a, b, c = CHUNKS
+
+    assert reciprocal_rank_fusion([[a, b], [c, b]]) == [b, a, c]
+
+
+def test_hybrid_retriever_fuses_lexical_and_vector_results(bm25):
+    vector = FakeVectorStore([CHUNKS[2], CHUNKS[0]])
+
+    plain = HybridRetriever(vectorstore=vector, bm25=bm25, k=2).invoke("RunnableBinding")
+    reranked = HybridRetriever(vectorstore=vector, bm25=bm25, k=1, reranker=FakeReranker()).invoke("RunnableBinding")
+
+    assert plain == [CHUNKS[0], CHUNKS[2]]
+    assert reranked == [CHUNKS[0]]
@@ -0,0 +1,176 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from tools import jobs
+from tools.jobs import Generations, JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_DIR", str(tmp_path / "jobs"))
+    return JobQueue(str(tmp_path / "jobs" / "jobs.sqlite"))
+
+
+def test_submitting_an_active_index_returns_its_job(queue):
+    first = queue.submit("repo", "fake:index", branch="main")
+
+    assert queue.submit("repo", "fake:index").id == first.id
+    assert queue.submit("other", "fake:index").id != first.id
+    assert queue.get(first.id).kwargs == {"branch": "main"}
+
+
+def test_cancelling_a_queued_job_finishes_it_and_a_running_one_only_flags_it(queue):
+    running = queue.submit("running", "fake:index")
+    assert queue.claim().id == running.id
+    queued = queue.submit("queued", "fake:index")
+
+    queue.cancel(queued.id)
+    queue.cancel(running.id)
+
+    assert queue.get(queued.id).status == "cancelled"
+    assert queue.get(running.id).status == "running" and queue.update(running.id)
+
+
+def test_jobs_of_a_dead_worker_are_requeued_and_resumed(queue, monkeypatch):
+    job = queue.submit("repo", "fake:index")
+    queue.claim()
+    queue.update(job.id, files_total=10, files_done=4, work_dir="/tmp/gen-1")
+    assert queue.claim() is None
+
+    monkeypatch.setattr(jobs.time, "time", lambda now=time.time(): now + jobs.STALE_SECONDS + 1)
+    resumed = queue.claim()
+
+    assert resumed.id == job.id and resumed.status == "running"
+    assert (resumed.files_done, resumed.work_dir) == (4, "/tmp/gen-1")
+
+
+def test_describe_reports_progress_and_eta(queue):
+    job = queue.submit("repo", "fake:index")
+    queue.claim()
+    queue.update(job.id, files_total=10, files_done=4, chunks=40, eta_seconds=12.4)
+
+    assert queue.get(job.id).describe() == "running: 4/10 files, 40 chunks, ETA 12s"
+
+
+def publish(generations, marker):
+    work_dir = generations.prepare()
+    with open(os.path.join(work_dir, "marker"), "w") as f:
+        f.write(marker)
+    generations.publish(work_dir)
+    return work_dir
+
+
+def test_prepare_copies_the_current_generation(tmp_path):
+    generations = Generations(str(tmp_path))
+    first = publish(generations, "first")
+
+    work_dir = generations.prepare()
+
+    assert work_dir != first
+    with open(os.path.join(work_dir, "marker")) as f:
+        assert f.read() == "first"
+
+
+def test_generations_open_in_a_live_process_are_kept(tmp_path):
+    generations = Generations(str(tmp_path))
+    first = publish(generations, "first")
+    assert generations.open() == first
+    second = publish(generations, "second")
+    third = publish(generations, "third")
+
+    # Leased by this process, which is still running
+    assert os.path.isdir(first)
+    assert not os.path.exists(second)
+    assert generations.current() == third
+
+
+def test_generations_of_exited_readers_are_removed(tmp_path):
+    generations = Generations(str(tmp_path))
+    first = publish(generations, "first")
+    reader = subprocess.run(
+        [sys.executable, "-c", f"from tools.jobs import Generations; print(Generations({str(tmp_path)!r}).open())"],
+        capture_output=True, text=True, check=True,
+    )
+    assert reader.stdout.strip() == first
+
+    publish(generations, "second")
+
+    assert not os.path.exists(first)
+    assert os.listdir(generations.readers) == []
+
+
+def fake_factory(refresh):
+    class FakeIndex:
+        def __init__(self, index_dir):
+            self.index_dir = index_dir
+
+        def refresh(self, progress):
+            return refresh(self.index_dir, progress)
+
+    return FakeIndex
+
+
+def stats(**fields):
+    return SimpleNamespace(**{
+        "commit": "0" * 40, "full": True, "added": ["a.py"], "modified": [], "deleted": [], "chunks": 1,
+        "seconds": 0.0, "throughput": {}, **fields,
+    })
+
+
+def test_a_finished_job_publishes_its_generation(queue, monkeypatch):
+    def refresh(index_dir, progress):
+        with open(os.path.join(index_dir, "marker"), "w") as f:
+            f.write("built")
+        return stats()
+
+    monkeypatch.setattr(jobs, "load_factory", lambda path: fake_factory(refresh))
+    job = queue.submit("repo", "fake:index")
+
+    jobs.worker(queue, once=True)
+
+    assert queue.get(job.id).status == "done"
+    with open(os.path.join(jobs.current_index_dir("repo"), "marker")) as f:
+        assert f.read() == "built"
+
+
+def test_a_failed_job_keeps_the_published_generation(queue, monkeypatch):
+    def refresh(index_dir, progress):
+        raise RuntimeError("clone failed")
+
+    monkeypatch.setattr(jobs, "load_factory", lambda path: fake_factory(refresh))
+    job = queue.submit("repo", "fake:index")
+
+    jobs.worker(queue, once=True)
+
+    failed = queue.get(job.id)
+    assert failed.status == "failed" and "clone failed" in failed.error
+    assert not os.path.exists(failed.work_dir) and jobs.current_index_dir("repo") is None
+
+
+def test_a_cancel_during_a_step_without_progress_is_seen_by_the_heartbeat(queue, monkeypatch):
+    # Like a clone or fetch: a long step that reports no progress before it returns
+    cloning = threading.Event()
+
+    def refresh(index_dir, progress):
+        cloning.set()
+        time.sleep(0.5)
+        return stats()
+
+    monkeypatch.setattr(jobs, "HEARTBEAT_SECONDS", 0.05)
+    monkeypatch.setattr(jobs, "load_factory", lambda path: fake_factory(refresh))
+    job = queue.submit("repo", "fake:index")
+    worker = threading.Thread(target=jobs.worker, args=(queue, True))
+    worker.start()
+    assert cloning.wait(5)
+
+    queue.cancel(job.id)
+    worker.join(5)
+
+    assert queue.get(job.id).status == "cancelled"
+    assert jobs.current_index_dir("repo") is None
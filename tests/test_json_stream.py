@@ -0,0 +1,36 @@
+from tools.json_stream import StringArrayStreamParser, iter_string_array, parse_string_array
+
+
+def test_each_string_is_emitted_when_its_closing_quote_arrives():
+    parser = StringArrayStreamParser()
+
+    fed = [parser.feed(chunk) for chunk in ['Sure: ["binary se', 'arch python", "bis', 'ect module"', ']']]
+
+    assert fed == [[], ["binary search python"], ["bisect module"], []]
+    assert parser.close() == []
+
+
+def test_escaped_quotes_do_not_end_a_string():
+    assert parse_string_array(r'["say \"hi\" in C", "tab\there"]') == ['say "hi" in C', "tab\there"]
+
+
+def test_duplicates_and_blank_strings_are_skipped():
+    assert parse_string_array('["a", " ", "a", "b"]') == ["a", "b"]
+
+
+def test_a_string_cut_off_by_the_token_limit_is_kept():
+    assert list(iter_string_array(['["first query", "second qu'])) == ["first query", "second qu"]
+
+
+def test_quoted_strings_outside_an_array_are_recovered():
+    assert parse_string_array('Queries: "asyncio timeout", "asyncio wait_for"') == ["asyncio timeout", "asyncio wait_for"]
+
+
+def test_a_bulleted_list_is_recovered():
+    text = "Here are the queries:\n1. pandas merge on index\n- pandas join\n* concat vs merge\n"
+
+    assert parse_string_array(text) == ["pandas merge on index", "pandas join", "concat vs merge"]
+
+
+def test_nothing_usable_gives_an_empty_list():
+    assert parse_string_array("I can't help with that.") == []
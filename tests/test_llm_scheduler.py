@@ -0,0 +1,184 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("langchain_core")
+pytest.importorskip("tiktoken")
+
+from langchain_core.messages import AIMessageChunk
+
+from tools.deadline import Deadline, DeadlineExceeded
+from tools.llm_scheduler import BACKGROUND, DEFAULT, INTERACTIVE, LLMScheduler
+
+
+class FakeResponse:
+    def __init__(self, headers):
+        self.status_code = 429
+        self.headers = headers
+
+
+class RateLimitError(Exception):
+    """Shaped like the Groq SDK's error: a status code and the response with its retry-after header."""
+
+    def __init__(self, retry_after):
+        super().__init__("Error code: 429 - rate limit reached")
+        self.status_code = 429
+        self.response = FakeResponse({"retry-after": str(retry_after)})
+
+
+def hold_slot(scheduler):
+    # Occupies the only concurrency slot until the returned event is set
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocker():
+        started.set()
+        release.wait(5)
+        return "blocker"
+
+    thread = threading.Thread(target=scheduler.call, args=(blocker,))
+    thread.start()
+    started.wait(5)
+    return release, thread
+
+
+def wait_for(condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.01)
+
+
+def test_waiting_calls_run_in_priority_order():
+    scheduler = LLMScheduler(rpm=10000, tpm=10 ** 9, max_concurrency=1)
+    release, blocker = hold_slot(scheduler)
+    order = []
+    threads = []
+    for name, priority in [("background", BACKGROUND), ("default", DEFAULT), ("interactive", INTERACTIVE)]:
+        thread = threading.Thread(target=scheduler.call, args=(lambda name=name: order.append(name), priority))
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda count=len(threads): scheduler.stats()["waiting"] == count)
+    release.set()
+    for thread in [blocker, *threads]:
+        thread.join(5)
+
+    assert order == ["interactive", "default", "background"]
+
+
+def test_rate_limit_pauses_and_retries_after_the_advertised_delay():
+    scheduler = LLMScheduler(rpm=10000, tpm=10 ** 9, base_delay=0.01)
+    attempts = []
+
+    def flaky():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise RateLimitError(retry_after=0.3)
+        return "ok"
+
+    assert scheduler.call(flaky) == "ok"
+    assert len(attempts) == 2
+    assert attempts[1] - attempts[0] >= 0.3
+    stats = scheduler.stats()
+    assert stats["rate_limited"] == 1 and stats["retries"] == 1 and stats["calls"] == 1
+
+
+def test_rate_limit_gives_up_after_max_retries():
+    scheduler = LLMScheduler(rpm=10000, tpm=10 ** 9, max_retries=2, base_delay=0.01)
+    calls = []
+
+    def always_limited():
+        calls.append(1)
+        raise RateLimitError(retry_after=0.01)
+
+    with pytest.raises(RateLimitError):
+        scheduler.call(always_limited)
+    assert len(calls) == 3
+
+
+def test_identical_calls_in_flight_are_coalesced():
+    scheduler = LLMScheduler(rpm=10000, tpm=10 ** 9)
+    calls = []
+    results = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return "answer"
+
+    threads = [threading.Thread(target=lambda: results.append(scheduler.run("key", slow))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["answer"] * 3
+    assert len(calls) == 1
+    assert scheduler.stats()["coalesced"] == 2
+
+
+def test_followers_retry_when_the_leader_runs_out_of_time():
+    scheduler = LLMScheduler(rpm=10000, tpm=10 ** 9, max_concurrency=1)
+    release, blocker = hold_slot(scheduler)
+    outcomes = {}
+
+    def leader():
+        try:
+            scheduler.run("key", lambda: "answer", deadline=Deadline(0.2))
+        except DeadlineExceeded as e:
+            outcomes["leader"] = e
+
+    def follower():
+        outcomes["follower"] = scheduler.run("key", lambda: "answer", deadline=Deadline(5))
+
+    leader_thread = threading.Thread(target=leader)
+    leader_thread.start()
+    wait_for(lambda: scheduler.stats()["waiting"] == 1)
+    follower_thread = threading.Thread(target=follower)
+    follower_thread.start()
+    wait_for(lambda: scheduler.stats()["coalesced"] == 1)
+    leader_thread.join(5)
+    release.set()
+    for thread in (blocker, follower_thread):
+        thread.join(5)
+
+    assert isinstance(outcomes["leader"], DeadlineExceeded)
+    assert outcomes["follower"] == "answer"
+
+
+def test_follower_stops_at_its_own_deadline():
+    scheduler = LLMScheduler(rpm=10000, tpm=10 ** 9)
+    started = threading.Event()
+    finish = threading.Event()
+
+    def slow():
+        started.set()
+        finish.wait(5)
+        return "answer"
+
+    leader = threading.Thread(target=scheduler.run, args=("key", slow))
+    leader.start()
+    started.wait(5)
+    deadline = Deadline(5)
+    threading.Timer(0.1, deadline.cancel).start()
+    with pytest.raises(DeadlineExceeded):
+        scheduler.run("key", slow, deadline=deadline)
+    finish.set()
+    leader.join(5)
+
+
+def test_stream_corrects_token_bucket_from_reported_usage():
+    scheduler = LLMScheduler(rpm=10000, tpm=60000)
+
+    def chunks():
+        yield AIMessageChunk(content="Hello")
+        yield AIMessageChunk(
+            content=" world", usage_metadata={"input_tokens": 40, "output_tokens": 10, "total_tokens": 50}
+        )
+
+    streamed = "".join(chunk.content for chunk in scheduler.stream(chunks, tokens=2000))
+
+    assert streamed == "Hello world"
+    # 2000 were reserved up front, only the 50 actually used stay charged
+    assert scheduler.tokens.capacity - scheduler.tokens.level == pytest.approx(50, abs=5)
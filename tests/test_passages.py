@@ -0,0 +1,57 @@
+import pytest
+
+pytest.importorskip("tiktoken")
+
+from tools import passages
+from tools.passages import TokenSavings, bm25_scores, select_passages, split_passages
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # Four characters per token, so budgets don't depend on the downloaded BPE file
+    monkeypatch.setattr(passages, "encoding", lambda: None)
+
+
+def test_long_unpunctuated_text_is_cut_at_max_words():
+    text = " ".join(f"w{i}" for i in range(25)) + ". Short one."
+
+    assert [len(p.split()) for p in split_passages(text, max_words=10)] == [10, 10, 7]
+
+
+def test_bm25_prefers_the_passage_with_the_rare_query_term():
+    scores = bm25_scores("how to cancel a task", ["create a task", "cancel the task", "the weather today"])
+
+    assert scores[1] > scores[0] > scores[2] == 0.0
+
+
+def test_short_pages_are_kept_whole():
+    selection = select_passages("A short page.", "anything", token_budget=100)
+
+    assert selection.text == "A short page." and selection.tokens_saved == 0
+
+
+def test_matching_passages_are_kept_in_page_order_within_the_budget():
+    filler = [f"Filler sentence number {i} about gardening and soil." for i in range(40)]
+    text = " ".join(filler[:10] + ["Use asyncio.wait_for to add a timeout."] + filler[10:30]
+                    + ["A timeout raises asyncio.TimeoutError."] + filler[30:])
+
+    selection = select_passages(text, "asyncio timeout", token_budget=300)
+
+    assert selection.tokens_out <= 300 < selection.tokens_in
+    assert selection.text.index("wait_for") < selection.text.index("TimeoutError")
+
+
+def test_without_matches_the_start_of_the_page_is_kept():
+    text = " ".join(f"Sentence {i} is about nothing in particular." for i in range(60))
+
+    selection = select_passages(text, "kubernetes", token_budget=300)
+
+    assert selection.text and text.startswith(selection.text.replace("\n\n", " "))
+
+
+def test_savings_add_up_across_pages():
+    savings = TokenSavings()
+    for text in ["x " * 1000, "short"]:
+        savings.add(select_passages(text, "x", token_budget=50))
+
+    assert savings.pages == 2 and savings.tokens_saved == savings.tokens_in - savings.tokens_out > 0
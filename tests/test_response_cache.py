@@ -0,0 +1,100 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+
+from tools.response_cache import ResponseCache, normalize_prompt
+
+PROMPT = ChatPromptTemplate.from_messages([("system", "Fix the error in {language}."), ("user", "{error}")])
+
+
+class FakeLLM:
+    model_name = "fake"
+    temperature = 0
+
+
+@pytest.fixture
+def embedded():
+    return []
+
+
+def cached_chain(tmp_path, calls, embedded=None, **kwargs):
+    # Texts embed to one of two directions, by whether they mention "KeyError"
+    def embed(text):
+        embedded.append(text)
+        return [1.0, 0.0] if "KeyError" in text else [0.0, 1.0]
+
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), embed=embed if embedded is not None else None, **kwargs)
+
+    def answer(inputs):
+        calls.append(inputs["error"])
+        return f"fix for {inputs['error']}"
+
+    return cache, cache.wrap(RunnableLambda(answer), "fix_chain", PROMPT, FakeLLM(), exact_fields=["language"])
+
+
+def test_normalize_prompt_ignores_addresses_and_whitespace():
+    assert normalize_prompt("<object at 0x7f3a2c>\n\n  failed") == normalize_prompt("<object at 0x10ab>  failed")
+
+
+def test_exact_hit_skips_the_chain_and_the_embedding(tmp_path, embedded):
+    calls = []
+    cache, chain = cached_chain(tmp_path, calls, embedded)
+    inputs = {"language": "python", "error": "KeyError: 'a'"}
+
+    assert chain.invoke(inputs) == chain.invoke(inputs) == "fix for KeyError: 'a'"
+
+    assert calls == ["KeyError: 'a'"]
+    # Embedded once, for the miss; the exact hit never reaches the embedding model
+    assert embedded == ["KeyError: 'a'"]
+    assert cache.stats() == {"exact_hits": 1, "semantic_hits": 0, "misses": 1, "hit_rate": 0.5, "entries": 1}
+
+
+def test_similar_inputs_hit_only_within_the_same_exact_fields(tmp_path, embedded):
+    calls = []
+    cache, chain = cached_chain(tmp_path, calls, embedded)
+    chain.invoke({"language": "python", "error": "KeyError: 'a'"})
+
+    assert chain.invoke({"language": "python", "error": "KeyError: 'b'"}) == "fix for KeyError: 'a'"
+    assert chain.invoke({"language": "rust", "error": "KeyError: 'b'"}) == "fix for KeyError: 'b'"
+    assert chain.invoke({"language": "python", "error": "IndexError"}) == "fix for IndexError"
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_streamed_answers_are_cached_once_complete(tmp_path):
+    calls = []
+    _, chain = cached_chain(tmp_path, calls)
+    inputs = {"language": "python", "error": "ZeroDivisionError"}
+
+    abandoned = chain.stream(inputs)
+    next(abandoned)
+    abandoned.close()
+    streamed = "".join(chain.stream(inputs))
+
+    assert streamed == chain.invoke(inputs) == "fix for ZeroDivisionError"
+    assert len(calls) == 2
+
+
+def test_a_changed_prompt_drops_the_old_entries(tmp_path):
+    calls = []
+    cache, chain = cached_chain(tmp_path, calls)
+    chain.invoke({"language": "python", "error": "KeyError"})
+
+    changed = ChatPromptTemplate.from_messages([("system", "Explain the error in {language}."), ("user", "{error}")])
+    cache.wrap(RunnableLambda(lambda x: "explained"), "fix_chain", changed, FakeLLM(), exact_fields=["language"])
+
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    calls = []
+    cache, chain = cached_chain(tmp_path, calls, max_entries=2)
+    for error in ["A", "B", "A", "C"]:
+        chain.invoke({"language": "python", "error": error})
+
+    chain.invoke({"language": "python", "error": "A"})
+
+    assert calls == ["A", "B", "C"]
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,32 @@
+import pytest
+
+from tools.router import AGENT_ROLE_PROMPTS, CODE_SEARCH_AGENT, DOCUMENTATION_SEARCH_AGENT, Route, route_task
+
+
+@pytest.mark.parametrize("task, agent", [
+    ("How to implement a binary search in Python?", CODE_SEARCH_AGENT),
+    ("Fix this TypeError traceback in my script", CODE_SEARCH_AGENT),
+    ("Python requests library documentation", DOCUMENTATION_SEARCH_AGENT),
+    ("pandas read_csv parameters reference", DOCUMENTATION_SEARCH_AGENT),
+])
+def test_tasks_are_routed_by_keywords(task, agent):
+    route = route_task(task)
+
+    assert route.agent == agent and route.confidence > 0.3
+    assert route.agent_role_prompt == AGENT_ROLE_PROMPTS[agent]
+
+
+def test_matching_is_case_insensitive_and_on_whole_words():
+    assert route_task("API DOCS").agent == DOCUMENTATION_SEARCH_AGENT
+    # "codes" and "apis" are not the keywords "code" and "api"
+    assert route_task("zip codes of apis").confidence == 0.0
+
+
+def test_no_match_or_a_tie_has_zero_confidence_and_defaults_to_code_search():
+    # "code" and "api" both weigh 1.5
+    assert route_task("kubernetes") == route_task("code api") == Route(CODE_SEARCH_AGENT, 0.0)
+
+
+def test_confidence_is_the_winning_margin():
+    # Code: "example" 1.5; documentation: "library" 0.5
+    assert route_task("example using the library").confidence == pytest.approx((1.5 - 0.5) / (1.5 + 0.5))
@@ -0,0 +1,117 @@
+import os
+import sys
+
+import pytest
+
+from tools import sandbox
+from tools.sandbox import SandboxUnavailable, extract_code, run_tests
+
+requires_isolation = pytest.mark.skipif(not sandbox.isolation(), reason="no unprivileged namespaces on this host")
+
+
+@pytest.fixture
+def secrets(tmp_path, monkeypatch):
+    # A home directory and a repository with the files generated code must not reach
+    home = tmp_path / "home"
+    (home / ".ssh").mkdir(parents=True)
+    (home / ".ssh" / "id_ed25519").write_text("private key\n")
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / ".env").write_text("GROQ_API_KEY=secret\n")
+    monkeypatch.setenv("HOME", str(home))
+    monkeypatch.setattr(sandbox, "REPO_DIR", str(repo))
+    sandbox.isolation.cache_clear()
+    yield home, repo
+    sandbox.isolation.cache_clear()
+
+
+def outcome(code):
+    result = run_tests(code, "")
+    assert result.passed, result.error()
+    return result.stdout.strip()
+
+
+PROBE = """
+def probe(path, mode="r"):
+    try:
+        open(path, mode).close()
+    except OSError as e:
+        return type(e).__name__
+    return "ok"
+"""
+
+
+@requires_isolation
+def test_child_cannot_read_home_or_repo_env(secrets):
+    home, repo = secrets
+
+    printed = outcome(PROBE + f"print(probe({str(home / '.ssh' / 'id_ed25519')!r}), probe({str(repo / '.env')!r}))")
+
+    assert printed == "FileNotFoundError FileNotFoundError"
+
+
+@requires_isolation
+def test_child_cannot_write_outside_its_directory(secrets, tmp_path):
+    home, _ = secrets
+    outside = [tmp_path / "outside.txt", home / "planted.txt", os.path.join(sys.prefix, "planted.txt")]
+
+    printed = outcome(PROBE + f"print(probe('own.txt', 'w'), *[probe(p, 'w') for p in {[str(p) for p in outside]!r}])")
+
+    assert printed.split() == ["ok", "OSError", "OSError", "OSError"]
+    assert not any(os.path.exists(path) for path in outside)
+
+
+@requires_isolation
+def test_home_is_hidden_even_when_it_holds_the_interpreter(secrets, monkeypatch):
+    # Like pyenv, conda or ~/.venv: the interpreter's prefix is inside the hidden home
+    home, _ = secrets
+    (home / ".venv" / "lib").mkdir(parents=True)
+    (home / ".venv" / "lib" / "site.py").write_text("")
+    needed = sandbox.needed_paths()
+    monkeypatch.setattr(sandbox, "needed_paths", lambda: needed + [str(home / ".venv")])
+
+    printed = outcome(
+        PROBE + f"import os\nprint(sorted(os.listdir({str(home)!r})), probe({str(home / '.venv' / 'lib' / 'site.py')!r}), "
+        f"probe({str(home / '.venv' / 'planted.py')!r}, 'w'))"
+    )
+
+    assert printed == "['.venv'] ok OSError"
+
+
+@requires_isolation
+def test_child_has_no_network():
+    printed = outcome(
+        "import _socket\n"
+        "s = _socket.socket(_socket.AF_INET, _socket.SOCK_STREAM)\n"
+        "try:\n"
+        "    s.connect(('1.1.1.1', 53))\n"
+        "except OSError:\n"
+        "    print('blocked')\n"
+    )
+
+    assert printed == "blocked"
+
+
+def test_refuses_to_run_without_isolation(monkeypatch):
+    monkeypatch.setattr(sandbox, "isolation", lambda: [])
+
+    with pytest.raises(SandboxUnavailable):
+        run_tests("x = 1", "assert x == 1")
+    assert run_tests("x = 1", "assert x == 1", allow_unisolated=True).passed
+
+
+def test_failures_and_timeouts_are_reported():
+    allow = not sandbox.isolation()
+
+    failed = run_tests("def f():\n    return 1\n", "assert f() == 2", allow_unisolated=allow)
+    timeout = run_tests("while True:\n    pass\n", "", timeout=1, allow_unisolated=allow)
+
+    assert failed.status == "failed" and "AssertionError" in failed.error()
+    assert timeout.status == "timeout"
+
+
+def test_extract_code_prefers_the_block_defining_the_entry_point():
+    answer = "```python\nprint(add(1, 2))\n```\nand\n```python\ndef add(a, b):\n    return a + b\n```"
+
+    assert extract_code(answer, "add") == "def add(a, b):\n    return a + b\n"
+    assert extract_code("no code") == "no code"
@@ -0,0 +1,85 @@
+import ast
+import subprocess
+
+import pytest
+
+pytest.importorskip("git")
+
+from tools.symbol_index import SymbolIndex, extract_symbols
+
+SOURCE = '''\
+class BaseRetriever:
+    def invoke(self, query):
+        return []
+
+
+class VectorRetriever(BaseRetriever):
+    def invoke(self, query):
+        return ["vector"]
+
+
+class HybridRetriever(VectorRetriever):
+    pass
+
+
+def load_index(path):
+    return path
+'''
+
+
+def git(*args, cwd):
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd, check=True, capture_output=True, text=True,
+    ).stdout.strip()
+
+
+@pytest.fixture
+def index(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    git("init", "-q", cwd=repo)
+    (repo / "retrievers.py").write_text(SOURCE)
+    git("add", "-A", cwd=repo)
+    git("commit", "-q", "-m", "init", cwd=repo)
+    index = SymbolIndex(str(tmp_path / "symbols.sqlite"), str(repo))
+    index.add(extract_symbols(ast.parse(SOURCE), "retrievers.py"))
+    index.load()
+    index.commit = git("rev-parse", "HEAD", cwd=repo)
+    return index
+
+
+def test_identifiers_skip_prose_and_trailing_dots(index):
+    question = "Load the index with load_index. Which classes use VectorRetriever.invoke?"
+
+    assert index.identifiers(question) == ["load_index", "VectorRetriever.invoke"]
+
+
+def test_subclasses_include_indirect_ones(index):
+    assert [s.qualname for s in index.subclasses("BaseRetriever")] == ["VectorRetriever", "HybridRetriever"]
+
+
+def test_source_is_read_at_the_indexed_commit(index):
+    repo = index.repo_path
+    with open(f"{repo}/retrievers.py", "w") as f:
+        f.write("# rewritten\n" * 20)
+    git("commit", "-q", "-am", "rewrite", cwd=repo)
+
+    (symbol,) = index.lookup("load_index")
+
+    assert index.source(symbol) == "def load_index(path):\n    return path"
+
+
+def test_repeated_lookups_reuse_the_file_text(index):
+    documents = [index.resolve("What does load_index do?") for _ in range(3)]
+
+    assert all(d[0].page_content.startswith("def load_index") for d in documents)
+    info = index._file_at.cache_info()
+    assert info.misses == 1 and info.hits == 2
+
+
+def test_source_is_none_when_the_commit_is_gone(index):
+    index.commit = "0" * 40
+    (symbol,) = index.lookup("load_index")
+
+    assert index.source(symbol) is None
@@ -0,0 +1,25 @@
+import socket
+from urllib.request import urlopen
+
+from tools import tracing
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_metrics_endpoint_listens_on_loopback_by_default(monkeypatch):
+    monkeypatch.setattr(tracing, "TRACING", True)
+    monkeypatch.setattr(tracing, "_server", None)
+    port = free_port()
+
+    tracing.start_metrics_server(port)
+    try:
+        assert tracing._server.server_address == ("127.0.0.1", port)
+        with urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            assert response.status == 200
+    finally:
+        tracing._server.shutdown()
+        tracing._server.server_close()
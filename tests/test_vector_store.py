@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.embeddings import Embeddings
+
+from tools.vector_store import QuantizedVectorStore, quantize
+
+DIM = 32
+
+
+class TableEmbeddings(Embeddings):
+    """Text "doc <i>" embeds to row i of a fixed matrix."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors[int(text.split()[1])].tolist()
+
+
+def clustered(count, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, DIM))
+    vectors = centers[rng.integers(clusters, size=count)] + 0.3 * rng.normal(size=(count, DIM))
+    return vectors.astype(np.float32)
+
+
+def store_with(tmp_path, vectors, **kwargs):
+    store = QuantizedVectorStore(str(tmp_path / "store"), TableEmbeddings(vectors), **kwargs)
+    texts = [f"doc {i}" for i in range(len(vectors))]
+    for start in range(0, len(texts), 500):
+        batch = texts[start:start + 500]
+        store.add_texts(batch, [{"source": f"file{i % 7}.py"} for i in range(start, start + len(batch))],
+                        ids=[f"id{i}" for i in range(start, start + len(batch))])
+    return store
+
+
+def test_int8_quantization_keeps_cosine_similarity():
+    vectors = clustered(200)
+    codes, scales = quantize(vectors)
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    restored = codes.astype(np.float32) * scales[:, None]
+
+    assert np.abs((restored * unit).sum(axis=1) - 1).max() < 5e-3
+
+
+def test_exact_search_finds_the_query_document(tmp_path):
+    store = store_with(tmp_path, clustered(300))
+
+    (document, score), = store.similarity_search_with_score("doc 123", k=1)
+
+    assert document.page_content == "doc 123" and score == pytest.approx(1.0, abs=1e-3)
+    assert store.stats()["lists"] == 0
+
+
+def test_ivf_search_matches_exact_search_when_probing_every_list(tmp_path):
+    store = store_with(tmp_path, clustered(3000), train_threshold=1000)
+    lists = store.stats()["lists"]
+
+    report = {row["nprobe"]: row["recall@10"] for row in store.recall_report(nprobes=(8, lists), queries=50)}
+
+    assert lists > 1
+    assert report[lists] == 1.0
+    assert report[8] > 0.8
+
+
+def test_rows_added_after_training_are_assigned_to_lists(tmp_path):
+    vectors = clustered(1500)
+    store = store_with(tmp_path, vectors[:1200], train_threshold=1000)
+    store.embedding = TableEmbeddings(vectors)
+    store.add_texts([f"doc {i}" for i in range(1200, 1500)])
+
+    assert store.similarity_search("doc 1400", k=1)[0].page_content == "doc 1400"
+    assert (np.asarray(store._open()["lists.i32"]) >= 0).all()
+
+
+def test_compact_renumbers_rows_and_keeps_search_and_get_consistent(tmp_path):
+    vectors = clustered(1200)
+    store = store_with(tmp_path, vectors, compact_ratio=1.0)
+    deleted = [f"id{i}" for i in range(0, 1200, 2)]
+    store.delete(deleted)
+    assert store.similarity_search("doc 10", k=1)[0].page_content != "doc 10"
+
+    store.compact()
+
+    assert store.stats()["vectors"] == store.stats()["alive"] == 600
+    reopened = QuantizedVectorStore(str(tmp_path / "store"), TableEmbeddings(vectors))
+    for i in (1, 601, 1199):
+        assert reopened.similarity_search(f"doc {i}", k=1)[0].page_content == f"doc {i}"
+    assert reopened.get(where={"source": "file1.py"}, include=[])["ids"][:2] == ["id1", "id15"]
+
+
+def test_deleting_enough_rows_compacts_automatically(tmp_path):
+    store = store_with(tmp_path, clustered(1200), compact_ratio=0.3)
+
+    store.delete([f"id{i}" for i in range(500)])
+
+    assert store.stats()["vectors"] == 700
+    assert store.similarity_search("doc 900", k=1)[0].page_content == "doc 900"
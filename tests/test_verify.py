@@ -0,0 +1,89 @@
+import pytest
+
+from tools import sandbox
+from tools.verify import generate_verified
+
+CORRECT = "```python\ndef add(a, b):\n    return a + b\n```"
+WRONG = "```python\ndef add(a, b):\n    return a - b\n```"
+TESTS = "```python\nassert add(2, 3) == 5\n```"
+
+
+@pytest.fixture
+def pool():
+    pool = sandbox.Sandbox(workers=2, allow_unisolated=not sandbox.isolation())
+    yield pool
+    pool.close(cancel=True)
+
+
+def test_passing_candidate_is_verified(pool):
+    written = []
+
+    def write_tests(query, entry_point):
+        written.append((query, entry_point))
+        return TESTS
+
+    verification = generate_verified("add two numbers", lambda query: CORRECT, write_tests=write_tests,
+                                     candidates=2, sandbox=pool, entry_point="add")
+
+    assert verification.passed and verification.answer == CORRECT
+    # Tests are written from the request, never from a candidate's code
+    assert written == [("add two numbers", "add")]
+    assert verification.describe().startswith("Verified by 1 test assertion")
+
+
+def test_failed_candidates_get_one_repair_round(pool):
+    repairs = []
+
+    def repair(query, code, error):
+        repairs.append(error)
+        return CORRECT
+
+    verification = generate_verified("add two numbers", lambda query: WRONG, tests="assert add(2, 3) == 5",
+                                     repair=repair, candidates=2, sandbox=pool)
+
+    assert verification.passed
+    assert repairs and all("AssertionError" in error for error in repairs)
+    assert any(candidate.repair for candidate in verification.candidates)
+
+
+def test_empty_generated_tests_leave_the_answer_untested(pool):
+    verification = generate_verified("add two numbers", lambda query: CORRECT,
+                                     write_tests=lambda query, entry_point: "```python\n```", candidates=1, sandbox=pool)
+
+    assert verification.status == "untested" and not verification.passed
+    assert verification.answer == CORRECT
+    assert "no usable tests" in verification.describe()
+
+
+def test_failing_test_writer_is_the_reason_for_untested(pool):
+    def write_tests(query, entry_point):
+        raise RuntimeError("tests model down")
+
+    verification = generate_verified("add two numbers", lambda query: CORRECT, write_tests=write_tests,
+                                     candidates=1, sandbox=pool)
+
+    assert verification.status == "untested"
+    assert "tests model down" in verification.tests_error
+    assert "tests model down" in verification.describe()
+
+
+def test_generation_errors_are_reported_when_every_generation_fails(pool):
+    def generate(query):
+        raise PermissionError("Error code: 401 - invalid API key")
+
+    verification = generate_verified("add two numbers", generate, tests="assert add(2, 3) == 5",
+                                     candidates=3, sandbox=pool)
+
+    assert verification.answer is None and not verification.passed
+    assert [candidate.status for candidate in verification.candidates] == ["error"] * 3
+    assert "invalid API key" in verification.error
+    assert "invalid API key" in verification.describe()
+    assert "compiles" not in verification.describe()
+
+
+def test_unverified_answer_without_code_is_not_called_compiling(pool):
+    verification = generate_verified("explain recursion", lambda query: "Recursion is ...", tests="assert True",
+                                     candidates=1, sandbox=pool)
+
+    assert verification.answer == "Recursion is ..." and verification.status == "unverified"
+    assert "no runnable code" in verification.describe()
@@ -0,0 +1,577 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(ROOT_DIR, "benchmarks", "fixtures")
+BASELINES_DIR = os.path.join(ROOT_DIR, "benchmarks", "baselines")
+PIPELINES = ("code_gen", "error_handling", "search", "repo_qa")
+# Compared against a baseline: latency and memory must not grow, throughput must not shrink
+HIGHER_IS_WORSE = ("p50_ms", "p95_ms", "p99_ms", "peak_rss_mib")
+LOWER_IS_WORSE = ("throughput_rps",)
+
+
+@dataclass
+class LatencyModel:
+    """Lognormal delay given by its median and 95th percentile in seconds; zero disables it."""
+
+    p50: float = 0.0
+    p95: float = 0.0
+
+    @classmethod
+    def parse(cls, text: str) -> "LatencyModel":
+        p50, _, p95 = text.partition(",")
+        return cls(float(p50), float(p95 or p50))
+
+    def sample(self, rng: random.Random) -> float:
+        if self.p50 <= 0:
+            return 0.0
+        sigma = math.log(max(self.p95, self.p50) / self.p50) / 1.645
+        return rng.lognormvariate(math.log(self.p50), sigma)
+
+
+@dataclass
+class Simulation:
+    llm_first_token: LatencyModel = field(default_factory=lambda: LatencyModel(0.25, 0.8))
+    llm_tokens_per_second: float = 800.0
+    search: LatencyModel = field(default_factory=lambda: LatencyModel(0.4, 1.2))
+    page: LatencyModel = field(default_factory=lambda: LatencyModel(0.15, 0.6))
+    embed: LatencyModel = field(default_factory=LatencyModel)
+    seed: int = 0
+
+    def __post_init__(self):
+        self.rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    def sleep(self, model: LatencyModel):
+        with self._lock:
+            delay = model.sample(self.rng)
+        if delay:
+            time.sleep(delay)
+
+
+class Fixtures:
+    """Recorded LLM completions, search results, pages and requests, see benchmarks/fixtures/bench.json."""
+
+    def __init__(self, directory: str = FIXTURES_DIR):
+        self.directory = directory
+        self.path = os.path.join(directory, "bench.json")
+        with open(self.path) as f:
+            self.data = json.load(f)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def prompt_key(prompt: str) -> str:
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    def completion(self, prompt: str) -> str:
+        # Exact recordings first, then the first rule whose substrings all occur in the prompt
+        recorded = self.data["prompts"].get(self.prompt_key(prompt))
+        if recorded is not None:
+            return recorded
+        for rule in self.data["completions"]:
+            if all(part in prompt for part in rule["match"]):
+                return rule["response"]
+        return ""
+
+    def record(self, prompt: str, response: str):
+        with self._lock:
+            self.data["prompts"][self.prompt_key(prompt)] = response
+
+    def save(self):
+        with self._lock:
+            with open(self.path, "w") as f:
+                json.dump(self.data, f, indent=2)
+                f.write("\n")
+
+    def search_results(self, query: str) -> List[str]:
+        for rule in self.data["search"]:
+            if rule["match"].lower() in query.lower():
+                return rule["results"]
+        return []
+
+    def requests(self, pipeline: str) -> List[dict]:
+        return self.data["requests"][pipeline]
+
+
+def configure_environment(cache_dir: str):
+    """Must run before any app or tools module is imported, they read these at import time."""
+    os.environ["SAGE_CACHE_DIR"] = cache_dir
+    # Sampled out of the JSONL file, the in-process metrics give the per-stage breakdown
+    os.environ["SAGE_TRACING"] = "true"
+    os.environ["SAGE_TRACE_SAMPLE_RATE"] = "0"
+    os.environ.pop("SAGE_METRICS_PORT", None)
+    # Models that would be downloaded are left out, so the suite runs offline
+    os.environ.setdefault("SAGE_SEMANTIC_CACHE", "false")
+    os.environ.setdefault("SAGE_RERANK", "false")
+    os.environ.setdefault("SAGE_LLM_ROUTER_FALLBACK", "false")
+    # Free-tier limits would measure the rate limiter, set them explicitly to include it
+    os.environ.setdefault("SAGE_GROQ_RPM", "1000000")
+    os.environ.setdefault("SAGE_GROQ_TPM", "1000000000")
+    os.environ.setdefault("SAGE_LLM_CONCURRENCY", "64")
+    os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+
+
+def replay_model(fixtures: Fixtures, simulation: Simulation):
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, AIMessageChunk
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+    from tools.passages import count_tokens
+
+    class ReplayChatModel(BaseChatModel):
+        """Answers from the fixtures with simulated time to first token and generation speed."""
+
+        model_name: str = "replay"
+
+        @property
+        def _llm_type(self) -> str:
+            return "replay"
+
+        def _answer(self, messages):
+            prompt = "\n".join(str(message.content) for message in messages)
+            return prompt, fixtures.completion(prompt)
+
+        def _pieces(self, response: str) -> List[str]:
+            words = response.split(" ")
+            return [" ".join(words[i:i + 4]) + (" " if i + 4 < len(words) else "") for i in range(0, len(words), 4)]
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+            prompt, response = self._answer(messages)
+            simulation.sleep(simulation.llm_first_token)
+            completion_tokens = count_tokens(response)
+            time.sleep(completion_tokens / simulation.llm_tokens_per_second)
+            total = count_tokens(prompt) + completion_tokens
+            message = AIMessage(content=response, response_metadata={"token_usage": {"total_tokens": total}})
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            _, response = self._answer(messages)
+            simulation.sleep(simulation.llm_first_token)
+            for piece in self._pieces(response):
+                time.sleep(count_tokens(piece) / simulation.llm_tokens_per_second)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+    return ReplayChatModel()
+
+
+def recording_model(fixtures: Fixtures, llm):
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+    class RecordingChatModel(BaseChatModel):
+        """Calls the real model and stores each completion in the fixtures under its exact prompt."""
+
+        inner: BaseChatModel
+
+        @property
+        def _llm_type(self) -> str:
+            return f"recording-{self.inner._llm_type}"
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+            message = self.inner.invoke(messages, stop=stop, **kwargs)
+            fixtures.record("\n".join(str(m.content) for m in messages), str(message.content))
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            pieces = []
+            for chunk in self.inner.stream(messages, stop=stop, **kwargs):
+                pieces.append(str(chunk.content))
+                yield ChatGenerationChunk(message=chunk)
+            fixtures.record("\n".join(str(m.content) for m in messages), "".join(pieces))
+
+    return RecordingChatModel(inner=llm)
+
+
+def hash_embeddings(simulation: Simulation, dim: int = 256):
+    import numpy as np
+    from langchain_core.embeddings import Embeddings
+
+    from tools.hybrid_retriever import code_terms
+
+    class HashEmbeddings(Embeddings):
+        """Deterministic hashed bag of code terms, a stand-in for a local sentence-transformers model."""
+
+        def _vector(self, text: str):
+            vector = np.zeros(dim, dtype=np.float32)
+            for term in code_terms(text):
+                digest = hashlib.md5(term.encode("utf-8")).digest()
+                vector[int.from_bytes(digest[:4], "little") % dim] += 1.0 if digest[4] & 1 else -1.0
+            return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+        def embed_documents(self, texts):
+            simulation.sleep(simulation.embed)
+            return [self._vector(text) for text in texts]
+
+        def embed_query(self, text):
+            simulation.sleep(simulation.embed)
+            return self._vector(text)
+
+    return HashEmbeddings()
+
+
+class ReplaySearch:
+    """Stands in for DuckDuckGoSearchAPIWrapper, returning fixture pages served by the local sites."""
+
+    def __init__(self, fixtures: Fixtures, simulation: Simulation, sites: Dict[str, str]):
+        self.fixtures = fixtures
+        self.simulation = simulation
+        self.sites = sites
+
+    def results(self, query: str, num_results: int) -> List[dict]:
+        self.simulation.sleep(self.simulation.search)
+        results = []
+        for page in self.fixtures.search_results(query)[:num_results]:
+            site, _, name = page.partition("/")
+            results.append({"link": f"{self.sites[site]}/{name}", "title": name, "snippet": ""})
+        return results
+
+
+def serve_sites(directory: str, simulation: Simulation) -> Dict[str, str]:
+    """One local HTTP server per directory under pages/, so per-host connection limits apply as on the web."""
+    sites = {}
+    for site in sorted(os.listdir(directory)):
+        root = os.path.join(directory, site)
+        if not os.path.isdir(root):
+            continue
+
+        class Handler(BaseHTTPRequestHandler):
+            site_root = root
+
+            def do_GET(self):
+                path = os.path.join(self.site_root, os.path.basename(self.path.split("?")[0]))
+                simulation.sleep(simulation.page)
+                if not os.path.isfile(path):
+                    self.send_error(404)
+                    return
+                with open(path, "rb") as f:
+                    body = f.read()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name=f"bench-site-{site}", daemon=True).start()
+        sites[site] = f"http://127.0.0.1:{server.server_address[1]}"
+    return sites
+
+
+def fixture_repo(directory: str) -> str:
+    from git import Actor, Repo
+
+    shutil.copytree(os.path.join(FIXTURES_DIR, "repo"), directory, ignore=shutil.ignore_patterns("__pycache__"))
+    repo = Repo.init(directory)
+    repo.index.add([os.path.relpath(os.path.join(root, name), directory)
+                    for root, _, names in os.walk(directory) if ".git" not in root for name in names])
+    author = Actor("bench", "bench@localhost")
+    repo.index.commit("fixture", author=author, committer=author)
+    return directory
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSampler:
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bench-rss", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def drain(stream) -> Optional[float]:
+    # Time to first chunk of a streamed answer, the whole stream is consumed
+    started = time.perf_counter()
+    first = None
+    for _ in stream:
+        if first is None:
+            first = time.perf_counter() - started
+    return first
+
+
+class Bench:
+    """Loads the apps with their LLM, search and embedding backends replaced by fixtures."""
+
+    def __init__(self, fixtures: Fixtures, simulation: Simulation, work_dir: str, cold: bool = True, record: bool = False):
+        self.fixtures = fixtures
+        self.simulation = simulation
+        self.work_dir = work_dir
+        self.cold = cold
+        self.record = record
+        self.setup_seconds = {}
+        self.runners = {}
+
+    def _model(self, scheduled_model):
+        # Swapping the model inside the scheduled wrapper keeps the scheduler on the measured path
+        if self.record:
+            scheduled_model.llm = recording_model(self.fixtures, scheduled_model.llm)
+        else:
+            scheduled_model.llm = replay_model(self.fixtures, self.simulation)
+
+    def _load(self, pipeline: str):
+        import importlib
+
+        started = time.perf_counter()
+        if pipeline == "code_gen":
+            app = importlib.import_module("tools.code_generation")
+            self._model(app.llm)
+
+            def runner(request):
+                return drain(app.code_gen_chain.stream(request))
+
+            caches = [app.response_cache]
+        elif pipeline == "error_handling":
+            app = importlib.import_module("testing.error_handling_app")
+            self._model(app.llm)
+
+            def runner(request):
+                return drain(app.error_handling_chain.stream(request))
+
+            caches = [app.response_cache]
+        elif pipeline == "search":
+            app = importlib.import_module("testing.cws_app")
+            self._model(app.chat_model)
+            self._model(app.summary_model)
+            sites = serve_sites(os.path.join(self.fixtures.directory, "pages"), self.simulation)
+            app.ddg_search = ReplaySearch(self.fixtures, self.simulation, sites)
+
+            def runner(request):
+                app.chain.invoke(request)
+
+            caches = [app.page_cache]
+        else:
+            from tools.embedding_cache import CachedEmbeddings
+            from tools.repo_index import RepoIndex
+
+            app = importlib.import_module("testing.git_repo_app")
+            self._model(app.llm)
+            repo = fixture_repo(os.path.join(self.work_dir, "fixture_repo"))
+            embeddings = CachedEmbeddings(hash_embeddings(self.simulation), "bench-hash")
+            index = RepoIndex(
+                repo, os.path.join(self.work_dir, "fixture_clone"), "fixture_pkg", embeddings,
+                index_dir=os.path.join(self.work_dir, "fixture_index"), workers=1,
+            )
+            index.refresh()
+            ask = app.build_qa(index)
+
+            def runner(request):
+                ask(request["question"])
+
+            caches = []
+        if self.cold:
+            # Everything written during the run expires at once, so each request misses
+            for cache in caches:
+                cache.ttl = 0
+        self.setup_seconds[pipeline] = time.perf_counter() - started
+        self.runners[pipeline] = runner
+
+    def run(self, pipeline: str, users: int, requests: int) -> dict:
+        from tools.tracing import metrics
+
+        if pipeline not in self.runners:
+            self._load(pipeline)
+        runner = self.runners[pipeline]
+        inputs = self.fixtures.requests(pipeline)
+        if not self.cold:
+            for request in inputs:
+                runner(request)
+        metrics.reset()
+        latencies, first_chunks, errors = [], [], []
+        lock = threading.Lock()
+
+        def one(i):
+            started = time.perf_counter()
+            try:
+                first = runner(dict(inputs[i % len(inputs)]))
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+                return
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if first is not None:
+                    first_chunks.append(first)
+
+        with RssSampler() as rss, ThreadPoolExecutor(max_workers=users) as pool:
+            started = time.perf_counter()
+            list(pool.map(one, range(requests)))
+            seconds = time.perf_counter() - started
+        result = {
+            "pipeline": pipeline,
+            "users": users,
+            "requests": requests,
+            "errors": len(errors),
+            "seconds": seconds,
+            "throughput_rps": len(latencies) / seconds if seconds else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "peak_rss_mib": rss.peak / 2 ** 20,
+            "setup_s": self.setup_seconds[pipeline],
+            "stages": metrics.summary(),
+        }
+        if first_chunks:
+            result["first_chunk_p50_ms"] = percentile(first_chunks, 50) * 1000
+            result["first_chunk_p95_ms"] = percentile(first_chunks, 95) * 1000
+        if errors:
+            result["first_error"] = errors[0]
+        return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(result: dict):
+    first = f", first chunk p50 {result['first_chunk_p50_ms']:.0f} ms" if "first_chunk_p50_ms" in result else ""
+    print(
+        f"{result['pipeline']} x{result['users']} users: {result['requests']} requests, {result['errors']} errors, "
+        f"{result['throughput_rps']:.2f} req/s, p50 {result['p50_ms']:.0f} ms, p95 {result['p95_ms']:.0f} ms, "
+        f"p99 {result['p99_ms']:.0f} ms{first}, peak RSS {result['peak_rss_mib']:.0f} MiB"
+    )
+    for stage, values in result["stages"].items():
+        print(f"    {stage:<16} {values['count']:>6} spans  mean {values['mean_ms']:8.1f} ms  total {values['total_s']:7.2f} s")
+    if "first_error" in result:
+        print(f"    first error: {result['first_error']}")
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> List[str]:
+    """Metrics that moved the wrong way by more than ``threshold`` (a fraction) against ``baseline``."""
+    regressions = []
+    for key, result in report["results"].items():
+        before = baseline["results"].get(key)
+        if before is None:
+            continue
+        for metric in HIGHER_IS_WORSE + LOWER_IS_WORSE:
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change > threshold if metric in HIGHER_IS_WORSE else change < -threshold
+            print(f"{key:<24} {metric:<16} {old:10.2f} -> {new:10.2f} ({change:+.1%}){'  REGRESSION' if worse else ''}")
+            if worse:
+                regressions.append(f"{key} {metric} {change:+.1%}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded fixtures through the SAGE pipelines under load.")
+    parser.add_argument("--pipelines", default=",".join(PIPELINES))
+    parser.add_argument("--users", default="1,4", help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=20, help="requests per pipeline and concurrency level")
+    parser.add_argument("--warm", action="store_true", help="keep cached responses and pages between requests")
+    parser.add_argument("--llm-latency", default="0.25,0.8", help="time to first token p50,p95 in seconds")
+    parser.add_argument("--llm-tps", type=float, default=800.0, help="generated tokens per second")
+    parser.add_argument("--search-latency", default="0.4,1.2")
+    parser.add_argument("--page-latency", default="0.15,0.6")
+    parser.add_argument("--embed-latency", default="0,0")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME", help="diff against a saved baseline, exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--record", action="store_true", help="call the real model and record its completions")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="sage-bench-")
+    configure_environment(os.path.join(work_dir, "cache"))
+    if args.record:
+        from dotenv import load_dotenv
+        load_dotenv(override=True)
+    simulation = Simulation(
+        llm_first_token=LatencyModel.parse(args.llm_latency),
+        llm_tokens_per_second=args.llm_tps,
+        search=LatencyModel.parse(args.search_latency),
+        page=LatencyModel.parse(args.page_latency),
+        embed=LatencyModel.parse(args.embed_latency),
+        seed=args.seed,
+    )
+    fixtures = Fixtures()
+    bench = Bench(fixtures, simulation, work_dir, cold=not args.warm, record=args.record)
+    config = {**vars(args), "simulation": asdict(simulation)}
+    report = {"commit": git_commit(), "created": time.time(), "config": config, "results": {}}
+    try:
+        for pipeline in args.pipelines.split(","):
+            for users in (int(value) for value in args.users.split(",")):
+                result = bench.run(pipeline, users, args.requests)
+                report["results"][f"{pipeline}@{users}"] = result
+                print_result(result)
+    finally:
+        if args.record:
+            fixtures.save()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(BASELINES_DIR, exist_ok=True)
+        with open(os.path.join(BASELINES_DIR, f"{args.save_baseline}.json"), "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(os.path.join(BASELINES_DIR, f"{args.compare}.json")) as f:
+            baseline = json.load(f)
+        print(f"Against baseline {args.compare} ({(baseline.get('commit') or 'unknown')[:12]}):")
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions over {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
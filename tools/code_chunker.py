@@ -0,0 +1,145 @@
+import ast
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from tools.symbol_index import Symbol, extract_symbols
+
+DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+@dataclass
+class Unit:
+    name: str
+    kind: str
+    start: int
+    end: int
+    node: Optional[ast.AST] = None
+
+
+class AstChunker:
+    """Chunk Python files on function/class boundaries instead of fixed character windows.
+
+    Small sibling definitions are packed together up to ``max_chars``, oversized
+    classes and functions are split at statement boundaries, and every chunk
+    carries the qualified names, file and line span it covers. There is no overlap.
+    """
+
+    name = "ast-v1"
+
+    def __init__(self, max_chars: int = 2000):
+        self.max_chars = max_chars
+
+    def chunk(self, repo_path: str, path: str) -> List[Document]:
+        return self.analyze(repo_path, path)[0]
+
+    def analyze(self, repo_path: str, path: str) -> Tuple[List[Document], List[Symbol]]:
+        """Chunks and defined symbols of one file, from a single parse."""
+        try:
+            with open(os.path.join(repo_path, path), encoding="utf-8") as f:
+                source = f.read()
+        except UnicodeDecodeError:
+            return [], []
+        try:
+            tree = ast.parse(source)
+        except SyntaxError:
+            tree = None
+        return self.split(source, path, tree), extract_symbols(tree, path) if tree is not None else []
+
+    def split(self, source: str, path: str, tree: Optional[ast.Module] = None) -> List[Document]:
+        lines = source.splitlines()
+        if not lines:
+            return []
+        if tree is None:
+            try:
+                tree = ast.parse(source)
+            except SyntaxError:
+                pass
+        if tree is None:
+            units = self._line_windows(Unit("<module>", "module", 1, len(lines)), lines)
+        else:
+            units = []
+            for unit in self._units(tree.body, 1, len(lines), "", "<module>"):
+                units.extend(self._fit(unit, lines))
+        return [self._document(group, lines, path) for group in self._pack(units, lines)]
+
+    def _size(self, unit: Unit, lines: List[str]) -> int:
+        return sum(len(line) + 1 for line in lines[unit.start - 1:unit.end])
+
+    def _units(self, nodes, first_line: int, last_line: int, prefix: str, owner: str) -> List[Unit]:
+        # Each unit also owns the comments and blank lines above it
+        units = []
+        cursor = first_line
+        for node in nodes:
+            if isinstance(node, DEFINITIONS):
+                name = prefix + node.name
+                kind = "class" if isinstance(node, ast.ClassDef) else "function"
+            else:
+                name, kind = owner, "statement"
+            units.append(Unit(name, kind, cursor, node.end_lineno, node))
+            cursor = node.end_lineno + 1
+        if units and cursor <= last_line:
+            units[-1].end = last_line
+        return units
+
+    def _fit(self, unit: Unit, lines: List[str]) -> List[Unit]:
+        if self._size(unit, lines) <= self.max_chars:
+            return [unit]
+        node = unit.node
+        if not isinstance(node, DEFINITIONS) or not node.body:
+            return self._line_windows(unit, lines)
+        first = node.body[0]
+        body_start = min([first.lineno] + [d.lineno for d in getattr(first, "decorator_list", [])])
+        prefix = unit.name + "." if isinstance(node, ast.ClassDef) else unit.name + ".<locals>."
+        children = self._units(node.body, body_start, unit.end, prefix, unit.name)
+        # The signature (and decorators) stay with the first piece of the body
+        children[0].start = unit.start
+        fitted = []
+        for child in children:
+            fitted.extend(self._fit(child, lines))
+        return fitted
+
+    def _line_windows(self, unit: Unit, lines: List[str]) -> List[Unit]:
+        # Last resort for single huge statements and files that do not parse
+        windows = []
+        start = size = 0
+        for number in range(unit.start, unit.end + 1):
+            length = len(lines[number - 1]) + 1
+            if size and size + length > self.max_chars:
+                windows.append(Unit(unit.name, unit.kind, start, number - 1))
+                size = 0
+            if not size:
+                start = number
+            size += length
+        windows.append(Unit(unit.name, unit.kind, start, unit.end))
+        return windows
+
+    def _pack(self, units: List[Unit], lines: List[str]) -> List[List[Unit]]:
+        groups, current, size = [], [], 0
+        for unit in units:
+            unit_size = self._size(unit, lines)
+            if current and size + unit_size > self.max_chars:
+                groups.append(current)
+                current, size = [], 0
+            current.append(unit)
+            size += unit_size
+        if current:
+            groups.append(current)
+        return groups
+
+    def _document(self, group: List[Unit], lines: List[str], path: str) -> Document:
+        start, end = group[0].start, group[-1].end
+        names = list(dict.fromkeys(unit.name for unit in group))
+        return Document(
+            page_content="\n".join(lines[start - 1:end]),
+            metadata={
+                "source": path,
+                "start_line": start,
+                "end_line": end,
+                "symbols": ", ".join(names),
+                "kinds": ", ".join(dict.fromkeys(unit.kind for unit in group)),
+                "language": "python",
+            },
+        )
@@ -0,0 +1,75 @@
+import os
+
+from dotenv import load_dotenv
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, SystemMessagePromptTemplate
+from langchain_groq import ChatGroq
+
+from tools.llm_scheduler import INTERACTIVE, scheduled
+from tools.response_cache import shared_response_cache
+
+load_dotenv()
+GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
+
+# Define the system message for the assistant's behavior
+system_message = SystemMessagePromptTemplate.from_template(
+    "You are a highly skilled code assistant. Your task is to generate accurate and functional code based on the user's input or query. "
+    "If the user specifies a programming language, use that language; otherwise, default to Python. Ensure the code is correct and free from errors. "
+    "In addition to the code, provide comments that explain the main functionality of each part. "
+    "Offer a step-by-step explanation of the code, including the reasoning behind the chosen approach or methods used to solve the problem. "
+    "Keep explanations concise and informative. Avoid any incorrect or hallucinated information. "
+    "If applicable, also generate boilerplate code to help the user get started with the necessary structure and setup."
+)
+
+# Define the human message for the user's query
+human_message = HumanMessagePromptTemplate.from_template(
+    "{user_query}"
+)
+
+# Combine the system and human messages into a chat prompt template
+code_gen_prompt = ChatPromptTemplate(
+    messages=[
+        system_message,
+        human_message
+    ]
+)
+
+# Initialize the ChatGroq model; retries on 429 are left to the shared scheduler, ahead of background calls
+llm = scheduled(ChatGroq(model_name="llama3-8b-8192", groq_api_key=GROQ_API_KEY, max_retries=0), INTERACTIVE)
+
+# Create the chain using the chat prompt and the ChatGroq model, answered from the response cache when possible
+response_cache = shared_response_cache()
+code_gen_chain = response_cache.wrap(code_gen_prompt | llm | StrOutputParser(), "code_gen_chain", code_gen_prompt, llm)
+
+# Prompts for the verify mode: tests for the request, and a fix for an answer that failed them
+tests_prompt = ChatPromptTemplate.from_template(
+    "Write Python tests for a function that answers this request:\n{user_query}\n\n{function}\n\n"
+    "Reply with a single ```python code block of plain assert statements that call the function directly "
+    "(it is already imported). Test the behaviour the request asks for, not any particular implementation, "
+    "no network or file access, no explanations."
+)
+repair_prompt = ChatPromptTemplate.from_template(
+    "This code was written for the request below but failed its tests.\n\nRequest:\n{user_query}\n\n"
+    "Code:\n```python\n{code}\n```\n\nError:\n{error}\n\n"
+    "Fix the code. Reply with the complete corrected code in a single ```python code block and a short explanation of the fix."
+)
+tests_chain = tests_prompt | llm | StrOutputParser()
+repair_chain = repair_prompt | llm | StrOutputParser()
+
+
+def generate(query):
+    # Uncached and streamed: every candidate is a fresh sample, and a cancelled one stops mid-answer
+    return "".join(code_gen_chain.chain.stream({"user_query": query}))
+
+
+def write_tests(query, entry_point=None):
+    # Tests come from the request alone, tests read off an answer would pass that answer whatever it does
+    function = (
+        f"The function is `{entry_point}`." if entry_point else
+        "Call it by the name the request gives it. If the request names no function, reply with an empty ```python block."
+    )
+    return tests_chain.invoke({"user_query": query, "function": function})
+
+
+def repair(query, code, error):
+    return "".join(repair_chain.stream({"user_query": query, "code": code, "error": error}))
@@ -0,0 +1,82 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    """Time budget of one request, shared by every thread working on it.
+
+    ``cancel()`` ends it early, e.g. when the request is superseded, and runs the
+    registered callbacks so blocked work can be interrupted.
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds if seconds is not None else None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = {}
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def remaining(self) -> Optional[float]:
+        if self.cancelled:
+            return 0.0
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() == 0.0
+
+    def check(self):
+        if self.cancelled:
+            raise DeadlineExceeded("cancelled")
+        if self.expired:
+            raise DeadlineExceeded(f"deadline of {self.seconds:g}s exceeded")
+
+    def wait(self, seconds: float) -> bool:
+        """Sleep up to ``seconds``; True if the request was cancelled meanwhile."""
+        remaining = self.remaining()
+        return self._cancelled.wait(seconds if remaining is None else min(seconds, remaining))
+
+    def cancel(self):
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self._cancelled.set()
+            callbacks, self._callbacks = list(self._callbacks.values()), {}
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Run ``callback`` on cancel (at once if already cancelled); returns a function that unregisters it."""
+        key = object()
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._callbacks[key] = callback
+                return lambda: self._callbacks.pop(key, None)
+        callback()
+        return lambda: None
+
+
+# Lets code far down a call chain (LLM wrappers) see the deadline of the request it serves
+current_deadline: ContextVar[Optional[Deadline]] = ContextVar("sage_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]):
+    token = current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        current_deadline.reset(token)
@@ -0,0 +1,64 @@
+import hashlib
+import re
+from typing import Dict, List, Sequence
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import numpy as np
+
+TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "ref_src"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+WORD_RE = re.compile(r"\w+")
+
+
+def normalize_url(url: str) -> str:
+    # http/https, www., default ports, fragments, tracking params and
+    # trailing slashes all point at the same page
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = re.sub(r"/+", "/", parts.path).rstrip("/")
+    path = re.sub(r"/index\.html?$", "", path)
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith("utm_")
+    )
+    if scheme in DEFAULT_PORTS:
+        scheme = "https"
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def simhash(text: str, shingle_size: int = 4) -> int:
+    words = WORD_RE.findall(text.lower())
+    shingles = {" ".join(words[i:i + shingle_size]) for i in range(max(len(words) - shingle_size + 1, 1))}
+    digests = b"".join(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest() for shingle in shingles)
+    hashes = np.frombuffer(digests, dtype=">u8").astype(np.uint64)
+    # Per bit, +1 for every shingle hash that has it set and -1 for every one that doesn't
+    ones = ((hashes[:, None] >> np.arange(64, dtype=np.uint64)) & np.uint64(1)).sum(axis=0)
+    return sum(1 << bit for bit in np.flatnonzero(2 * ones > len(shingles)).tolist())
+
+
+def near_duplicates(
+        keys: Sequence[str], texts: Sequence[str], max_distance: int = 3, min_words: int = 50
+) -> Dict[str, str]:
+    """Map every key to the key of the first page whose text is a near-duplicate of it.
+
+    Pages shorter than ``min_words`` (error messages, stubs) are never merged.
+    """
+    representatives: Dict[str, str] = {}
+    seen: List[tuple] = []
+    for key, text in zip(keys, texts):
+        representatives[key] = key
+        if len(WORD_RE.findall(text)) < min_words:
+            continue
+        fingerprint = simhash(text)
+        for other_key, other_fingerprint in seen:
+            if bin(fingerprint ^ other_fingerprint).count("1") <= max_distance:
+                representatives[key] = other_key
+                break
+        else:
+            seen.append((key, fingerprint))
+    return representatives
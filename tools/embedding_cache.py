@@ -0,0 +1,134 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from tools.page_cache import CACHE_DIR
+from tools.tracing import span
+
+EMBEDDING_CACHE_DIR = os.path.join(CACHE_DIR, "embeddings")
+
+
+class EmbeddingStore:
+    """float16 vectors in an append-only memory-mapped file, row numbers in SQLite."""
+
+    def __init__(self, directory: str, dim: int):
+        os.makedirs(directory, exist_ok=True)
+        self.dim = dim
+        self.row_bytes = dim * 2
+        self.vectors_path = os.path.join(directory, "vectors.f16")
+        open(self.vectors_path, "ab").close()
+        self._lock = threading.Lock()
+        self._map: Optional[np.memmap] = None
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite"), check_same_thread=False, timeout=30)
+        self._db.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._db.commit()
+
+    def _rows(self, needed: int) -> np.memmap:
+        # Remap when other writers have appended rows since the last map
+        if self._map is None or self._map.shape[0] <= needed:
+            count = os.path.getsize(self.vectors_path) // self.row_bytes
+            self._map = np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(count, self.dim))
+        return self._map
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, row FROM vectors WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                if rows:
+                    vectors = self._rows(max(row for _, row in rows))
+                    found.update((key, np.asarray(vectors[row], dtype=np.float32)) for key, row in rows)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        if not items:
+            return
+        with self._lock:
+            # The IMMEDIATE transaction serializes row allocation across processes
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                first = self._db.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM vectors").fetchone()[0]
+                block = np.stack([np.asarray(vector, dtype=np.float16) for vector in items.values()])
+                with open(self.vectors_path, "r+b") as f:
+                    f.seek(first * self.row_bytes)
+                    f.write(block.tobytes())
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO vectors VALUES (?, ?)",
+                    [(key, first + i) for i, key in enumerate(items)],
+                )
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that looks chunks up by hash of (model name, text) before calling the model.
+
+    Shared by every repo, branch and re-index that uses the same model.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache_dir: Optional[str] = None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.directory = os.path.join(cache_dir or EMBEDDING_CACHE_DIR, re.sub(r"[^\w.-]+", "_", model_name))
+        self.hits = 0
+        self.misses = 0
+        self._store: Optional[EmbeddingStore] = None
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _open_store(self, dim: Optional[int] = None) -> Optional[EmbeddingStore]:
+        # The vector width is only known once the model has produced a vector
+        if self._store is None:
+            dim_path = os.path.join(self.directory, "dim")
+            if os.path.exists(dim_path):
+                with open(dim_path) as f:
+                    dim = int(f.read())
+            elif dim is not None:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(dim_path, "w") as f:
+                    f.write(str(dim))
+            if dim is not None:
+                self._store = EmbeddingStore(self.directory, dim)
+        return self._store
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with span("embed", texts=len(texts)) as current:
+            keys = [self._key(text) for text in texts]
+            store = self._open_store()
+            found = store.get_many(keys) if store is not None else {}
+            missing = {key: text for key, text in zip(keys, texts) if key not in found}
+            missed = sum(1 for key in keys if key in missing)
+            self.hits += len(keys) - missed
+            self.misses += missed
+            current.set("cache_hits", len(keys) - missed)
+            current.set("cache_misses", missed)
+            if missing:
+                vectors = self.embeddings.embed_documents(list(missing.values()))
+                computed = dict(zip(missing, (np.asarray(vector, dtype=np.float32) for vector in vectors)))
+                self._open_store(len(vectors[0])).put_many(computed)
+                found.update(computed)
+            return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        with span("embed", texts=1, query=True):
+            return self.embeddings.embed_query(text)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,232 @@
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+from tools.bench import FIXTURES_DIR, LatencyModel
+from tools.sandbox import (
+    SANDBOX_ALLOW_UNISOLATED, SANDBOX_MEMORY_MB, SANDBOX_TIMEOUT, SANDBOX_WORKERS, Sandbox, extract_code, isolation,
+    syntax_error,
+)
+
+SAMPLE_PROBLEMS = os.path.join(FIXTURES_DIR, "humaneval_sample.jsonl")
+QUERY_TEMPLATE = (
+    "Complete the following Python function. Reply with the complete function, including the imports it needs, "
+    "in a single ```python code block.\n\n{prompt}"
+)
+
+
+def load_problems(path: str) -> List[dict]:
+    """HumanEval-format problems (task_id, prompt, entry_point, test) from a .jsonl or .jsonl.gz file."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def pass_at_k(n: int, c: int, k: int) -> float:
+    """Unbiased pass@k from ``n`` samples of which ``c`` passed: 1 - C(n-c, k) / C(n, k)."""
+    if n - c < k:
+        return 1.0
+    missed = 1.0
+    for i in range(n - c + 1, n + 1):
+        missed *= 1 - k / i
+    return 1 - missed
+
+
+def program(problem: dict, completion: str) -> str:
+    # The HumanEval protocol: the prompt, with its imports and helper functions, then the completion.
+    # A complete function in the answer redefines the prompt's docstring-only one.
+    code = extract_code(completion, problem["entry_point"])
+    if code[:1] in (" ", "\t"):
+        # Only the body, continuing the prompt's signature
+        return problem["prompt"] + code
+    return problem["prompt"] + "\n\n" + code
+
+
+def test_code(problem: dict) -> str:
+    return f"{problem['test']}\n\ncheck({problem['entry_point']})\n"
+
+
+def stub_model(problems: List[dict], failure_rate: float, latency: LatencyModel, seed: int = 0):
+    """Chat model answering with each problem's canonical solution, broken at ``failure_rate``, for offline runs."""
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    class StubChatModel(BaseChatModel):
+        model_name: str = "stub"
+
+        @property
+        def _llm_type(self) -> str:
+            return "stub"
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+            prompt = "\n".join(str(message.content) for message in messages)
+            problem = next((p for p in problems if p["prompt"].strip() in prompt), None)
+            with lock:
+                delay = latency.sample(rng)
+                broken = rng.random() < failure_rate
+            time.sleep(delay)
+            if problem is None:
+                content = "I could not find a function to complete."
+            else:
+                body = "    return None\n" if broken else problem["canonical_solution"]
+                content = f"Here is the completed function:\n\n```python\n{problem['prompt']}{body}```\n"
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    return StubChatModel()
+
+
+def evaluate(
+        problems: List[dict],
+        generate: Callable[[dict], str],
+        sandbox: Sandbox,
+        samples: int = 1,
+        llm_workers: int = 8,
+        progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, List[dict]]:
+    """Sample ``samples`` completions per problem and test each one as soon as it arrives.
+
+    Generation and test execution overlap: a finished completion goes straight to
+    the sandbox pool while the next ones are still being generated, so the run is
+    bounded by model throughput rather than by running the tests one by one.
+    """
+    results = defaultdict(list)
+    total = len(problems) * samples
+    done = 0
+
+    def timed(problem):
+        started = time.perf_counter()
+        return generate(problem), time.perf_counter() - started
+
+    tests = []
+    with ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix="sage-eval-llm") as pool:
+        generations = {pool.submit(timed, problem): problem for problem in problems for _ in range(samples)}
+        for future in as_completed(generations):
+            problem = generations[future]
+            try:
+                completion, seconds = future.result()
+            except Exception as e:
+                results[problem["task_id"]].append({"status": "generation_error", "error": f"{type(e).__name__}: {e}"})
+                done += 1
+                continue
+            code = program(problem, completion)
+            error = syntax_error(code)
+            if error is not None:
+                results[problem["task_id"]].append({"status": "syntax_error", "error": error, "generation_s": seconds})
+                done += 1
+                continue
+            tests.append((problem, seconds, sandbox.submit(code, test_code(problem))))
+    for problem, seconds, future in tests:
+        result = future.result()
+        results[problem["task_id"]].append({
+            "status": result.status,
+            "error": None if result.passed else result.error(),
+            "generation_s": seconds,
+            "test_s": result.seconds,
+        })
+        done += 1
+        if progress is not None:
+            progress(done, total)
+    return dict(results)
+
+
+def summarize(results: Dict[str, List[dict]], ks: List[int]) -> dict:
+    counts = {task: (len(samples), sum(sample["status"] == "passed" for sample in samples))
+              for task, samples in results.items()}
+    samples = [sample for task_samples in results.values() for sample in task_samples]
+    summary = {
+        "problems": len(counts),
+        "samples": len(samples),
+        "statuses": dict(Counter(sample["status"] for sample in samples)),
+        "generation_s": sum(sample.get("generation_s", 0.0) for sample in samples),
+        "test_s": sum(sample.get("test_s", 0.0) for sample in samples),
+    }
+    for k in ks:
+        # pass@k is only defined for problems with at least k samples
+        eligible = [pass_at_k(n, c, k) for n, c in counts.values() if n >= k]
+        if eligible:
+            summary[f"pass@{k}"] = sum(eligible) / len(eligible)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HumanEval-style evaluation of code_gen_chain in a sandbox.")
+    parser.add_argument("--problems", default=SAMPLE_PROBLEMS, help="HumanEval .jsonl or .jsonl.gz")
+    parser.add_argument("--limit", type=int, help="only the first N problems")
+    parser.add_argument("--model", choices=("groq", "stub"), default="groq")
+    parser.add_argument("--samples", type=int, default=1, help="completions per problem")
+    parser.add_argument("--k", default="1", help="comma separated k values for pass@k")
+    parser.add_argument("--llm-workers", type=int, default=8)
+    parser.add_argument("--test-workers", type=int, default=SANDBOX_WORKERS)
+    parser.add_argument("--timeout", type=float, default=SANDBOX_TIMEOUT, help="seconds per test run")
+    parser.add_argument("--memory-mb", type=int, default=SANDBOX_MEMORY_MB)
+    parser.add_argument("--failure-rate", type=float, default=0.2, help="share of broken stub answers")
+    parser.add_argument("--stub-latency", default="0.5,1.5", help="stub answer time p50,p95 in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write per-sample results and the summary as JSON")
+    args = parser.parse_args(argv)
+
+    allow_unisolated = SANDBOX_ALLOW_UNISOLATED
+    if not isolation():
+        if args.model == "groq" and not allow_unisolated:
+            parser.error("the sandbox cannot isolate this host (no unprivileged namespaces for unshare), refusing to "
+                         "run model-written code; set SAGE_SANDBOX_ALLOW_UNISOLATED=true to run it anyway")
+        # The stub only returns the problems' own solutions, a few deliberately broken
+        print("WARNING: no sandbox isolation on this host, tests run with network and file access", file=sys.stderr)
+        allow_unisolated = True
+    problems = load_problems(args.problems)[:args.limit]
+    if args.model == "stub":
+        # Models that would be downloaded are left out, as in tools.bench, and
+        # the scheduler's free-tier limits would pace the stub like the real API
+        os.environ.setdefault("SAGE_SEMANTIC_CACHE", "false")
+        os.environ.setdefault("SAGE_RERANK", "false")
+        os.environ.setdefault("SAGE_LLM_ROUTER_FALLBACK", "false")
+        os.environ.setdefault("GROQ_API_KEY", "offline-evaluation")
+        os.environ.setdefault("SAGE_GROQ_RPM", "1000000")
+        os.environ.setdefault("SAGE_GROQ_TPM", "1000000000")
+        os.environ.setdefault("SAGE_LLM_CONCURRENCY", str(args.llm_workers))
+    from tools import code_generation
+    if args.model == "stub":
+        latency = LatencyModel.parse(args.stub_latency)
+        code_generation.llm.llm = stub_model(problems, args.failure_rate, latency, args.seed)
+    # Every sample is a fresh generation, the response cache would return the first one again
+    chain = code_generation.code_gen_chain.chain
+
+    def generate(problem):
+        return chain.invoke({"user_query": QUERY_TEMPLATE.format(prompt=problem["prompt"])})
+
+    def progress(done, total):
+        print(f"\r{done}/{total} samples tested", end="", flush=True)
+
+    sandbox = Sandbox(args.test_workers, args.timeout, args.memory_mb, allow_unisolated)
+    started = time.perf_counter()
+    try:
+        results = evaluate(problems, generate, sandbox, args.samples, args.llm_workers, progress)
+    finally:
+        sandbox.close()
+    print()
+    summary = summarize(results, [int(k) for k in args.k.split(",")])
+    summary["wall_s"] = time.perf_counter() - started
+    scores = ", ".join(f"{key} {value:.3f}" for key, value in summary.items() if key.startswith("pass@"))
+    print(f"{summary['problems']} problems x {args.samples} samples in {summary['wall_s']:.1f}s: {scores}")
+    print("Statuses: " + ", ".join(f"{status} {count}" for status, count in sorted(summary["statuses"].items())))
+    print(f"Model time {summary['generation_s']:.1f}s and test time {summary['test_s']:.1f}s overlapped "
+          f"across {args.llm_workers} model and {args.test_workers} test workers")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "summary": summary, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
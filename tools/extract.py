@@ -0,0 +1,88 @@
+from html.parser import HTMLParser
+
+# Elements whose text is boilerplate rather than page content
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "nav", "header", "footer", "aside", "iframe"}
+# No end tag follows these, so they can never open a skipped region
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+SKIP_ROLES = {"navigation", "banner", "contentinfo", "search", "menu", "menubar"}
+HTML_CONTENT_TYPES = {"text/html", "application/xhtml+xml"}
+TEXT_CONTENT_TYPES = HTML_CONTENT_TYPES | {"text/plain"}
+
+
+class TextExtractor(HTMLParser):
+    """Incremental HTML to text: feed it chunks and stop once ``done`` is set."""
+
+    def __init__(self, max_chars: int = 10000):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.parts = []
+        self.length = 0
+        self._skip_stack = []
+
+    @property
+    def done(self):
+        return self.length >= self.max_chars
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_stack:
+            if tag == self._skip_stack[-1]:
+                self._skip_stack.append(tag)
+            return
+        if tag in VOID_TAGS:
+            self.parts.append(" ")
+        elif tag in SKIP_TAGS or dict(attrs).get("role") in SKIP_ROLES:
+            self._skip_stack.append(tag)
+        else:
+            # Tags separate strings like get_text(separator=" ") does
+            self.parts.append(" ")
+
+    def handle_startendtag(self, tag, attrs):
+        # <tag/> has no content to skip
+        if not self._skip_stack:
+            self.parts.append(" ")
+
+    def handle_endtag(self, tag):
+        if self._skip_stack:
+            if tag == self._skip_stack[-1]:
+                self._skip_stack.pop()
+            return
+        self.parts.append(" ")
+
+    def handle_data(self, data):
+        # Text can arrive split at chunk boundaries, so words are only joined in text()
+        if self._skip_stack or self.done:
+            return
+        self.parts.append(data)
+        self.length += len(data) if data.strip() else 0
+
+    def text(self):
+        return " ".join("".join(self.parts).split())[:self.max_chars]
+
+
+class PlainTextExtractor:
+    def __init__(self, max_chars: int = 10000):
+        self.max_chars = max_chars
+        self.parts = []
+        self.length = 0
+
+    @property
+    def done(self):
+        return self.length >= self.max_chars
+
+    def feed(self, data):
+        self.parts.append(data)
+        self.length += len(data)
+
+    def close(self):
+        pass
+
+    def text(self):
+        return " ".join("".join(self.parts).split())[:self.max_chars]
+
+
+def extractor_for(content_type: str, max_chars: int = 10000):
+    if content_type in HTML_CONTENT_TYPES:
+        return TextExtractor(max_chars)
+    if content_type in TEXT_CONTENT_TYPES:
+        return PlainTextExtractor(max_chars)
+    return None
@@ -0,0 +1,188 @@
+import asyncio
+import codecs
+import threading
+import time
+from concurrent.futures import CancelledError
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+import aiohttp
+
+from tools.deadline import Deadline
+from tools.extract import extractor_for
+
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; SAGE/1.0; +https://github.com/Abhishekvidhate/SAGE)"}
+
+
+@dataclass
+class FetchResult:
+    url: str
+    status: int = 0
+    text: str = ""
+    headers: dict = field(default_factory=dict)
+    error: Optional[str] = None
+    truncated: bool = False
+    parse_seconds: float = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None and self.status == 200
+
+
+class AsyncFetcher:
+    """Shared HTTP client: one keep-alive connection pool, per-host caps and timeouts.
+
+    The event loop runs on a daemon thread so synchronous callers (LCEL lambdas,
+    Streamlit reruns) can share the same pool across requests.
+    """
+
+    def __init__(
+            self,
+            max_concurrency: int = 16,
+            max_per_host: int = 4,
+            connect_timeout: float = 5.0,
+            read_timeout: float = 15.0,
+            total_timeout: float = 30.0,
+            max_bytes: int = 5 * 1024 * 1024,
+            chunk_size: int = 16 * 1024,
+            headers: Optional[dict] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.timeout = aiohttp.ClientTimeout(
+            total=total_timeout, sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        self.headers = headers or DEFAULT_HEADERS
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="sage-fetcher", daemon=True).start()
+        return self._loop
+
+    def _get_session(self):
+        # Only ever called on self.loop, so no locking is needed here
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                limit_per_host=self.max_per_host,
+                keepalive_timeout=30,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers=self.headers)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def fetch(self, url: str, headers: Optional[dict] = None, max_chars: Optional[int] = None) -> FetchResult:
+        """GET ``url``; with ``max_chars`` the body is streamed through a text extractor instead."""
+        session = self._get_session()
+        async with self._semaphore:
+            try:
+                async with session.get(url, headers=headers, allow_redirects=True) as response:
+                    result = FetchResult(url, response.status, headers=response.headers.copy())
+                    if response.status != 200:
+                        return result
+                    if max_chars is None:
+                        result.text = await response.text(errors="replace")
+                        return result
+                    return await self._extract(response, result, max_chars)
+            except asyncio.TimeoutError:
+                return FetchResult(url, error="timed out")
+            except aiohttp.ClientError as e:
+                return FetchResult(url, error=str(e) or type(e).__name__)
+
+    async def _extract(self, response: aiohttp.ClientResponse, result: FetchResult, max_chars: int):
+        # Reject by headers before reading any of the body
+        extractor = extractor_for(response.content_type, max_chars)
+        if extractor is None:
+            result.error = f"Unsupported content type {response.content_type}"
+            return result
+        if response.content_length is not None and response.content_length > self.max_bytes:
+            result.error = f"Page too large ({response.content_length} bytes)"
+            return result
+
+        try:
+            decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+        except LookupError:
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        received = 0
+        # Parsing is interleaved with the download, only the time spent in the extractor is counted
+        parse_seconds = 0.0
+        async for chunk in response.content.iter_chunked(self.chunk_size):
+            received += len(chunk)
+            started = time.perf_counter()
+            extractor.feed(decoder.decode(chunk))
+            parse_seconds += time.perf_counter() - started
+            if extractor.done or received >= self.max_bytes:
+                # Stop reading, the connection is dropped rather than drained
+                result.truncated = True
+                response.close()
+                break
+        else:
+            extractor.feed(decoder.decode(b"", final=True))
+        started = time.perf_counter()
+        extractor.close()
+        result.text = extractor.text()
+        result.parse_seconds = parse_seconds + time.perf_counter() - started
+        return result
+
+    async def fetch_all(
+            self,
+            urls: Iterable[str],
+            request_headers: Optional[dict] = None,
+            max_chars: Optional[int] = None,
+            timeout: Optional[float] = None,
+    ) -> List[FetchResult]:
+        """Fetch concurrently; requests still running after ``timeout`` are cancelled and reported as such."""
+        urls = list(urls)
+        request_headers = request_headers or {}
+        tasks = [asyncio.ensure_future(self.fetch(url, request_headers.get(url), max_chars)) for url in urls]
+        if not tasks:
+            return []
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=timeout)
+        finally:
+            # Also reached when the caller cancels us: close every open connection
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        return [
+            task.result() if task in done else FetchResult(url, error="deadline exceeded")
+            for url, task in zip(urls, tasks)
+        ]
+
+    def fetch_many(
+            self,
+            urls: Iterable[str],
+            request_headers: Optional[dict] = None,
+            max_chars: Optional[int] = None,
+            deadline: Optional[Deadline] = None,
+    ) -> List[FetchResult]:
+        urls = list(urls)
+        timeout = deadline.remaining() if deadline is not None else None
+        future = asyncio.run_coroutine_threadsafe(self.fetch_all(urls, request_headers, max_chars, timeout), self.loop)
+        unregister = deadline.on_cancel(future.cancel) if deadline is not None else None
+        try:
+            return future.result()
+        except CancelledError:
+            return [FetchResult(url, error="cancelled") for url in urls]
+        finally:
+            if unregister is not None:
+                unregister()
+
+    def close(self):
+        if self._loop is None:
+            return
+        if self._session is not None:
+            asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+            self._session = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import re
+import tempfile
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from git import Repo
+
+from tools.page_cache import CACHE_DIR
+
+MIRROR_DIR = os.path.join(CACHE_DIR, "mirrors")
+
+
+@dataclass
+class CloneOptions:
+    """How much of a repository to download.
+
+    ``depth`` limits history, ``blob_filter`` makes a partial clone that fetches
+    file contents lazily, ``sparse_paths``/``suffixes`` restrict the checkout and
+    ``mirror_dir`` keeps a bare mirror that later clones and fetches read from.
+    """
+
+    depth: Optional[int] = 1
+    blob_filter: Optional[str] = "blob:none"
+    sparse_paths: List[str] = field(default_factory=list)
+    suffixes: List[str] = field(default_factory=list)
+    mirror_dir: Optional[str] = None
+
+    def sparse_patterns(self) -> List[str]:
+        patterns = []
+        for path in self.sparse_paths:
+            path = "/" + path.strip("/")
+            patterns.extend(f"{path}/**/*{suffix}" for suffix in self.suffixes or [""])
+        return patterns
+
+
+def mirror_path(url: str, mirror_dir: str) -> str:
+    name = re.sub(r"[^\w.-]+", "_", url.rstrip("/").rsplit("/", 1)[-1])
+    return os.path.join(mirror_dir, f"{name}-{hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]}.git")
+
+
+def checkout_blobs(repo: Repo, options: CloneOptions) -> List[str]:
+    """Ids of the blobs at HEAD that a clone made with ``options`` checks out."""
+    listing = repo.git.ls_tree("-r", "HEAD", "--", *[path.strip("/") for path in options.sparse_paths])
+    blobs = []
+    for line in listing.splitlines():
+        meta, path = line.split("\t", 1)
+        _, kind, sha = meta.split()
+        if kind == "blob" and (not options.suffixes or path.endswith(tuple(options.suffixes))):
+            blobs.append(sha)
+    return blobs
+
+
+def prefetch_blobs(mirror: Repo, options: CloneOptions):
+    # upload-pack never fetches missing objects lazily, so the blobs working clones
+    # check out must already be in the mirror; the rest stay upstream
+    with tempfile.TemporaryFile() as wanted:
+        wanted.write("".join(f"{sha}\n" for sha in checkout_blobs(mirror, options)).encode("ascii"))
+        wanted.seek(0)
+        mirror.git(c="fetch.negotiationAlgorithm=noop").fetch(
+            "origin", "--no-tags", "--no-write-fetch-head", "--recurse-submodules=no",
+            f"--filter={options.blob_filter}", "--stdin", istream=wanted,
+        )
+
+
+def update_mirror(url: str, options: CloneOptions) -> str:
+    """Create or fetch the local bare mirror of ``url`` and return a file:// url for it."""
+    path = mirror_path(url, options.mirror_dir)
+    kwargs = {"depth": options.depth} if options.depth else {}
+    if options.blob_filter:
+        kwargs["filter"] = options.blob_filter
+    if os.path.isdir(path):
+        mirror = Repo(path)
+        mirror.remotes.origin.fetch(prune=True, **kwargs)
+    else:
+        os.makedirs(options.mirror_dir, exist_ok=True)
+        mirror = Repo.clone_from(url, path, mirror=True, **kwargs)
+        # Let working clones make partial clones and fetch missing blobs from it
+        mirror.git.config("uploadpack.allowFilter", "true")
+        mirror.git.config("uploadpack.allowAnySHA1InWant", "true")
+    if options.blob_filter:
+        prefetch_blobs(mirror, options)
+    # Local paths ignore --depth and --filter, file:// urls honour them
+    return "file://" + os.path.abspath(path)
+
+
+def clone(url: str, path: str, options: CloneOptions) -> Repo:
+    source = update_mirror(url, options) if options.mirror_dir else url
+    args = []
+    if options.depth:
+        args.append(f"--depth={options.depth}")
+    if options.blob_filter:
+        args.append(f"--filter={options.blob_filter}")
+    if options.sparse_paths:
+        args.append("--no-checkout")
+    repo = Repo.clone_from(source, to_path=path, multi_options=args)
+    if options.sparse_paths:
+        repo.git.sparse_checkout("set", "--no-cone", *options.sparse_patterns())
+        repo.git.checkout(repo.active_branch.name)
+    return repo
+
+
+def fetch(url: str, repo: Repo, options: CloneOptions):
+    """Bring an existing clone up to date and reset it to its upstream branch."""
+    if options.mirror_dir:
+        update_mirror(url, options)
+    repo.remotes.origin.fetch(**({"depth": options.depth} if options.depth else {}))
+    repo.head.reset(repo.active_branch.tracking_branch().commit, index=True, working_tree=True)
@@ -0,0 +1,184 @@
+import json
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Any, Iterable, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from tools.tracing import span
+
+IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+CODE_STOPWORDS = {
+    "a", "an", "and", "are", "as", "be", "by", "do", "does", "for", "how", "i", "in", "is", "it", "of", "on",
+    "or", "the", "this", "to", "what", "when", "where", "which", "with", "self", "def", "return", "import",
+}
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+def code_terms(text: str) -> List[str]:
+    """Lowercased identifiers plus their camelCase/snake_case parts: RunnableBinding -> runnablebinding, runnable, binding."""
+    found = []
+    for identifier in IDENTIFIER_RE.findall(text):
+        lowered = identifier.lower()
+        if lowered not in CODE_STOPWORDS:
+            found.append(lowered)
+        parts = [part.lower() for piece in identifier.split("_") for part in CAMEL_RE.findall(piece)]
+        if len(parts) > 1:
+            found.extend(part for part in parts if part not in CODE_STOPWORDS and len(part) > 1)
+    return found
+
+
+def document_key(document: Document) -> Tuple:
+    metadata = document.metadata
+    return metadata.get("source"), metadata.get("start_line"), metadata.get("end_line"), hash(document.page_content)
+
+
+class CodeBM25:
+    """BM25 over code terms in an SQLite FTS5 table kept next to the vector index.
+
+    Chunks are added and deleted along with the vector store, and queries read
+    only the postings of their terms and the ``k`` best chunks, so opening an
+    index loads nothing into memory.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id INTEGER PRIMARY KEY, source TEXT, text TEXT NOT NULL, metadata TEXT NOT NULL, terms TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)")
+        # code_terms already split identifiers, the tokenizer must only split on the spaces between them
+        self._db.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunk_terms USING fts5("
+            " terms, content='chunks', content_rowid='id', tokenize=\"unicode61 tokenchars '_'\")"
+        )
+        self._db.execute(
+            "CREATE TRIGGER IF NOT EXISTS chunks_insert AFTER INSERT ON chunks BEGIN"
+            " INSERT INTO chunk_terms (rowid, terms) VALUES (new.id, new.terms); END"
+        )
+        self._db.execute(
+            "CREATE TRIGGER IF NOT EXISTS chunks_delete AFTER DELETE ON chunks BEGIN"
+            " INSERT INTO chunk_terms (chunk_terms, rowid, terms) VALUES ('delete', old.id, old.terms); END"
+        )
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def add(self, documents: List[Document]):
+        rows = [
+            (
+                document.metadata.get("source"),
+                document.page_content,
+                json.dumps(document.metadata),
+                " ".join(code_terms(document.metadata.get("symbols", "") + " " + document.page_content)),
+            )
+            for document in documents
+        ]
+        with self._lock:
+            self._db.executemany("INSERT INTO chunks (source, text, metadata, terms) VALUES (?, ?, ?, ?)", rows)
+            self._db.commit()
+
+    def add_store(self, db, batch_size: int = 1000):
+        # One-off fill for an index built before BM25 was persisted
+        stored = db.get(include=["documents", "metadatas"])
+        for start in range(0, len(stored["documents"]), batch_size):
+            self.add([
+                Document(page_content=text, metadata=metadata or {})
+                for text, metadata in zip(stored["documents"][start:start + batch_size],
+                                          stored["metadatas"][start:start + batch_size])
+            ])
+
+    def delete_sources(self, sources: Iterable[str]):
+        with self._lock:
+            self._db.executemany("DELETE FROM chunks WHERE source = ?", [(source,) for source in sources])
+            self._db.commit()
+
+    def reset(self):
+        with self._lock:
+            self._db.execute("DELETE FROM chunks")
+            self._db.commit()
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[Document, float]]:
+        terms = set(code_terms(query))
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in sorted(terms))
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT chunks.text, chunks.metadata, -bm25(chunk_terms) AS score FROM chunk_terms"
+                " JOIN chunks ON chunks.id = chunk_terms.rowid"
+                " WHERE chunk_terms MATCH ? ORDER BY score DESC LIMIT ?",
+                (match, k),
+            ).fetchall()
+        return [(Document(page_content=text, metadata=json.loads(metadata)), score) for text, metadata, score in rows]
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int = 60) -> List[Document]:
+    scores, documents = defaultdict(float), {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking):
+            key = document_key(document)
+            scores[key] += 1.0 / (k + rank + 1)
+            documents.setdefault(key, document)
+    return [documents[key] for key in sorted(scores, key=lambda key: -scores[key])]
+
+
+class CrossEncoderReranker:
+    """Small local cross-encoder that scores (query, chunk) pairs jointly; loaded on first use."""
+
+    def __init__(self, model_name: str = RERANK_MODEL, max_chars: int = 2000):
+        self.model_name = model_name
+        self.max_chars = max_chars
+        self._model = None
+        self._lock = threading.Lock()
+
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name)
+            return self._model
+
+    def rerank(self, query: str, documents: List[Document], top_n: int) -> List[Document]:
+        if len(documents) <= 1:
+            return documents[:top_n]
+        scores = self.model().predict([(query, document.page_content[:self.max_chars]) for document in documents])
+        ranked = sorted(zip(documents, scores), key=lambda pair: -pair[1])
+        return [document for document, _ in ranked[:top_n]]
+
+
+class HybridRetriever(BaseRetriever):
+    """BM25 over code terms and vector similarity fused with reciprocal rank fusion, optionally reranked.
+
+    Each side returns ``fetch_k`` candidates, the best ``rerank_k`` fused ones go
+    to the cross-encoder when there is one, and only ``k`` reach the LLM.
+    """
+
+    vectorstore: Any
+    bm25: CodeBM25
+    reranker: Optional[CrossEncoderReranker] = None
+    k: int = 4
+    fetch_k: int = 20
+    rerank_k: int = 12
+    rrf_k: int = 60
+
+    def _get_relevant_documents(
+            self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        with span("retrieve", k=self.k, reranked=self.reranker is not None) as current:
+            vector = self.vectorstore.similarity_search(query, k=self.fetch_k)
+            lexical = [document for document, _ in self.bm25.search(query, self.fetch_k)]
+            fused = reciprocal_rank_fusion([lexical, vector], self.rrf_k)
+            current.set("candidates", len(fused))
+            if self.reranker is None:
+                return fused[:self.k]
+            return self.reranker.rerank(query, fused[:self.rerank_k], self.k)
@@ -0,0 +1,168 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+from langchain_community.document_loaders.blob_loaders import Blob
+from langchain_core.documents import Document
+
+
+class SplitterChunker:
+    """Parse one file with a LangChain parser and split it; picklable so it can run in worker processes."""
+
+    name = "splitter"
+
+    def __init__(self, parser, splitter):
+        self.parser = parser
+        self.splitter = splitter
+
+    def chunk(self, repo_path: str, path: str) -> List[Document]:
+        documents = []
+        for document in self.parser.lazy_parse(Blob.from_path(os.path.join(repo_path, path))):
+            document.metadata["source"] = path
+            documents.append(document)
+        return self.splitter.split_documents(documents)
+
+
+@dataclass
+class StageStats:
+    items: int = 0
+    busy_seconds: float = 0.0
+
+    @property
+    def rate(self):
+        return self.items / self.busy_seconds if self.busy_seconds else 0.0
+
+    def add(self, other: "StageStats"):
+        self.items += other.items
+        self.busy_seconds += other.busy_seconds
+
+
+@dataclass
+class IngestStats:
+    files: StageStats = field(default_factory=StageStats)
+    chunks: StageStats = field(default_factory=StageStats)
+    embeddings: StageStats = field(default_factory=StageStats)
+    seconds: float = 0.0
+
+    def add(self, other: "IngestStats"):
+        self.files.add(other.files)
+        self.chunks.add(other.chunks)
+        self.embeddings.add(other.embeddings)
+        self.seconds += other.seconds
+
+    def throughput(self):
+        wall = self.seconds or 1.0
+        return {
+            "files/s": self.files.items / wall,
+            "chunks/s": self.chunks.items / wall,
+            "embeddings/s": self.embeddings.items / wall,
+            "parse files/s per worker": self.files.rate,
+            "embed chunks/s while busy": self.embeddings.rate,
+        }
+
+
+_chunker: Optional[SplitterChunker] = None
+
+
+def _init_worker(chunker):
+    global _chunker
+    _chunker = chunker
+
+
+def _chunk_file(repo_path: str, path: str):
+    start = time.perf_counter()
+    if hasattr(_chunker, "analyze"):
+        documents, symbols = _chunker.analyze(repo_path, path)
+    else:
+        documents, symbols = _chunker.chunk(repo_path, path), []
+    return documents, symbols, time.perf_counter() - start
+
+
+def ingest(
+        repo_path: str,
+        paths: Iterable[str],
+        chunker,
+        db,
+        batch_size: int = 64,
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        progress=None,
+        on_symbols=None,
+        on_documents=None,
+) -> IngestStats:
+    """Files -> process pool (parse + split) -> bounded queue -> batched embedding into ``db``.
+
+    At most ``2 * workers`` files are in flight and at most ``queue_size`` chunks
+    wait for embedding, so memory stays flat whatever the repo size.
+    ``progress(stats)`` is called after every embedded batch and
+    ``on_symbols(symbols)`` after every file, for chunkers that extract symbols,
+    and ``on_documents(batch)`` after every batch stored in ``db``.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks: "queue.Queue[Optional[Document]]" = queue.Queue(maxsize=queue_size or batch_size * 4)
+    stats = IngestStats()
+    errors = []
+    start = time.perf_counter()
+
+    def embed_batches():
+        batch = []
+        while True:
+            chunk = chunks.get()
+            if chunk is not None:
+                batch.append(chunk)
+            if batch and (chunk is None or len(batch) >= batch_size):
+                if not errors:
+                    # Keep draining after a failure so the producer never blocks on a full queue
+                    try:
+                        embed_start = time.perf_counter()
+                        db.add_documents(batch)
+                        if on_documents is not None:
+                            on_documents(batch)
+                        stats.embeddings.busy_seconds += time.perf_counter() - embed_start
+                        stats.embeddings.items += len(batch)
+                        if progress is not None:
+                            progress(stats)
+                    except Exception as e:
+                        errors.append(e)
+                batch = []
+            if chunk is None:
+                return
+
+    embedder = threading.Thread(target=embed_batches, name="sage-embedder", daemon=True)
+    embedder.start()
+
+    def collect(done):
+        for future in done:
+            documents, symbols, seconds = future.result()
+            del pending[future]
+            if on_symbols is not None and symbols:
+                on_symbols(symbols)
+            stats.files.items += 1
+            stats.files.busy_seconds += seconds
+            stats.chunks.items += len(documents)
+            stats.chunks.busy_seconds += seconds
+            for document in documents:
+                chunks.put(document)
+
+    try:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(chunker,)) as pool:
+            pending = {}
+            for path in paths:
+                if errors:
+                    break
+                if len(pending) >= 2 * workers:
+                    collect(wait(pending, return_when=FIRST_COMPLETED).done)
+                pending[pool.submit(_chunk_file, repo_path, path)] = path
+            while pending:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+    finally:
+        chunks.put(None)
+        embedder.join()
+    if errors:
+        raise errors[0]
+    stats.seconds = time.perf_counter() - start
+    return stats
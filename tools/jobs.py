@@ -0,0 +1,365 @@
+import argparse
+import importlib
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import List, Optional
+
+from tools.page_cache import CACHE_DIR
+
+JOBS_DIR = os.path.join(CACHE_DIR, "jobs")
+# A running job whose worker has not written for this long is considered crashed
+STALE_SECONDS = 120
+POLL_SECONDS = 2
+HEARTBEAT_SECONDS = STALE_SECONDS / 4
+
+
+class JobCancelled(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    name: str
+    factory: str
+    kwargs: dict
+    status: str
+    created: float
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    heartbeat: Optional[float] = None
+    files_total: int = 0
+    files_done: int = 0
+    chunks: int = 0
+    eta_seconds: Optional[float] = None
+    cancel_requested: bool = False
+    work_dir: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def describe(self) -> str:
+        if self.status != "running":
+            return self.status
+        eta = f", ETA {self.eta_seconds:.0f}s" if self.eta_seconds is not None else ""
+        return f"running: {self.files_done}/{self.files_total} files, {self.chunks} chunks{eta}"
+
+
+class JobQueue:
+    """Ingestion jobs persisted in SQLite, shared by the app processes and the worker process."""
+
+    def __init__(self, path: Optional[str] = None):
+        path = path or os.path.join(JOBS_DIR, "jobs.sqlite")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, name TEXT NOT NULL, factory TEXT NOT NULL, kwargs TEXT NOT NULL,"
+            " status TEXT NOT NULL, created REAL NOT NULL, started REAL, finished REAL, heartbeat REAL,"
+            " files_total INTEGER NOT NULL DEFAULT 0, files_done INTEGER NOT NULL DEFAULT 0,"
+            " chunks INTEGER NOT NULL DEFAULT 0, eta_seconds REAL, cancel_requested INTEGER NOT NULL DEFAULT 0,"
+            " work_dir TEXT, error TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+        self._db.commit()
+
+    def _job(self, row) -> Optional[Job]:
+        if row is None:
+            return None
+        values = list(row)
+        values[3] = json.loads(values[3])
+        values[13] = bool(values[13])
+        return Job(*values)
+
+    def _one(self, query: str, args=()) -> Optional[Job]:
+        with self._lock:
+            return self._job(self._db.execute(query, args).fetchone())
+
+    def submit(self, name: str, factory: str, **kwargs) -> Job:
+        """Queue a refresh of index ``name``; an already queued or running job for it is returned instead."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT * FROM jobs WHERE name = ? AND status IN ('queued', 'running') ORDER BY created LIMIT 1", (name,)
+                ).fetchone()
+                if row is None:
+                    row = (str(uuid.uuid4()), name, factory, json.dumps(kwargs), "queued", time.time())
+                    self._db.execute("INSERT INTO jobs (id, name, factory, kwargs, status, created) VALUES (?, ?, ?, ?, ?, ?)", row)
+                    row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (row[0],)).fetchone()
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return self._job(row)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._one("SELECT * FROM jobs WHERE id = ?", (job_id,))
+
+    def latest(self, name: str) -> Optional[Job]:
+        return self._one("SELECT * FROM jobs WHERE name = ? ORDER BY created DESC LIMIT 1", (name,))
+
+    def list(self, limit: int = 20) -> List[Job]:
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def cancel(self, job_id: str):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'", (time.time(), job_id)
+            )
+            self._db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+            self._db.commit()
+
+    def claim(self) -> Optional[Job]:
+        """Take the oldest queued job, after requeueing running jobs whose worker died, so they resume."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND heartbeat < ?", (now - STALE_SECONDS,)
+                )
+                row = self._db.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'running', started = COALESCE(started, ?), heartbeat = ? WHERE id = ?",
+                        (now, now, row[0]),
+                    )
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return self.get(row[0]) if row is not None else None
+
+    def update(self, job_id: str, **fields) -> bool:
+        """Record progress and heartbeat; returns whether cancellation was requested."""
+        fields["heartbeat"] = time.time()
+        with self._lock:
+            self._db.execute(
+                f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+                (*fields.values(), job_id),
+            )
+            self._db.commit()
+            return bool(self._db.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()[0])
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None):
+        self.update(job_id, status=status, finished=time.time(), error=error, eta_seconds=None)
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Generations:
+    """Index directories of one named index; queries read the published one while a job builds the next.
+
+    A job works on a copy of the current generation, so incremental refreshes stay
+    incremental, and publishing only swaps the ``CURRENT`` pointer file. Processes
+    that read an index ``open`` it, which leases that generation to them;
+    superseded generations are removed once no live process holds a lease.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.pointer = os.path.join(root, "CURRENT")
+        self.readers = os.path.join(root, "readers")
+        os.makedirs(self.readers, exist_ok=True)
+
+    def current(self) -> Optional[str]:
+        if not os.path.exists(self.pointer):
+            return None
+        with open(self.pointer) as f:
+            return os.path.join(self.root, f.read().strip())
+
+    def open(self) -> Optional[str]:
+        """The current generation, leased to this process until it exits or opens another one."""
+        lease = os.path.join(self.readers, str(os.getpid()))
+        while True:
+            current = self.current()
+            if current is None:
+                return None
+            tmp_path = lease + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(os.path.basename(current))
+            os.replace(tmp_path, lease)
+            # A publish between reading the pointer and writing the lease may not have seen it
+            if self.current() == current:
+                return current
+
+    def leased(self) -> set:
+        names = set()
+        for reader in os.listdir(self.readers):
+            path = os.path.join(self.readers, reader)
+            if not reader.isdigit():
+                continue
+            if not process_alive(int(reader)):
+                with suppress(OSError):
+                    os.remove(path)
+                continue
+            with suppress(OSError), open(path) as f:
+                names.add(f.read().strip())
+        return names
+
+    def prepare(self) -> str:
+        work_dir = os.path.join(self.root, f"gen-{time.time_ns()}")
+        current = self.current()
+        if current is not None:
+            shutil.copytree(current, work_dir)
+        else:
+            os.makedirs(work_dir)
+        return work_dir
+
+    def publish(self, work_dir: str):
+        tmp_path = self.pointer + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(os.path.basename(work_dir))
+        os.replace(tmp_path, self.pointer)
+        # Leases are read after the swap, so a reader either leased an older generation by now or sees this one
+        held = self.leased()
+        published = os.path.basename(work_dir)
+        for name in os.listdir(self.root):
+            if name.startswith("gen-") and name < published and name not in held:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+
+def load_factory(path: str):
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def run_job(queue: JobQueue, job: Job):
+    generations = Generations(os.path.join(JOBS_DIR, "indexes", job.name))
+    work_dir = job.work_dir
+    if work_dir is None or not os.path.isdir(work_dir):
+        work_dir = generations.prepare()
+        queue.update(job.id, work_dir=work_dir)
+    started = time.perf_counter()
+
+    # Set by the heartbeat when a cancel arrives between progress reports
+    cancelled = threading.Event()
+
+    def progress(report):
+        elapsed = time.perf_counter() - started
+        rate = report.files_done / elapsed if elapsed and report.files_done else 0.0
+        eta = (report.files_total - report.files_done) / rate if rate else None
+        if queue.update(job.id, files_total=report.files_total, files_done=report.files_done,
+                        chunks=report.chunks, eta_seconds=eta) or cancelled.is_set():
+            raise JobCancelled(job.id)
+
+    # Cloning, diffing and deleting report no progress, keep the heartbeat fresh meanwhile
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(HEARTBEAT_SECONDS):
+            if queue.update(job.id):
+                cancelled.set()
+
+    threading.Thread(target=beat, name="sage-job-heartbeat", daemon=True).start()
+    try:
+        index = load_factory(job.factory)(index_dir=work_dir, **job.kwargs)
+        stats = index.refresh(progress=progress)
+        if cancelled.is_set():
+            raise JobCancelled(job.id)
+        if stats.full or stats.added or stats.modified or stats.deleted:
+            generations.publish(work_dir)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        queue.update(job.id, files_done=len(stats.added) + len(stats.modified), chunks=stats.chunks)
+        print(
+            f"Indexed {stats.commit[:12]} in {stats.seconds:.1f}s ({'full' if stats.full else 'incremental'}): "
+            f"{len(stats.added)} added, {len(stats.modified)} modified, {len(stats.deleted)} deleted, "
+            f"{stats.chunks} chunks; " + ", ".join(f"{value:.1f} {name}" for name, value in stats.throughput.items()),
+            flush=True,
+        )
+        queue.finish(job.id, "done")
+    except JobCancelled:
+        # The half-built copy is dropped, the published generation is untouched
+        shutil.rmtree(work_dir, ignore_errors=True)
+        queue.finish(job.id, "cancelled")
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        queue.finish(job.id, "failed", traceback.format_exc())
+    finally:
+        stop.set()
+
+
+def worker(queue: Optional[JobQueue] = None, once: bool = False):
+    queue = queue or JobQueue()
+    while True:
+        job = queue.claim()
+        if job is not None:
+            print(f"Running job {job.id} ({job.name})", flush=True)
+            run_job(queue, job)
+        elif once:
+            return
+        else:
+            time.sleep(POLL_SECONDS)
+
+
+def ensure_worker(queue: JobQueue, name: str) -> Optional[subprocess.Popen]:
+    """Start a worker process for ``name``'s queued job unless one is already making progress."""
+    job = queue.latest(name)
+    if job is None or not job.active:
+        return None
+    if job.status == "running" and job.heartbeat and time.time() - job.heartbeat < STALE_SECONDS:
+        return None
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    log = open(os.path.join(JOBS_DIR, "worker.log"), "a")
+    return subprocess.Popen(
+        [sys.executable, "-m", "tools.jobs", "--once"],
+        stdout=log, stderr=subprocess.STDOUT, start_new_session=True,
+    )
+
+
+def current_index_dir(name: str) -> Optional[str]:
+    """The published generation of index ``name``, kept on disk while this process runs."""
+    return Generations(os.path.join(JOBS_DIR, "indexes", name)).open()
+
+
+def cancel_latest(queue: JobQueue, name: str) -> Optional[Job]:
+    """Cancel ``name``'s queued or running job, if any; a running one stops at its next progress report."""
+    job = queue.latest(name)
+    if job is None or not job.active:
+        return None
+    queue.cancel(job.id)
+    return queue.get(job.id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run queued ingestion jobs, or cancel one.")
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    parser.add_argument("--cancel", metavar="NAME", help="cancel the active job of index NAME and exit")
+    args = parser.parse_args(argv)
+    if args.cancel:
+        job = cancel_latest(JobQueue(), args.cancel)
+        print(f"Job {job.id}: {job.status}" + (" (cancel requested)" if job.cancel_requested else "")
+              if job is not None else f"No active job for {args.cancel}")
+        return
+    worker(once=args.once)
+
+
+if __name__ == "__main__":
+    main()
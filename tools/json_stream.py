@@ -0,0 +1,90 @@
+import json
+import re
+from typing import Iterable, Iterator, List
+
+QUOTED_RE = re.compile(r'"((?:[^"\\]|\\.)+)"')
+LIST_ITEM_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*(.+?)\s*$")
+
+
+def _unescape(raw: str) -> str:
+    try:
+        return json.loads(f'"{raw}"')
+    except ValueError:
+        return raw
+
+
+class StringArrayStreamParser:
+    """Incremental parser for a JSON array of strings such as ``["query 1", "query 2"]``.
+
+    ``feed`` returns each string as soon as its closing quote arrives; ``close``
+    repairs whatever is left (an unterminated string, a bulleted list instead of
+    JSON) and returns only strings that were not emitted already.
+    """
+
+    def __init__(self):
+        self.raw = []
+        self.emitted = []
+        self._state = "before"
+        self._buffer = []
+        self._escaped = False
+
+    def _emit(self, value: str, out: List[str]):
+        value = value.strip()
+        if value and value not in self.emitted:
+            self.emitted.append(value)
+            out.append(value)
+
+    def feed(self, chunk: str) -> List[str]:
+        self.raw.append(chunk)
+        out = []
+        for char in chunk:
+            if self._state == "before":
+                if char == "[":
+                    self._state = "array"
+            elif self._state == "array":
+                if char == '"':
+                    self._state = "string"
+                elif char == "]":
+                    self._state = "done"
+            elif self._state == "string":
+                if self._escaped:
+                    self._buffer.append(char)
+                    self._escaped = False
+                elif char == "\\":
+                    self._buffer.append(char)
+                    self._escaped = True
+                elif char == '"':
+                    self._emit(_unescape("".join(self._buffer)), out)
+                    self._buffer = []
+                    self._state = "array"
+                else:
+                    self._buffer.append(char)
+        return out
+
+    def close(self) -> List[str]:
+        out = []
+        if self._state == "string":
+            # Output was cut off inside a string, keep what we have
+            self._emit(_unescape("".join(self._buffer).rstrip("\\")), out)
+        if self.emitted:
+            return out
+        text = "".join(self.raw)
+        for match in QUOTED_RE.finditer(text):
+            self._emit(_unescape(match.group(1)), out)
+        if not out:
+            for line in text.splitlines():
+                match = LIST_ITEM_RE.match(line)
+                if match:
+                    self._emit(match.group(1).strip('"'), out)
+        return out
+
+
+def iter_string_array(chunks: Iterable[str]) -> Iterator[str]:
+    parser = StringArrayStreamParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def parse_string_array(text: str) -> List[str]:
+    return list(iter_string_array([text]))
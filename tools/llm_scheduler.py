@@ -0,0 +1,361 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Any, Callable, Iterator, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from tools.deadline import Deadline, DeadlineExceeded, current_deadline
+from tools.passages import count_tokens
+from tools.tracing import record, span
+
+INTERACTIVE = 0
+DEFAULT = 1
+BACKGROUND = 2
+
+# Groq limits for llama3-8b-8192 on the free tier, override per account
+GROQ_RPM = int(os.getenv("SAGE_GROQ_RPM", "30"))
+GROQ_TPM = int(os.getenv("SAGE_GROQ_TPM", "30000"))
+LLM_CONCURRENCY = int(os.getenv("SAGE_LLM_CONCURRENCY", "8"))
+# Completion length assumed when a model has no max_tokens, corrected from usage afterwards
+COMPLETION_TOKENS = 512
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units over a minute, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # A single request larger than the bucket only has to wait for a full one
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.level -= amount
+
+    def give(self, amount: float):
+        # Refund (or charge, if negative) once actual usage is known; the level may go below zero
+        self.level = min(self.capacity, self.level + amount)
+
+
+def is_rate_limit(error: BaseException) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or "rate limit" in str(error).lower()
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def usage_tokens(message) -> Optional[int]:
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("total_tokens")
+    return getattr(message, "response_metadata", {}).get("token_usage", {}).get("total_tokens")
+
+
+class LLMScheduler:
+    """Process-wide gate in front of the LLM API.
+
+    Callers wait in priority order for a concurrency slot and for room in both the
+    requests-per-minute and tokens-per-minute buckets. A 429 pauses every caller
+    until the limit resets and the request is retried after a jittered backoff.
+    Identical prompts already in flight share one call.
+    """
+
+    def __init__(
+            self,
+            rpm: int = GROQ_RPM,
+            tpm: int = GROQ_TPM,
+            max_concurrency: int = LLM_CONCURRENCY,
+            max_retries: int = 5,
+            base_delay: float = 1.0,
+            max_delay: float = 60.0,
+    ):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._waiting: List[list] = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._paused_until = 0.0
+        self._inflight = {}
+        self._counters = {"calls": 0, "retries": 0, "rate_limited": 0, "coalesced": 0, "queued_seconds": 0.0}
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def acquire(self, priority: int, tokens: int, deadline: Optional[Deadline] = None):
+        """Block until the call may start; raises DeadlineExceeded if ``deadline`` runs out first."""
+        start = time.monotonic()
+        unregister = deadline.on_cancel(self._wake) if deadline is not None else None
+        with self._cond:
+            entry = [priority, next(self._sequence)]
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    if deadline is not None:
+                        deadline.check()
+                    timeout = None
+                    if self._waiting[0] is entry and self._active < self.max_concurrency:
+                        now = time.monotonic()
+                        timeout = max(
+                            self._paused_until - now, self.requests.wait(1, now), self.tokens.wait(tokens, now)
+                        )
+                        if timeout <= 0:
+                            heapq.heappop(self._waiting)
+                            self.requests.take(1, now)
+                            self.tokens.take(tokens, now)
+                            self._active += 1
+                            self._counters["queued_seconds"] += now - start
+                            self._cond.notify_all()
+                            return
+                    remaining = deadline.remaining() if deadline is not None else None
+                    if remaining is not None:
+                        timeout = remaining if timeout is None else min(timeout, remaining)
+                    self._cond.wait(timeout)
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            finally:
+                if unregister is not None:
+                    unregister()
+
+    def release(self, estimated: int, actual: Optional[int] = None):
+        with self._cond:
+            self._active -= 1
+            if actual is not None:
+                self.tokens.give(estimated - actual)
+            self._cond.notify_all()
+
+    def _backoff(self, error: BaseException, attempt: int, deadline: Optional[Deadline] = None):
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        with self._cond:
+            self._counters["rate_limited"] += 1
+            self._counters["retries"] += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + (retry_after(error) or delay))
+            self._cond.notify_all()
+        # Full jitter, so paused callers do not all retry in the same instant
+        (deadline or Deadline()).wait(random.uniform(0, delay))
+
+    def call(
+            self, fn: Callable[[], Any], priority: int = DEFAULT, tokens: int = COMPLETION_TOKENS,
+            deadline: Optional[Deadline] = None,
+    ):
+        with span("llm", priority=priority, estimated_tokens=tokens) as current:
+            for attempt in range(self.max_retries + 1):
+                queued = time.monotonic()
+                self.acquire(priority, tokens, deadline)
+                current.add("queued_seconds", time.monotonic() - queued)
+                try:
+                    result = fn()
+                except Exception as e:
+                    self.release(tokens)
+                    if attempt < self.max_retries and is_rate_limit(e):
+                        current.add("retries")
+                        self._backoff(e, attempt, deadline)
+                        continue
+                    raise
+                actual = usage_tokens(result)
+                self.release(tokens, actual)
+                if actual is not None:
+                    current.set("tokens", actual)
+                with self._cond:
+                    self._counters["calls"] += 1
+                return result
+
+    def run(
+            self, key, fn: Callable[[], Any], priority: int = DEFAULT, tokens: int = COMPLETION_TOKENS,
+            deadline: Optional[Deadline] = None,
+    ):
+        """``call`` with coalescing: a second caller with the same ``key`` waits for the first one's result.
+
+        A leader stopped by its own deadline does not fail its followers, the
+        first of them to notice makes the call again under its own deadline.
+        """
+        while True:
+            with self._cond:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+                else:
+                    self._counters["coalesced"] += 1
+            if leader:
+                break
+            try:
+                return self._follow(future, deadline)
+            except DeadlineExceeded:
+                if deadline is not None:
+                    deadline.check()
+        try:
+            result = self.call(fn, priority, tokens, deadline)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._cond:
+                self._inflight.pop(key, None)
+
+    @staticmethod
+    def _follow(future: Future, deadline: Optional[Deadline]):
+        if deadline is None:
+            return future.result()
+        done = threading.Event()
+        future.add_done_callback(lambda _: done.set())
+        unregister = deadline.on_cancel(done.set)
+        try:
+            done.wait(deadline.remaining())
+        finally:
+            unregister()
+        if not future.done():
+            deadline.check()
+        return future.result()
+
+    def stream(
+            self, fn: Callable[[], Iterator], priority: int = DEFAULT, tokens: int = COMPLETION_TOKENS,
+            deadline: Optional[Deadline] = None,
+    ) -> Iterator:
+        # Retried only until the first chunk arrives, a partial answer cannot be replayed
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority, tokens, deadline)
+            queued = time.monotonic() - started
+            try:
+                chunks = iter(fn())
+                first = next(chunks, None)
+            except Exception as e:
+                self.release(tokens)
+                if attempt < self.max_retries and is_rate_limit(e):
+                    self._backoff(e, attempt, deadline)
+                    continue
+                raise
+            first_chunk = time.monotonic() - started
+            streamed = 0
+            # Streams report usage on their last chunk, if at all
+            actual = usage_tokens(first) if first is not None else None
+            try:
+                if first is not None:
+                    streamed += 1
+                    yield first
+                for chunk in chunks:
+                    # Closing the stream stops the generation a dropped request no longer needs
+                    if deadline is not None:
+                        deadline.check()
+                    streamed += 1
+                    actual = usage_tokens(chunk) or actual
+                    yield chunk
+            finally:
+                if hasattr(chunks, "close"):
+                    chunks.close()
+                self.release(tokens, actual)
+                with self._cond:
+                    self._counters["calls"] += 1
+                # A span cannot stay open across yields, the stream is recorded once it ends
+                record(
+                    "llm", time.monotonic() - started, priority=priority, estimated_tokens=tokens,
+                    queued_seconds=queued, first_chunk_seconds=first_chunk, chunks=streamed, retries=attempt,
+                    **({"tokens": actual} if actual is not None else {}),
+                )
+            return
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {**self._counters, "active": self._active, "waiting": len(self._waiting)}
+
+
+@lru_cache(maxsize=1)
+def shared_scheduler() -> LLMScheduler:
+    return LLMScheduler()
+
+
+class ScheduledChatModel(BaseChatModel):
+    """Chat model that sends every call of ``llm`` through the shared scheduler at ``priority``."""
+
+    llm: BaseChatModel
+    priority: int = DEFAULT
+
+    @property
+    def _llm_type(self) -> str:
+        return f"scheduled-{self.llm._llm_type}"
+
+    @property
+    def model_name(self):
+        # Read by chain_namespace, so cached responses survive wrapping
+        return getattr(self.llm, "model_name", None) or getattr(self.llm, "model", "")
+
+    @property
+    def temperature(self):
+        return getattr(self.llm, "temperature", None)
+
+    def _estimate(self, messages: List[BaseMessage]) -> int:
+        prompt = sum(count_tokens(str(message.content)) + 4 for message in messages)
+        return prompt + (getattr(self.llm, "max_tokens", None) or COMPLETION_TOKENS)
+
+    def _generate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        key = (self.model_name, self.temperature, tuple((m.type, str(m.content)) for m in messages), tuple(stop or ()),
+               repr(sorted(kwargs.items())))
+        message = shared_scheduler().run(
+            key, lambda: self.llm.invoke(messages, stop=stop, **kwargs), self.priority, self._estimate(messages),
+            current_deadline.get(),
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        chunks = shared_scheduler().stream(
+            lambda: self.llm.stream(messages, stop=stop, **kwargs), self.priority, self._estimate(messages),
+            current_deadline.get(),
+        )
+        for chunk in chunks:
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                run_manager.on_llm_new_token(str(chunk.content), chunk=generation)
+            yield generation
+
+
+def scheduled(llm: BaseChatModel, priority: int = DEFAULT) -> ScheduledChatModel:
+    return ScheduledChatModel(llm=llm, priority=priority)
@@ -0,0 +1,143 @@
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+WORD_RE = re.compile(r"\w+")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from", "how", "i", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "what", "when", "where", "which", "with", "you",
+}
+
+
+_encoding_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _load_encoding():
+    # Groq does not publish the llama3 tokenizer, cl100k_base is close enough for budgeting
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # The BPE file is downloaded on first use, offline there may be none
+        logger.warning("tiktoken encoding unavailable, estimating 4 characters per token: %s", e)
+        return None
+
+
+def encoding():
+    # Concurrent first calls would each try the download
+    with _encoding_lock:
+        return _load_encoding()
+
+
+def count_tokens(text: str) -> int:
+    tokens = encoding()
+    if tokens is None:
+        return (len(text) + 3) // 4
+    return len(tokens.encode(text, disallowed_special=()))
+
+
+def terms(text: str) -> List[str]:
+    return [word for word in WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+
+
+def split_passages(text: str, max_words: int = 80) -> List[str]:
+    passages, current, length = [], [], 0
+    for sentence in SENTENCE_RE.split(text):
+        words = sentence.split()
+        # Code and tables rarely have sentence breaks, cut them at max_words
+        while words:
+            room = max_words - length
+            current.append(" ".join(words[:room]))
+            length += len(words[:room])
+            words = words[room:]
+            if length >= max_words:
+                passages.append(" ".join(current))
+                current, length = [], 0
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+def bm25_scores(query: str, passages: List[str], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    query_terms = set(terms(query))
+    docs = [Counter(terms(passage)) for passage in passages]
+    if not docs or not query_terms:
+        return [0.0] * len(passages)
+    avg_length = sum(sum(doc.values()) for doc in docs) / len(docs) or 1.0
+    idf = {}
+    for term in query_terms:
+        df = sum(1 for doc in docs if term in doc)
+        idf[term] = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+    scores = []
+    for doc in docs:
+        length = sum(doc.values())
+        score = 0.0
+        for term in query_terms:
+            tf = doc.get(term, 0)
+            if tf:
+                score += idf[term] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length))
+        scores.append(score)
+    return scores
+
+
+@dataclass
+class Selection:
+    text: str
+    tokens_in: int
+    tokens_out: int
+
+    @property
+    def tokens_saved(self):
+        return self.tokens_in - self.tokens_out
+
+
+def select_passages(text: str, question: str, token_budget: int = 1500) -> Selection:
+    """Keep the passages that best match ``question`` within ``token_budget`` tokens, in page order."""
+    passages = split_passages(text)
+    lengths = [count_tokens(passage) for passage in passages]
+    tokens_in = sum(lengths)
+    if tokens_in <= token_budget:
+        return Selection(text, tokens_in, tokens_in)
+
+    scores = bm25_scores(question, passages)
+    ranked = sorted(range(len(passages)), key=lambda i: -scores[i])
+    # Nothing matches the question, fall back to the start of the page
+    prefix = not any(scores)
+    if prefix:
+        ranked = list(range(len(passages)))
+    chosen, used = [], 0
+    for i in ranked:
+        if used + lengths[i] <= token_budget:
+            chosen.append(i)
+            used += lengths[i]
+        elif prefix:
+            # A later, shorter passage would not be the start of the page
+            break
+    return Selection("\n\n".join(passages[i] for i in sorted(chosen)), tokens_in, used)
+
+
+class TokenSavings:
+    def __init__(self):
+        self.pages = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self._lock = threading.Lock()
+
+    def add(self, selection: Selection):
+        with self._lock:
+            self.pages += 1
+            self.tokens_in += selection.tokens_in
+            self.tokens_out += selection.tokens_out
+
+    @property
+    def tokens_saved(self):
+        return self.tokens_in - self.tokens_out
@@ -0,0 +1,253 @@
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from fnmatch import fnmatch
+from typing import List, Optional, Sequence
+
+from git import BadName, Repo
+from langchain_chroma import Chroma
+
+from tools.code_chunker import AstChunker
+from tools.hybrid_retriever import CodeBM25
+from tools.git_clone import CloneOptions, clone, fetch
+from tools.ingest import IngestStats, ingest
+from tools.page_cache import CACHE_DIR
+from tools.symbol_index import SymbolIndex
+from tools.vector_store import QuantizedVectorStore
+
+INDEX_DIR = os.path.join(CACHE_DIR, "repo_index")
+
+
+@dataclass
+class IndexState:
+    remote: str
+    subpath: str
+    commit: Optional[str] = None
+    chunker: str = ""
+    store: str = "chroma"
+    files: int = 0
+    chunks: int = 0
+    resume: Optional[dict] = None
+
+
+@dataclass
+class RefreshStats:
+    commit: str
+    full: bool
+    added: List[str] = field(default_factory=list)
+    modified: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    chunks: int = 0
+    seconds: float = 0.0
+    embedding_cache: dict = field(default_factory=dict)
+    throughput: dict = field(default_factory=dict)
+
+
+@dataclass
+class RefreshProgress:
+    files_total: int
+    files_done: int = 0
+    chunks: int = 0
+
+
+class RepoIndex:
+    """Vector index of a git repository subpath that remembers the commit it was built from.
+
+    ``refresh`` fetches the remote and only re-embeds files changed since that
+    commit; vectors of deleted files are removed. A symbol index of the same
+    files is kept in step for exact identifier lookups.
+    """
+
+    def __init__(
+            self,
+            repo_url: str,
+            repo_path: str,
+            subpath: str,
+            embeddings,
+            index_dir: Optional[str] = None,
+            suffixes: Sequence[str] = (".py",),
+            exclude: Sequence[str] = ("**/non-utf8-encoding.py",),
+            batch_size: int = 64,
+            workers: Optional[int] = None,
+            clone_options: Optional[CloneOptions] = None,
+            quantized: bool = False,
+    ):
+        self.repo_url = repo_url
+        self.repo_path = repo_path
+        self.subpath = subpath.strip("/")
+        self.suffixes = tuple(suffixes)
+        self.exclude = tuple(exclude)
+        self.index_dir = index_dir or os.path.join(INDEX_DIR, os.path.basename(repo_path.rstrip("/")))
+        self.state_path = os.path.join(self.index_dir, "state.json")
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        # A full clone unless asked otherwise, depth/filter/sparse options are opt-in
+        self.clone_options = clone_options or CloneOptions(depth=None, blob_filter=None)
+        self.workers = workers
+        self.chunker = AstChunker(max_chars=2000)
+        os.makedirs(self.index_dir, exist_ok=True)
+        # int8 + IVF store for large multi-repo setups, Chroma otherwise
+        self.store = "quantized" if quantized else "chroma"
+        if quantized:
+            self.db = QuantizedVectorStore(os.path.join(self.index_dir, "quantized"), embeddings)
+        else:
+            self.db = Chroma(
+                collection_name="repo",
+                embedding_function=embeddings,
+                persist_directory=os.path.join(self.index_dir, "chroma"),
+            )
+        symbols_path = os.path.join(self.index_dir, "symbols.sqlite")
+        has_symbols = os.path.exists(symbols_path)
+        self.symbols = SymbolIndex(symbols_path, repo_path)
+        bm25_path = os.path.join(self.index_dir, "bm25.sqlite")
+        has_bm25 = os.path.exists(bm25_path)
+        self.bm25 = CodeBM25(bm25_path)
+        self.state = self._load_state()
+        if not has_bm25 and self.state.commit is not None:
+            self.bm25.add_store(self.db)
+        if not has_symbols:
+            # Built before symbols were extracted, rebuild so both indexes cover the same files
+            self.state = IndexState(self.repo_url, self.subpath, chunker=self.chunker.name, store=self.store)
+        self.symbols.commit = self.state.commit
+
+    def _load_state(self) -> IndexState:
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                state = IndexState(**json.load(f))
+            # A different chunker means every stored chunk is stale, a different store starts empty
+            if (state.remote, state.subpath, state.chunker, state.store) == (
+                    self.repo_url, self.subpath, self.chunker.name, self.store):
+                return state
+        return IndexState(self.repo_url, self.subpath, chunker=self.chunker.name, store=self.store)
+
+    def _save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(asdict(self.state), f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def wanted(self, path: str) -> bool:
+        return (
+                path.startswith(self.subpath + "/")
+                and path.endswith(self.suffixes)
+                and not any(fnmatch(path, pattern) for pattern in self.exclude)
+        )
+
+    def open_repo(self) -> Repo:
+        # Reuse an existing checkout instead of failing on it
+        if os.path.isdir(os.path.join(self.repo_path, ".git")):
+            repo = Repo(self.repo_path)
+            fetch(self.repo_url, repo, self.clone_options)
+            return repo
+        return clone(self.repo_url, self.repo_path, self.clone_options)
+
+    def index_files(self, paths: List[str], progress=None):
+        return ingest(
+            self.repo_path, paths, self.chunker, self.db, self.batch_size, self.workers,
+            progress=progress, on_symbols=self.symbols.add, on_documents=self.bm25.add,
+        )
+
+    def delete_files(self, paths: List[str]) -> int:
+        deleted = 0
+        for path in paths:
+            ids = self.db.get(where={"source": path}, include=[])["ids"]
+            if ids:
+                self.db.delete(ids)
+                deleted += len(ids)
+        return deleted
+
+    def refresh(self, progress=None, checkpoint_files: int = 200) -> RefreshStats:
+        """Bring the index to the remote head.
+
+        Files are ingested in batches of ``checkpoint_files`` and the state is saved
+        after each one, so a refresh that crashed or was cancelled resumes where it
+        stopped. ``progress(RefreshProgress)`` is called after every embedded batch
+        and may raise to cancel; it is also called once the clone or fetch and once
+        the diff are done, so a cancel need not wait for the first batch.
+        """
+        start = time.perf_counter()
+        repo = self.open_repo()
+        if progress is not None:
+            progress(RefreshProgress(files_total=0))
+        head = repo.head.commit
+        if self.state.commit == head.hexsha:
+            return RefreshStats(head.hexsha, full=False, seconds=time.perf_counter() - start)
+
+        base = None
+        if self.state.commit is not None:
+            try:
+                base = repo.commit(self.state.commit)
+            except (ValueError, BadName):
+                # A fresh shallow clone need not have the indexed commit, rebuild from scratch
+                self.state.commit = None
+                self.state.resume = None
+        plan = {"base": self.state.commit, "target": head.hexsha}
+        resume = self.state.resume if self.state.resume and self.state.resume.items() >= plan.items() else None
+        done = set(resume["done"]) if resume else set()
+        if self.state.commit is None:
+            if resume is None:
+                self.db.reset_collection()
+                self.symbols.reset()
+                self.bm25.reset()
+                self.state.files = self.state.chunks = 0
+            paths = sorted(
+                item.path for item in head.tree.traverse() if item.type == "blob" and self.wanted(item.path)
+            )
+            stats = RefreshStats(head.hexsha, full=True, added=paths)
+        else:
+            stats = RefreshStats(head.hexsha, full=False)
+            for diff in base.diff(head, paths=self.subpath):
+                if diff.change_type in ("D", "R") and self.wanted(diff.a_path):
+                    stats.deleted.append(diff.a_path)
+                if diff.change_type in ("A", "R", "C") and self.wanted(diff.b_path):
+                    stats.added.append(diff.b_path)
+                elif diff.change_type in ("M", "T") and self.wanted(diff.b_path):
+                    stats.modified.append(diff.b_path)
+        todo = [path for path in stats.added + stats.modified if path not in done]
+        report = RefreshProgress(files_total=len(stats.added) + len(stats.modified), files_done=len(done))
+        if progress is not None:
+            progress(report)
+        if resume is not None or not stats.full:
+            # Files not checkpointed yet are cleared too, they may be partly indexed
+            cleared = [path for path in stats.deleted if path not in done] + todo
+            self.state.chunks -= self.delete_files(cleared)
+            self.symbols.delete_files(cleared)
+            self.bm25.delete_sources(cleared)
+        self.state.resume = {**plan, "done": sorted(done)}
+        self._save_state()
+
+        cache_before = self.embeddings.stats() if hasattr(self.embeddings, "stats") else None
+        total = IngestStats()
+        for offset in range(0, len(todo), checkpoint_files):
+            batch = todo[offset:offset + checkpoint_files]
+
+            def batch_progress(ingest_stats, files_done=report.files_done, chunks=report.chunks):
+                report.files_done = files_done + ingest_stats.files.items
+                report.chunks = chunks + ingest_stats.embeddings.items
+                if progress is not None:
+                    progress(report)
+
+            ingest_stats = self.index_files(batch, batch_progress)
+            total.add(ingest_stats)
+            done.update(batch)
+            report.files_done = len(done)
+            self.state.chunks += ingest_stats.embeddings.items
+            self.state.resume["done"] = sorted(done)
+            self._save_state()
+        stats.chunks = total.embeddings.items
+        stats.throughput = total.throughput()
+        if cache_before is not None:
+            cache_after = self.embeddings.stats()
+            hits = cache_after["hits"] - cache_before["hits"]
+            lookups = hits + cache_after["misses"] - cache_before["misses"]
+            stats.embedding_cache = {"hits": hits, "lookups": lookups, "hit_ratio": hits / lookups if lookups else 0.0}
+
+        self.state.commit = head.hexsha
+        self.state.files += len(stats.added) - len(stats.deleted)
+        self.state.resume = None
+        self._save_state()
+        self.symbols.load()
+        self.symbols.commit = self.state.commit
+        stats.seconds = time.perf_counter() - start
+        return stats
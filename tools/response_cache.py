@@ -0,0 +1,235 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.runnables import Runnable
+
+from tools.page_cache import CACHE_DIR
+from tools.tracing import current_span
+
+HEX_ADDRESS_RE = re.compile(r"0x[0-9a-fA-F]+")
+SEMANTIC_CACHE = os.getenv("SAGE_SEMANTIC_CACHE", "false").lower() == "true"
+SEMANTIC_CACHE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def normalize_prompt(text: str) -> str:
+    # Object addresses in tracebacks differ between runs of the same error
+    return " ".join(HEX_ADDRESS_RE.sub("0x", text).split())
+
+
+def chain_namespace(prompt, llm, fields: str = "") -> str:
+    # Any change to the template, model, temperature or matched fields starts a new namespace
+    model = getattr(llm, "model_name", None) or getattr(llm, "model", "")
+    temperature = getattr(llm, "temperature", "")
+    return hashlib.sha256(f"{model}|{temperature}|{fields}|{prompt.pretty_repr()}".encode("utf-8")).hexdigest()[:16]
+
+
+class ResponseCache:
+    """Two-tier LLM response cache persisted in SQLite.
+
+    Exact hits match the normalized prompt within a namespace (template, model,
+    temperature). If ``embed`` is given, misses fall back to the cached entry of
+    the same namespace and scope whose embedded inputs are most similar, above
+    ``similarity_threshold``.
+    """
+
+    def __init__(
+            self,
+            path: Optional[str] = None,
+            embed: Optional[Callable[[str], List[float]]] = None,
+            similarity_threshold: float = 0.95,
+            ttl: float = 7 * 24 * 3600,
+            max_entries: int = 5000,
+    ):
+        path = path or os.path.join(CACHE_DIR, "responses.sqlite")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, chain TEXT NOT NULL, namespace TEXT NOT NULL, response TEXT NOT NULL,"
+            " embedding BLOB, created_at REAL NOT NULL, accessed_at REAL NOT NULL, scope TEXT NOT NULL DEFAULT '')"
+        )
+        if "scope" not in {row[1] for row in self._db.execute("PRAGMA table_info(responses)")}:
+            self._db.execute("ALTER TABLE responses ADD COLUMN scope TEXT NOT NULL DEFAULT ''")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_namespace ON responses (namespace)")
+        self._db.commit()
+
+    @staticmethod
+    def _key(namespace: str, prompt: str) -> str:
+        return hashlib.sha256(f"{namespace}|{prompt}".encode("utf-8")).hexdigest()
+
+    def invalidate_stale(self, chain: str, namespace: str):
+        # Entries written by an older version of this chain's prompt can never hit again
+        with self._lock:
+            self._db.execute("DELETE FROM responses WHERE chain = ? AND namespace != ?", (chain, namespace))
+            self._db.commit()
+
+    def get(
+            self, namespace: str, prompt: str, embedding: Optional[np.ndarray] = None, scope: str = "",
+    ) -> Optional[str]:
+        cached = self.get_exact(namespace, prompt)
+        if cached is None and embedding is not None:
+            cached = self.get_similar(namespace, embedding, scope)
+        if cached is None:
+            self.record_miss()
+        return cached
+
+    def get_exact(self, namespace: str, prompt: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            key = self._key(namespace, prompt)
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.exact_hits += 1
+                self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return row[0] if row is not None else None
+
+    def get_similar(self, namespace: str, embedding: np.ndarray, scope: str = "") -> Optional[str]:
+        with self._lock:
+            row = self._nearest(namespace, embedding, scope)
+            if row is None:
+                return None
+            self.semantic_hits += 1
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), row[1]))
+            self._db.commit()
+            return row[0]
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def _nearest(self, namespace: str, embedding: np.ndarray, scope: str):
+        rows = self._db.execute(
+            "SELECT response, key, embedding FROM responses WHERE namespace = ? AND scope = ? AND length(embedding) = ?",
+            (namespace, scope, embedding.astype(np.float32).nbytes),
+        ).fetchall()
+        if not rows:
+            return None
+        matrix = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+        similarities = matrix @ embedding
+        best = int(similarities.argmax())
+        return rows[best] if similarities[best] >= self.similarity_threshold else None
+
+    def put(
+            self, chain: str, namespace: str, prompt: str, response: str,
+            embedding: Optional[np.ndarray] = None, scope: str = "",
+    ):
+        now = time.time()
+        blob = embedding.astype(np.float32).tobytes() if embedding is not None else None
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses"
+                " (key, chain, namespace, response, embedding, created_at, accessed_at, scope)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._key(namespace, prompt), chain, namespace, response, blob, now, now, scope),
+            )
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def embedding(self, text: str) -> Optional[np.ndarray]:
+        if self.embed is None:
+            return None
+        vector = np.asarray(self.embed(text), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def wrap(self, chain, name: str, prompt, llm, exact_fields: Sequence[str] = ()):
+        """Runnable that answers from the cache before invoking or streaming ``chain``.
+
+        Semantic hits compare only the prompt's input variables, and only between
+        entries whose ``exact_fields`` inputs are identical.
+        """
+        return CachedChain(self, chain, name, prompt, llm, exact_fields)
+
+    def stats(self):
+        with self._lock:
+            exact_hits, semantic_hits, misses = self.exact_hits, self.semantic_hits, self.misses
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = exact_hits + semantic_hits + misses
+        return {
+            "exact_hits": exact_hits,
+            "semantic_hits": semantic_hits,
+            "misses": misses,
+            "hit_rate": (exact_hits + semantic_hits) / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+
+class CachedChain(Runnable):
+    def __init__(self, cache: ResponseCache, chain: Runnable, name: str, prompt, llm, exact_fields: Sequence[str] = ()):
+        self.cache = cache
+        self.chain = chain
+        self.name = name
+        self.prompt = prompt
+        self.exact_fields = sorted(exact_fields)
+        self.semantic_fields = sorted(set(prompt.input_variables) - set(exact_fields))
+        self.namespace = chain_namespace(prompt, llm, f"{self.semantic_fields}|{self.exact_fields}")
+        cache.invalidate_stale(name, self.namespace)
+
+    def _lookup(self, inputs):
+        text = normalize_prompt(self.prompt.format(**inputs))
+        scope = ""
+        if self.exact_fields:
+            exact = "\n\n".join(normalize_prompt(str(inputs[f])) for f in self.exact_fields)
+            scope = hashlib.sha256(exact.encode("utf-8")).hexdigest()
+        embedding = None
+        cached = self.cache.get_exact(self.namespace, text)
+        if cached is None and self.cache.embed is not None:
+            # Only embedded on an exact miss. The shared template would dominate the embedding
+            # (and MiniLM truncates at 256 tokens), so only the user's inputs are compared
+            embedding = self.cache.embedding("\n\n".join(normalize_prompt(str(inputs[f])) for f in self.semantic_fields))
+            cached = self.cache.get_similar(self.namespace, embedding, scope)
+        if cached is None:
+            self.cache.record_miss()
+        current_span().add("response_cache_hits" if cached is not None else "response_cache_misses")
+        return text, embedding, scope, cached
+
+    def invoke(self, input, config=None, **kwargs):
+        text, embedding, scope, cached = self._lookup(input)
+        if cached is not None:
+            return cached
+        response = self.chain.invoke(input, config, **kwargs)
+        self.cache.put(self.name, self.namespace, text, response, embedding, scope)
+        return response
+
+    def stream(self, input, config=None, **kwargs):
+        text, embedding, scope, cached = self._lookup(input)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        for chunk in self.chain.stream(input, config, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        # Only completed streams are cached, an abandoned one is not a full answer
+        self.cache.put(self.name, self.namespace, text, "".join(chunks), embedding, scope)
+
+
+@lru_cache(maxsize=1)
+def shared_response_cache():
+    # One cache per process, Streamlit reruns reuse the loaded embedding model
+    if not SEMANTIC_CACHE:
+        return ResponseCache()
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    embeddings = HuggingFaceEmbeddings(model_name=SEMANTIC_CACHE_MODEL)
+    return ResponseCache(embed=embeddings.embed_query)
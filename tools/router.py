@@ -0,0 +1,63 @@
+import re
+from dataclasses import dataclass
+
+CODE_SEARCH_AGENT = "🖥️ Code Search Agent"
+DOCUMENTATION_SEARCH_AGENT = "📘 Documentation Search Agent"
+
+AGENT_ROLE_PROMPTS = {
+    CODE_SEARCH_AGENT: "You are a seasoned software development assistant AI. Your primary goal is to compose "
+                       "comprehensive, insightful, and methodically arranged search queries to find relevant code "
+                       "snippets and documentation.",
+    DOCUMENTATION_SEARCH_AGENT: "You are an experienced documentation search assistant AI. Your main objective is to "
+                                "produce comprehensive and insightful search queries to find relevant documentation "
+                                "for the specified programming topic.",
+}
+
+# (pattern, weight) pairs; phrases count more than single words
+AGENT_KEYWORDS = {
+    CODE_SEARCH_AGENT: [
+        (r"\bhow (do i|to|can i)\b", 2.0),
+        (r"\b(implement|implementation|write|build|create|convert|parse|sort|optimi[sz]e)\b", 1.5),
+        (r"\b(example|examples|snippet|snippets|sample|code|script|algorithm)\b", 1.5),
+        (r"\b(error|exception|bug|fix|traceback|debug|not working)\b", 1.0),
+        (r"\b(function|class|loop|recursion|regex)\b", 0.5),
+    ],
+    DOCUMENTATION_SEARCH_AGENT: [
+        (r"\b(documentation|docs|reference|manual|specification|spec)\b", 2.5),
+        (r"\b(api|changelog|release notes|migration guide|guide|tutorial)\b", 1.5),
+        (r"\b(parameters?|arguments?|signature|options|config(uration)?|settings)\b", 1.0),
+        (r"\b(library|module|package|framework|version)\b", 0.5),
+        (r"\bwhat (is|are|does)\b", 0.5),
+    ],
+}
+COMPILED_KEYWORDS = {
+    agent: [(re.compile(pattern), weight) for pattern, weight in keywords]
+    for agent, keywords in AGENT_KEYWORDS.items()
+}
+
+
+@dataclass
+class Route:
+    agent: str
+    confidence: float
+
+    @property
+    def agent_role_prompt(self):
+        return AGENT_ROLE_PROMPTS[self.agent]
+
+
+def route_task(task: str) -> Route:
+    """Pick the search agent for ``task`` from keyword rules, no LLM call.
+
+    ``confidence`` is the winning margin in [0, 1]; 0 means no rule matched or a tie.
+    """
+    task = task.lower()
+    scores = {
+        agent: sum(weight for pattern, weight in keywords if pattern.search(task))
+        for agent, keywords in COMPILED_KEYWORDS.items()
+    }
+    code, docs = scores[CODE_SEARCH_AGENT], scores[DOCUMENTATION_SEARCH_AGENT]
+    if code == docs:
+        return Route(CODE_SEARCH_AGENT, 0.0)
+    agent = CODE_SEARCH_AGENT if code > docs else DOCUMENTATION_SEARCH_AGENT
+    return Route(agent, abs(code - docs) / (code + docs))
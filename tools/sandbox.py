@@ -0,0 +1,284 @@
+import logging
+import os
+import re
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from tools.deadline import Deadline
+from tools.page_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+SANDBOX_TIMEOUT = float(os.getenv("SAGE_SANDBOX_TIMEOUT", "10"))
+SANDBOX_MEMORY_MB = int(os.getenv("SAGE_SANDBOX_MEMORY_MB", "512"))
+SANDBOX_WORKERS = int(os.getenv("SAGE_SANDBOX_WORKERS", str(os.cpu_count() or 2)))
+# Without namespaces generated code could read .env and the cache, only for code you trust
+SANDBOX_ALLOW_UNISOLATED = os.getenv("SAGE_SANDBOX_ALLOW_UNISOLATED", "false").lower() == "true"
+MAX_OUTPUT_CHARS = 4000
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOUNTINFO_ESCAPE_RE = re.compile(r"\\([0-7]{3})")
+CODE_BLOCK_RE = re.compile(r"```[ \t]*(?:python3?|py)?[ \t]*\n(.*?)```", re.DOTALL | re.IGNORECASE)
+
+# Runs in the child before the generated code is imported; limits cannot be raised again once lowered.
+# The socket patch only stops accidents, ``import _socket`` gets around it, the namespace is the boundary
+PRELUDE = """\
+import resource, socket, sys
+resource.setrlimit(resource.RLIMIT_CPU, ({cpu}, {cpu} + 1))
+resource.setrlimit(resource.RLIMIT_AS, ({memory}, {memory}))
+resource.setrlimit(resource.RLIMIT_FSIZE, (16 * 2 ** 20, 16 * 2 ** 20))
+def _no_network(*args, **kwargs):
+    raise OSError("network access is disabled in the sandbox")
+for _name in ("connect", "connect_ex", "bind", "sendto"):
+    setattr(socket.socket, _name, _no_network)
+socket.getaddrinfo = socket.create_connection = _no_network
+sys.path.insert(0, ".")
+"""
+
+
+class SandboxUnavailable(RuntimeError):
+    pass
+
+
+@dataclass
+class SandboxResult:
+    status: str
+    seconds: float
+    returncode: Optional[int] = None
+    stdout: str = ""
+    stderr: str = ""
+
+    @property
+    def passed(self):
+        return self.status == "passed"
+
+    def error(self) -> str:
+        """Last lines of the traceback, short enough to show a model."""
+        if self.status == "timeout":
+            return f"Timed out after {self.seconds:.1f}s"
+        if self.status == "cancelled":
+            return "Cancelled"
+        lines = [line for line in self.stderr.strip().splitlines() if line.strip()]
+        return "\n".join(lines[-6:]) or f"Exited with status {self.returncode}"
+
+
+def extract_code(text: str, entry_point: Optional[str] = None) -> str:
+    """Python code of a markdown answer: the fenced block defining ``entry_point``, else all blocks, else the text."""
+    blocks = CODE_BLOCK_RE.findall(text)
+    if not blocks:
+        return text
+    if entry_point is not None:
+        defining = [block for block in blocks if re.search(rf"^\s*(?:async\s+)?def\s+{re.escape(entry_point)}\b", block, re.M)]
+        if defining:
+            return defining[-1]
+    return "\n\n".join(blocks)
+
+
+def syntax_error(code: str) -> Optional[str]:
+    try:
+        compile(code, "solution.py", "exec")
+    except SyntaxError as e:
+        return f"SyntaxError: {e.msg} (line {e.lineno})"
+    return None
+
+
+def within(path: str, directory: str) -> bool:
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+def hidden_paths() -> List[str]:
+    """Directories the child must not see: the repository with its .env, the cache and the home directory."""
+    hidden = []
+    for path in sorted({os.path.realpath(path) for path in (REPO_DIR, CACHE_DIR, os.path.expanduser("~"))}):
+        if os.path.isdir(path) and path != os.sep and not any(within(path, h) for h in hidden):
+            hidden.append(path)
+    return hidden
+
+
+def needed_paths() -> List[str]:
+    """Directories the child cannot run without: the interpreter and the temporary directory."""
+    needed = []
+    paths = (sys.prefix, sys.base_prefix, os.path.dirname(sys.executable), tempfile.gettempdir())
+    for path in sorted({os.path.realpath(path) for path in paths}):
+        if not any(within(path, n) for n in needed):
+            needed.append(path)
+    return needed
+
+
+def mount_points() -> List[Tuple[str, str]]:
+    """(mount point, per-mount options) of this mount namespace."""
+    with open("/proc/self/mountinfo") as f:
+        fields = [line.split() for line in f]
+    return [(MOUNTINFO_ESCAPE_RE.sub(lambda m: chr(int(m.group(1), 8)), f[4]), f[5]) for f in fields]
+
+
+def remount(target: str, options: str, writable: bool) -> str:
+    # Flags set by the parent namespace (nosuid, nodev, atime) are locked and must be repeated
+    flags = [flag for flag in options.split(",") if flag and flag not in ("rw", "ro")]
+    return f"mount -o {','.join(['remount', 'bind', 'rw' if writable else 'ro', *flags])} {target}"
+
+
+def isolation_script() -> str:
+    """Shell run inside the new mount namespace before the child is exec'd.
+
+    ``hidden_paths`` are covered with empty tmpfs, the ``needed_paths`` under them
+    are mounted back through descriptors opened before, every mount is made
+    read-only and only the working directory is made writable again.
+    """
+    hidden = hidden_paths()
+    restored = [path for path in needed_paths() if any(within(path, h) for h in hidden)]
+    points = {path: options for path, options in mount_points() if not any(within(path, h) for h in hidden)}
+    steps = [f"exec {3 + i}< {shlex.quote(path)}" for i, path in enumerate(restored)]
+    steps += [f"mount -t tmpfs -o size=1m,mode=755 tmpfs {shlex.quote(path)}" for path in hidden]
+    for i, path in enumerate(restored):
+        # Not canonicalized, the descriptor still reaches the covered directory
+        steps += [f"mkdir -p {shlex.quote(path)}", f"mount --no-canonicalize --bind /proc/self/fd/{3 + i} {shlex.quote(path)}",
+                  f"exec {3 + i}<&-"]
+    steps += [remount(shlex.quote(path), options, False) for path, options in sorted(points.items())]
+    steps += [remount(shlex.quote(path), "", False) for path in hidden + restored]
+    # The working directory is a bind of itself, inheriting the locked flags of the mount holding it
+    here = max((path for path in points if within(tempfile.gettempdir(), path)), key=len, default=os.sep)
+    held = "" if any(within(tempfile.gettempdir(), path) for path in restored) else points.get(here, "")
+    steps += ['mount --bind "$PWD" "$PWD"', remount('"$PWD"', held, True), 'cd "$PWD"', 'exec "$@"']
+    return " && ".join(steps)
+
+
+@lru_cache(maxsize=1)
+def isolation() -> List[str]:
+    """``unshare`` prefix giving the child an empty network namespace and the filesystem of ``isolation_script``.
+
+    Empty when this host does not allow unprivileged namespaces.
+    """
+    unshare = shutil.which("unshare")
+    if unshare is None or not sys.platform.startswith("linux"):
+        return []
+    prefix = [unshare, "--net", "--mount", "--map-root-user", "sh", "-c", isolation_script(), "sandbox"]
+    directory = tempfile.mkdtemp(prefix="sage-sandbox-")
+    try:
+        subprocess.run([*prefix, "true"], cwd=directory, capture_output=True, timeout=5, check=True)
+    except (OSError, subprocess.SubprocessError):
+        return []
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return prefix
+
+
+def check_isolation(allow_unisolated: bool = SANDBOX_ALLOW_UNISOLATED):
+    if isolation():
+        return
+    if not allow_unisolated:
+        raise SandboxUnavailable(
+            "Cannot create the network and mount namespaces the sandbox needs (is unshare available and are "
+            "unprivileged user namespaces enabled?). Set SAGE_SANDBOX_ALLOW_UNISOLATED=true to run generated "
+            "code without them, only for code you trust."
+        )
+    warn_unisolated()
+
+
+@lru_cache(maxsize=1)
+def warn_unisolated():
+    logger.warning("Running generated code WITHOUT sandbox isolation: it can reach the network and read your files")
+
+
+def _kill(process: subprocess.Popen):
+    # Children the code started are in the same session and go too
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def run_tests(
+        code: str, test_code: str, timeout: float = SANDBOX_TIMEOUT, memory_mb: int = SANDBOX_MEMORY_MB,
+        deadline: Optional[Deadline] = None, allow_unisolated: bool = SANDBOX_ALLOW_UNISOLATED,
+) -> SandboxResult:
+    """Import ``code`` as module ``solution`` in a fresh interpreter and run ``test_code`` against it.
+
+    The child runs in an empty temporary directory with a minimal environment,
+    CPU, memory and file size limits, no network, the repository, cache and
+    home directory hidden and the rest of the filesystem read-only. It is killed with its process group after ``timeout``
+    or as soon as ``deadline`` is cancelled. Raises ``SandboxUnavailable`` when
+    the namespaces cannot be created, unless ``allow_unisolated``.
+    """
+    check_isolation(allow_unisolated)
+    if deadline is not None:
+        if deadline.expired:
+            return SandboxResult("cancelled", 0.0)
+        timeout = min(timeout, deadline.remaining() or timeout)
+    directory = tempfile.mkdtemp(prefix="sage-sandbox-")
+    unregister = None
+    try:
+        with open(os.path.join(directory, "solution.py"), "w", encoding="utf-8") as f:
+            f.write(code)
+        with open(os.path.join(directory, "run_tests.py"), "w", encoding="utf-8") as f:
+            f.write(PRELUDE.format(cpu=max(1, int(timeout)), memory=memory_mb * 2 ** 20))
+            f.write("from solution import *\n\n")
+            f.write(test_code)
+        env = {"PATH": os.defpath, "HOME": directory, "TMPDIR": directory, "PYTHONHASHSEED": "0", "PYTHONIOENCODING": "utf-8"}
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [*isolation(), sys.executable, "-I", "-B", "run_tests.py"],
+            cwd=directory, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, errors="replace", start_new_session=True,
+        )
+        if deadline is not None:
+            unregister = deadline.on_cancel(lambda: _kill(process))
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill(process)
+            stdout, stderr = process.communicate()
+            status = "timeout"
+        else:
+            status = "passed" if process.returncode == 0 else "failed"
+        if status != "passed" and deadline is not None and deadline.expired:
+            status = "cancelled"
+        return SandboxResult(status, time.perf_counter() - started, process.returncode,
+                             stdout[-MAX_OUTPUT_CHARS:], stderr[-MAX_OUTPUT_CHARS:])
+    finally:
+        if unregister is not None:
+            unregister()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class Sandbox:
+    """Pool running each test in its own sandboxed interpreter, ``workers`` at a time."""
+
+    def __init__(
+            self, workers: int = SANDBOX_WORKERS, timeout: float = SANDBOX_TIMEOUT, memory_mb: int = SANDBOX_MEMORY_MB,
+            allow_unisolated: bool = SANDBOX_ALLOW_UNISOLATED,
+    ):
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.allow_unisolated = allow_unisolated
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sage-sandbox")
+
+    @property
+    def isolated(self) -> bool:
+        return bool(isolation())
+
+    def submit(
+            self, code: str, test_code: str, timeout: Optional[float] = None, deadline: Optional[Deadline] = None,
+    ) -> Future:
+        # Raised here rather than from the future, so callers fail before anything runs
+        check_isolation(self.allow_unisolated)
+        return self._pool.submit(
+            run_tests, code, test_code, timeout or self.timeout, self.memory_mb, deadline, self.allow_unisolated,
+        )
+
+    def close(self, cancel: bool = False):
+        self._pool.shutdown(wait=not cancel, cancel_futures=cancel)
+
+
+@lru_cache(maxsize=1)
+def shared_sandbox() -> Sandbox:
+    # One pool per process, Streamlit reruns reuse it
+    return Sandbox()
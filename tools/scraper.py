@@ -0,0 +1,69 @@
+from typing import Iterable, List, Optional
+
+from tools.deadline import Deadline
+from tools.fetcher import AsyncFetcher, FetchResult
+from tools.page_cache import PageCache
+from tools.tracing import record, span
+
+# Passage selection picks what reaches the summary prompt, anything past this is never read
+MAX_PAGE_CHARS = 40000
+FETCH_FAILED = "Failed to retrieve the webpage"
+
+fetcher = AsyncFetcher()
+page_cache = PageCache()
+
+
+def page_text(result: FetchResult):
+    if result.error is not None:
+        return f"{FETCH_FAILED}: {result.error}"
+    if result.status != 200:
+        return f"{FETCH_FAILED}: Status code {result.status}"
+    return result.text
+
+
+def fetch_failed(text: str) -> bool:
+    return text.startswith(FETCH_FAILED)
+
+
+def scrape_texts(urls: Iterable[str], deadline: Optional[Deadline] = None) -> List[str]:
+    # Duplicate urls are fetched once, every page is fetched concurrently
+    urls = list(urls)
+    texts = {}
+    stale = {}
+    with span("fetch", urls=len(urls)) as current:
+        for url in dict.fromkeys(urls):
+            cached = page_cache.get(url)
+            if cached is not None and cached.fresh:
+                texts[url] = cached.text
+            elif cached is not None:
+                stale[url] = cached
+
+        missing = [url for url in dict.fromkeys(urls) if url not in texts]
+        current.set("cache_hits", len(texts))
+        current.set("fetched", len(missing))
+        request_headers = {url: page.conditional_headers() for url, page in stale.items()}
+        results = fetcher.fetch_many(missing, request_headers, max_chars=MAX_PAGE_CHARS, deadline=deadline)
+        if results:
+            record("parse", sum(result.parse_seconds for result in results), pages=sum(1 for r in results if r.ok))
+        for result in results:
+            if result.status == 304 and result.url in stale:
+                page_cache.mark_revalidated(result.url)
+                current.add("revalidated")
+                texts[result.url] = stale[result.url].text
+                continue
+            texts[result.url] = page_text(result)
+            if result.ok:
+                current.add("chars", len(texts[result.url]))
+                page_cache.put(
+                    result.url,
+                    texts[result.url],
+                    etag=result.headers.get("ETag"),
+                    last_modified=result.headers.get("Last-Modified"),
+                )
+            else:
+                current.add("errors")
+    return [texts[url] for url in urls]
+
+
+def scrape_text(url: str, deadline: Optional[Deadline] = None):
+    return scrape_texts([url], deadline)[0]
@@ -0,0 +1,31 @@
+import logging
+import time
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StreamTimer:
+    """Pass-through iterator that records time to first chunk and total time."""
+
+    def __init__(self, stream: Iterable, name: str = "stream"):
+        self.stream = stream
+        self.name = name
+        self.time_to_first_token: Optional[float] = None
+        self.total_time: Optional[float] = None
+
+    def __iter__(self):
+        start = time.perf_counter()
+        for chunk in self.stream:
+            if self.time_to_first_token is None:
+                self.time_to_first_token = time.perf_counter() - start
+            yield chunk
+        self.total_time = time.perf_counter() - start
+        logger.info(
+            "%s: first token after %.3fs, done after %.3fs", self.name, self.time_to_first_token or 0.0, self.total_time
+        )
+
+    def summary(self):
+        if self.time_to_first_token is None:
+            return "No output"
+        return f"Time to first token: {self.time_to_first_token:.2f}s, total: {self.total_time or 0.0:.2f}s"
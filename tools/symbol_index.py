@@ -0,0 +1,210 @@
+import ast
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+from git import BadName, GitCommandError, Repo
+from langchain_core.documents import Document
+
+# Files kept decoded per (commit, path), definitions asked about once are usually asked about again
+SOURCE_CACHE_FILES = 64
+# Dotted names never end in a dot, so a sentence's full stop is not part of the identifier
+IDENTIFIER_RE = re.compile(r"`(\w+(?:\.\w+)*)`|\b([A-Za-z_]\w*(?:\.\w+)*)(\s*\()?")
+CAMEL_CASE_RE = re.compile(r"[a-z0-9][A-Z]|[A-Z]{2}[a-z]")
+SUBCLASS_QUESTION_RE = re.compile(
+    r"(?:classes?|subclass(?:es)?)\s+(?:are\s+|that\s+are\s+)?(?:derived|inherit(?:ing)?|subclass(?:ing)?|extend(?:ing)?)"
+    r"\s*(?:from|of)?\s+(?:the\s+)?`?([\w.]+)`?"
+    r"|subclass(?:es)?\s+of\s+(?:the\s+)?`?([\w.]+)`?",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class Symbol:
+    name: str
+    qualname: str
+    kind: str
+    path: str
+    start_line: int
+    end_line: int
+    bases: List[str] = field(default_factory=list)
+
+
+def _base_name(node: ast.expr) -> Optional[str]:
+    # Generic[Input, Output] -> Generic, module.Base -> Base
+    while isinstance(node, ast.Subscript):
+        node = node.value
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    if isinstance(node, ast.Name):
+        return node.id
+    return None
+
+
+def extract_symbols(tree: ast.AST, path: str) -> List[Symbol]:
+    symbols = []
+
+    def visit(nodes, prefix):
+        for node in nodes:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+                if isinstance(node, ast.ClassDef):
+                    bases = [name for name in map(_base_name, node.bases) if name]
+                    symbols.append(Symbol(node.name, prefix + node.name, "class", path, start, node.end_lineno, bases))
+                    visit(node.body, prefix + node.name + ".")
+                else:
+                    kind = "method" if prefix and not prefix.endswith(".<locals>.") else "function"
+                    symbols.append(Symbol(node.name, prefix + node.name, kind, path, start, node.end_lineno))
+                    visit(node.body, prefix + node.name + ".<locals>.")
+
+    visit(getattr(tree, "body", []), "")
+    return symbols
+
+
+class SymbolIndex:
+    """Definitions (classes, functions, methods) of an indexed repo with their spans and base classes.
+
+    Persisted in SQLite next to the vector index, held in memory for lookups.
+    """
+
+    def __init__(self, path: str, repo_path: str):
+        self.repo_path = repo_path
+        # Sources are read at this commit, the checkout may already be at a newer one
+        self.commit: Optional[str] = None
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS symbols ("
+            " name TEXT NOT NULL, qualname TEXT NOT NULL, kind TEXT NOT NULL, path TEXT NOT NULL,"
+            " start_line INTEGER NOT NULL, end_line INTEGER NOT NULL, bases TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS symbols_path ON symbols (path)")
+        self._db.commit()
+        self._by_name: Dict[str, List[Symbol]] = {}
+        self._subclasses: Dict[str, List[Symbol]] = {}
+        self._repo: Optional[Repo] = None
+        self._repo_lock = threading.Lock()
+        # A file at a commit never changes, so its text can be kept
+        self._file_at = lru_cache(maxsize=SOURCE_CACHE_FILES)(self._read_file_at)
+        self.load()
+
+    def load(self):
+        by_name = defaultdict(list)
+        subclasses = defaultdict(list)
+        for row in self._db.execute("SELECT * FROM symbols"):
+            symbol = Symbol(*row[:6], json.loads(row[6]))
+            by_name[symbol.name].append(symbol)
+            if symbol.qualname != symbol.name:
+                by_name[symbol.qualname].append(symbol)
+            for base in symbol.bases:
+                subclasses[base].append(symbol)
+        self._by_name, self._subclasses = dict(by_name), dict(subclasses)
+
+    def reset(self):
+        self._db.execute("DELETE FROM symbols")
+        self._db.commit()
+
+    def delete_files(self, paths: Iterable[str]):
+        self._db.executemany("DELETE FROM symbols WHERE path = ?", [(path,) for path in paths])
+        self._db.commit()
+
+    def add(self, symbols: List[Symbol]):
+        self._db.executemany(
+            "INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(*list(asdict(symbol).values())[:6], json.dumps(symbol.bases)) for symbol in symbols],
+        )
+        self._db.commit()
+
+    def lookup(self, name: str) -> List[Symbol]:
+        return self._by_name.get(name, [])
+
+    def subclasses(self, name: str) -> List[Symbol]:
+        # Breadth-first over the stored inheritance graph, so indirect subclasses are included
+        found, queue, seen = [], [name.rsplit(".", 1)[-1]], set()
+        while queue:
+            for symbol in self._subclasses.get(queue.pop(0), []):
+                if symbol.qualname not in seen:
+                    seen.add(symbol.qualname)
+                    found.append(symbol)
+                    queue.append(symbol.name)
+        return found
+
+    def identifiers(self, question: str) -> List[str]:
+        # Only defined names that look like code: `quoted`, called(), CamelCase, snake_case or dotted,
+        # or Capitalized anywhere but at the start of a sentence
+        names = []
+        for match in IDENTIFIER_RE.finditer(question):
+            quoted, word, call = match.groups()
+            name = quoted or word
+            sentence_start = not question[:match.start()].rstrip() or question[:match.start()].rstrip()[-1] in ".!?:\n"
+            looks_like_code = (
+                    quoted or call or "_" in name or "." in name or CAMEL_CASE_RE.search(name)
+                    or (name[:1].isupper() and not sentence_start)
+            )
+            if looks_like_code and name in self._by_name and name not in names:
+                names.append(name)
+        return names
+
+    def _read_file_at(self, commit: str, path: str) -> Optional[str]:
+        # Read through the repo's long-running cat-file process, not a git subprocess per lookup
+        with self._repo_lock:
+            for _ in range(2):
+                if self._repo is None:
+                    self._repo = Repo(self.repo_path)
+                try:
+                    blob = self._repo.commit(commit).tree[path]
+                    return blob.data_stream.read().decode("utf-8", errors="replace")
+                except (BadName, GitCommandError, KeyError, ValueError):
+                    # Objects fetched since the repo was opened need a fresh process, try once more
+                    self._repo.close()
+                    self._repo = None
+        # The indexed commit is gone from the checkout, its line numbers mean nothing now
+        return None
+
+    def source(self, symbol: Symbol, max_chars: int = 4000) -> Optional[str]:
+        # Large classes are cut after the signature, docstring and first members
+        if self.commit is not None:
+            text = self._file_at(self.commit, symbol.path)
+            if text is None:
+                return None
+        else:
+            with open(os.path.join(self.repo_path, symbol.path), encoding="utf-8") as f:
+                text = f.read()
+        lines = text.splitlines()
+        return "\n".join(lines[symbol.start_line - 1:symbol.end_line])[:max_chars]
+
+    def resolve(self, question: str, max_definitions: int = 3) -> Optional[List[Document]]:
+        """Answer context for ``question`` straight from the index, or None to fall back to vector search."""
+        match = SUBCLASS_QUESTION_RE.search(question)
+        if match:
+            base = match.group(1) or match.group(2)
+            subclasses = self.subclasses(base)
+            if subclasses:
+                listing = "\n".join(
+                    f"{s.qualname}({', '.join(s.bases)})  # {s.path}:{s.start_line}" for s in subclasses
+                )
+                return [Document(
+                    page_content=f"Classes derived from {base}, directly or indirectly:\n{listing}",
+                    metadata={"source": "symbol index", "symbols": base},
+                )]
+        documents = []
+        for name in self.identifiers(question):
+            for symbol in self.lookup(name)[:max_definitions]:
+                source = self.source(symbol)
+                if source is None:
+                    continue
+                documents.append(Document(
+                    page_content=source,
+                    metadata={
+                        "source": symbol.path,
+                        "start_line": symbol.start_line,
+                        "end_line": symbol.end_line,
+                        "symbols": symbol.qualname,
+                    },
+                ))
+        return documents or None
@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from tools.page_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+TRACING = os.getenv("SAGE_TRACING", "false").lower() == "true"
+# Share of requests whose spans are written to the JSONL file; metrics count every span
+TRACE_SAMPLE_RATE = float(os.getenv("SAGE_TRACE_SAMPLE_RATE", "1.0"))
+TRACE_FILE = os.getenv("SAGE_TRACE_FILE", os.path.join(CACHE_DIR, "traces.jsonl"))
+METRICS_PORT = int(os.getenv("SAGE_METRICS_PORT", "0"))
+# Loopback only by default: set to 0.0.0.0 to let a scraper on another host reach /metrics
+METRICS_HOST = os.getenv("SAGE_METRICS_HOST", "127.0.0.1")
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Span:
+    recording = True
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool, attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.start = time.time()
+        self.seconds = 0.0
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def add(self, key: str, amount=1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def record(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.seconds * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Returned while tracing is off, so instrumented code never has to check."""
+
+    recording = False
+
+    def set(self, key, value):
+        pass
+
+    def add(self, key, amount=1):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+_current: ContextVar[Optional[Span]] = ContextVar("sage_span", default=None)
+
+
+class Metrics:
+    """Per-stage latency histograms, error counts and summed numeric span attributes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+        self.count = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.errors = defaultdict(int)
+        self.totals = defaultdict(float)
+
+    def observe(self, span: Span):
+        with self._lock:
+            self.count[span.name] += 1
+            self.seconds[span.name] += span.seconds
+            buckets = self.buckets[span.name]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if span.seconds <= bound:
+                    buckets[i] += 1
+            if span.error is not None:
+                self.errors[span.name] += 1
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)):
+                    self.totals[(span.name, key)] += value
+
+    def reset(self):
+        with self._lock:
+            for values in (self.buckets, self.count, self.seconds, self.errors, self.totals):
+                values.clear()
+
+    def summary(self) -> dict:
+        """Count, mean latency, errors and attribute totals per stage."""
+        with self._lock:
+            return {
+                stage: {
+                    "count": count,
+                    "mean_ms": self.seconds[stage] / count * 1000,
+                    "total_s": self.seconds[stage],
+                    "errors": self.errors[stage],
+                    **{key: value for (name, key), value in self.totals.items() if name == stage},
+                }
+                for stage, count in sorted(self.count.items())
+            }
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = ["# TYPE sage_stage_duration_seconds histogram"]
+        with self._lock:
+            for stage in sorted(self.count):
+                for bound, count in zip(DURATION_BUCKETS, self.buckets[stage]):
+                    lines.append(f'sage_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'sage_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {self.count[stage]}')
+                lines.append(f'sage_stage_duration_seconds_sum{{stage="{stage}"}} {self.seconds[stage]}')
+                lines.append(f'sage_stage_duration_seconds_count{{stage="{stage}"}} {self.count[stage]}')
+            lines.append("# TYPE sage_stage_errors_total counter")
+            lines.extend(f'sage_stage_errors_total{{stage="{stage}"}} {self.errors[stage]}' for stage in sorted(self.count))
+            lines.append("# TYPE sage_stage_attribute_total counter")
+            lines.extend(
+                f'sage_stage_attribute_total{{stage="{stage}",attribute="{key}"}} {value}'
+                for (stage, key), value in sorted(self.totals.items())
+            )
+        return "\n".join(lines) + "\n"
+
+
+class JsonlSink:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def write(self, record: dict):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+
+
+metrics = Metrics()
+sink = JsonlSink(TRACE_FILE)
+
+
+def current_span():
+    return _current.get() or NOOP_SPAN
+
+
+def _start(name: str, attributes: dict) -> Span:
+    parent = _current.get()
+    if parent is None:
+        # The sampling decision is made once per trace, children follow their root
+        return Span(name, uuid.uuid4().hex, None, random.random() < TRACE_SAMPLE_RATE, attributes)
+    return Span(name, parent.trace_id, parent.span_id, parent.sampled, attributes)
+
+
+def _finish(span: Span):
+    metrics.observe(span)
+    if span.sampled:
+        sink.write(span.record())
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time the block as stage ``name``; the yielded span takes extra attributes (tokens, cache hits, ...)."""
+    if not TRACING:
+        yield NOOP_SPAN
+        return
+    current = _start(name, attributes)
+    token = _current.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.seconds = time.perf_counter() - started
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Generators can finish in a different context than they started in
+            pass
+        _finish(current)
+
+
+def record(name: str, seconds: float, **attributes):
+    """Add an already measured stage, e.g. time spent parsing spread over a streamed download."""
+    if not TRACING:
+        return
+    finished = _start(name, attributes)
+    finished.start -= seconds
+    finished.seconds = seconds
+    _finish(finished)
+
+
+def in_current_context(fn):
+    """Bind ``fn`` to a copy of the caller's context, so work handed to a thread pool keeps its parent span."""
+    return partial(copy_context().run, fn)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server_lock = threading.Lock()
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    """Serve /metrics once per process; a no-op unless tracing is on and a port is configured."""
+    global _server
+    if not TRACING or not port:
+        return
+    with _server_lock:
+        if _server is not None:
+            return
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            logger.warning("Metrics endpoint not started on %s:%s: %s", host, port, e)
+            return
+        threading.Thread(target=_server.serve_forever, name="sage-metrics", daemon=True).start()
@@ -0,0 +1,415 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+BLOCK_ROWS = 65536
+FILES = (("vectors.i8", np.int8), ("scales.f32", np.float32), ("lists.i32", np.int32), ("alive.u8", np.uint8))
+
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Symmetric per-vector int8 on unit-length vectors, cosine becomes a scaled int8 dot product
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray, block: int = 8192) -> np.ndarray:
+    # Blocked so the similarity matrix stays small whatever the number of lists
+    return np.concatenate([
+        np.argmax(vectors[start:start + block].astype(np.float32) @ centroids.T, axis=1)
+        for start in range(0, len(vectors), block)
+    ]).astype(np.int32) if len(vectors) else np.empty(0, dtype=np.int32)
+
+
+def kmeans(vectors: np.ndarray, clusters: int, iterations: int = 15, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on unit vectors, the coarse quantizer of the inverted file."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = assign(vectors, centroids)
+        counts = np.bincount(assignment, minlength=clusters)
+        filled = counts > 0
+        starts = (np.cumsum(counts) - counts)[filled]
+        centroids[filled] = np.add.reduceat(vectors[np.argsort(assignment, kind="stable")], starts)
+        # Empty lists restart from random vectors
+        centroids[~filled] = vectors[rng.integers(len(vectors), size=int((~filled).sum()))]
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids
+
+
+def _top(scores: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    if len(scores) > k:
+        best = np.argpartition(-scores, k)[:k]
+        scores, rows = scores[best], rows[best]
+    order = np.argsort(-scores)
+    return scores[order], rows[order]
+
+
+class QuantizedVectorStore(VectorStore):
+    """Int8 vectors in memory-mapped files with an inverted-file (IVF) ANN index, texts and metadata in SQLite.
+
+    Opening an index reads only the SQLite schema and the small centroid matrix;
+    vector pages are loaded by the OS as queries touch them. Below
+    ``train_threshold`` vectors searches are exact, above it the vectors are
+    clustered into ~4*sqrt(n) lists and a query scans the ``nprobe`` closest lists.
+    Implements the subset of the Chroma API that RepoIndex uses.
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            embedding: Embeddings,
+            nprobe: int = 16,
+            train_threshold: int = 20000,
+            compact_ratio: float = 0.3,
+    ):
+        self.directory = directory
+        self.embedding = embedding
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "chunks.sqlite"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, source TEXT, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)")
+        self._db.commit()
+        self._config_path = os.path.join(directory, "config.json")
+        self._config = {"dim": None, "trained_on": 0}
+        if os.path.exists(self._config_path):
+            with open(self._config_path) as f:
+                self._config = json.load(f)
+        self._maps = None
+        self._postings = None
+        self._centroids = None
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _save_config(self):
+        tmp_path = self._config_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._config, f)
+        os.replace(tmp_path, self._config_path)
+
+    def _count(self) -> int:
+        dim = self._config["dim"]
+        if not dim or not os.path.exists(self._path("vectors.i8")):
+            return 0
+        # Rows appended by an interrupted add are ignored until all four files have them
+        return min(
+            (os.path.getsize(self._path(name)) if os.path.exists(self._path(name)) else 0)
+            // (np.dtype(dtype).itemsize * (dim if name == "vectors.i8" else 1))
+            for name, dtype in FILES
+        )
+
+    def _open(self):
+        if self._maps is None:
+            count, dim = self._count(), self._config["dim"]
+            if not count:
+                return None
+            self._maps = {
+                name: np.memmap(self._path(name), dtype=dtype, mode="r+" if name == "alive.u8" else "r",
+                                shape=(count, dim) if name == "vectors.i8" else (count,))
+                for name, dtype in FILES
+            }
+        return self._maps
+
+    def _invalidate(self):
+        self._maps = None
+        self._postings = None
+
+    def centroids(self) -> Optional[np.ndarray]:
+        if self._centroids is None and os.path.exists(self._path("centroids.npy")):
+            self._centroids = np.load(self._path("centroids.npy"))
+        return self._centroids
+
+    def _append(self, vectors: np.ndarray, scales: np.ndarray):
+        centroids = self.centroids()
+        lists = assign(vectors, centroids) if centroids is not None else np.full(len(vectors), -1, dtype=np.int32)
+        count, dim = self._count(), vectors.shape[1]
+        for (name, dtype), data in zip(FILES, (vectors, scales, lists, np.ones(len(vectors), dtype=np.uint8))):
+            with open(self._path(name), "ab") as f:
+                # Drop a partial tail so all four files stay row-aligned
+                f.truncate(count * np.dtype(dtype).itemsize * (dim if name == "vectors.i8" else 1))
+                f.write(np.ascontiguousarray(data, dtype=dtype).tobytes())
+        self._invalidate()
+
+    def add_texts(
+            self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, **kwargs: Any
+    ) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        vectors, scales = quantize(self.embedding.embed_documents(texts))
+        with self._lock:
+            if self._config["dim"] is None:
+                self._config["dim"] = vectors.shape[1]
+                self._save_config()
+            elif vectors.shape[1] != self._config["dim"]:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self._config['dim']}")
+            self.delete([id_ for id_ in ids if id_])
+            start = self._count()
+            self._append(vectors, scales)
+            self._db.executemany(
+                "INSERT INTO chunks VALUES (?, ?, ?, ?, ?)",
+                [
+                    (start + i, id_, metadata.get("source"), text, json.dumps(metadata))
+                    for i, (id_, text, metadata) in enumerate(zip(ids, texts, metadatas))
+                ],
+            )
+            self._db.commit()
+            alive = self._alive_count()
+            if alive >= self.train_threshold and alive >= 4 * self._config["trained_on"]:
+                self.train()
+        return ids
+
+    def add_documents(self, documents: List[Document], **kwargs: Any) -> List[str]:
+        return self.add_texts(
+            [document.page_content for document in documents], [document.metadata for document in documents], **kwargs
+        )
+
+    def _alive_count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def train(self, sample_size: int = 100000, seed: int = 0):
+        """(Re)cluster the stored vectors and reassign every row to its closest list."""
+        with self._lock:
+            maps = self._open()
+            if maps is None:
+                return
+            alive_rows = np.flatnonzero(maps["alive.u8"])
+            clusters = min(max(1, int(4 * math.sqrt(len(alive_rows)))), 65536, len(alive_rows))
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(alive_rows, min(len(alive_rows), max(sample_size, 40 * clusters)), replace=False))
+            training = maps["vectors.i8"][sample].astype(np.float32) * maps["scales.f32"][sample][:, None]
+            centroids = kmeans(training, clusters, seed=seed).astype(np.float32)
+            lists = np.memmap(self._path("lists.i32"), dtype=np.int32, mode="r+", shape=(len(maps["lists.i32"]),))
+            for start in range(0, len(lists), BLOCK_ROWS):
+                block = maps["vectors.i8"][start:start + BLOCK_ROWS]
+                lists[start:start + len(block)] = assign(block, centroids)
+            lists.flush()
+            del lists
+            np.save(self._path("centroids.npy.tmp.npy"), centroids)
+            os.replace(self._path("centroids.npy.tmp.npy"), self._path("centroids.npy"))
+            self._centroids = centroids
+            self._config["trained_on"] = len(alive_rows)
+            self._save_config()
+            self._invalidate()
+
+    def _posting_lists(self, maps) -> Tuple[np.ndarray, np.ndarray]:
+        # Rows sorted by list with offsets, rebuilt after writes
+        if self._postings is None:
+            lists = np.asarray(maps["lists.i32"])
+            order = np.argsort(lists, kind="stable").astype(np.int64)
+            offsets = np.searchsorted(lists[order], np.arange(len(self.centroids()) + 1))
+            self._postings = (order, offsets)
+        return self._postings
+
+    def _score(self, maps, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        scores = (maps["vectors.i8"][rows].astype(np.float32) @ query) * maps["scales.f32"][rows]
+        scores[maps["alive.u8"][rows] == 0] = -np.inf
+        return scores
+
+    def _exact(self, maps, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        best_scores, best_rows = np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        for start in range(0, len(maps["scales.f32"]), BLOCK_ROWS):
+            rows = np.arange(start, min(start + BLOCK_ROWS, len(maps["scales.f32"])))
+            scores = (maps["vectors.i8"][start:rows[-1] + 1].astype(np.float32) @ query) * maps["scales.f32"][rows]
+            scores[maps["alive.u8"][rows] == 0] = -np.inf
+            best_scores, best_rows = _top(np.concatenate([best_scores, scores]), np.concatenate([best_rows, rows]), k)
+        return best_scores, best_rows
+
+    def _ann(self, maps, query: np.ndarray, k: int, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        centroids = self.centroids()
+        order, offsets = self._posting_lists(maps)
+        probes = np.argsort(-(centroids @ query))[:nprobe]
+        rows = np.sort(np.concatenate([order[offsets[p]:offsets[p + 1]] for p in probes]))
+        # Rows added while the lists were untrained (list -1) sort first
+        rows = np.concatenate([order[:offsets[0]], rows])
+        return _top(self._score(maps, query, rows), rows, k)
+
+    def search_rows(self, query: np.ndarray, k: int, nprobe: Optional[int] = None, exact: bool = False):
+        with self._lock:
+            maps = self._open()
+            if maps is None:
+                return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+            query = np.asarray(query, dtype=np.float32)
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+            if exact or self.centroids() is None:
+                scores, rows = self._exact(maps, query, k)
+            else:
+                scores, rows = self._ann(maps, query, k, nprobe or self.nprobe)
+            keep = np.isfinite(scores)
+            return scores[keep], rows[keep]
+
+    def _documents(self, rows: List[int]) -> dict:
+        found = {}
+        for start in range(0, len(rows), 500):
+            batch = rows[start:start + 500]
+            for row, text, metadata in self._db.execute(
+                    f"SELECT row, text, metadata FROM chunks WHERE row IN ({','.join('?' * len(batch))})", batch
+            ):
+                found[row] = Document(page_content=text, metadata=json.loads(metadata))
+        return found
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4, **kwargs: Any):
+        scores, rows = self.search_rows(np.asarray(embedding), k, kwargs.get("nprobe"))
+        documents = self._documents([int(row) for row in rows])
+        return [(documents[int(row)], float(score)) for score, row in zip(scores, rows) if int(row) in documents]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1.0) / 2.0
+
+    def get(self, where: Optional[dict] = None, include: Optional[List[str]] = None) -> dict:
+        include = ["documents", "metadatas"] if include is None else include
+        if where and set(where) != {"source"}:
+            raise ValueError("Only filtering on 'source' is supported")
+        query, args = "SELECT id, text, metadata FROM chunks", ()
+        if where:
+            query, args = query + " WHERE source = ?", (where["source"],)
+        result = {"ids": [], "documents": [], "metadatas": []}
+        for id_, text, metadata in self._db.execute(query + " ORDER BY row", args):
+            result["ids"].append(id_)
+            if "documents" in include:
+                result["documents"].append(text)
+            if "metadatas" in include:
+                result["metadatas"].append(json.loads(metadata))
+        return result
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return None
+        with self._lock:
+            rows = []
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                rows.extend(row for (row,) in self._db.execute(
+                    f"SELECT row FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+                ))
+            if not rows:
+                return True
+            maps = self._open()
+            if maps is not None:
+                maps["alive.u8"][[row for row in rows if row < len(maps["alive.u8"])]] = 0
+                maps["alive.u8"].flush()
+            self._db.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row in rows])
+            self._db.commit()
+            count = self._count()
+            if count >= 1000 and 1 - self._alive_count() / count > self.compact_ratio:
+                self.compact()
+        return True
+
+    def compact(self):
+        """Rewrite the vector files without deleted rows, renumbering rows in place."""
+        with self._lock:
+            maps = self._open()
+            if maps is None:
+                return
+            # Rows without metadata (left by an interrupted add) are dropped like deleted ones
+            keep = np.fromiter(
+                (row for (row,) in self._db.execute("SELECT row FROM chunks WHERE row < ? ORDER BY row", (len(maps["alive.u8"]),))),
+                dtype=np.int64,
+            )
+            for name, dtype in FILES:
+                with open(self._path(name + ".tmp"), "wb") as f:
+                    for start in range(0, len(keep), BLOCK_ROWS):
+                        f.write(np.ascontiguousarray(maps[name][keep[start:start + BLOCK_ROWS]], dtype=dtype).tobytes())
+            self._invalidate()
+            del maps
+            # Ascending order never collides: a row's new number is below every row not yet moved
+            self._db.executemany(
+                "UPDATE chunks SET row = ? WHERE row = ?",
+                [(new_row, int(row)) for new_row, row in enumerate(keep) if new_row != row],
+            )
+            self._db.execute("DELETE FROM chunks WHERE row >= ?", (len(keep),))
+            for name, _ in FILES:
+                os.replace(self._path(name + ".tmp"), self._path(name))
+            self._db.commit()
+
+    def reset_collection(self):
+        with self._lock:
+            self._invalidate()
+            for name in [name for name, _ in FILES] + ["centroids.npy"]:
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+            self._centroids = None
+            self._config = {"dim": None, "trained_on": 0}
+            self._save_config()
+            self._db.execute("DELETE FROM chunks")
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, dim = self._count(), self._config["dim"] or 0
+            disk = sum(os.path.getsize(self._path(name)) for name, _ in FILES if os.path.exists(self._path(name)))
+            centroids = self.centroids()
+            return {
+                "vectors": count,
+                "alive": self._alive_count(),
+                "dim": dim,
+                "lists": 0 if centroids is None else len(centroids),
+                "vector_bytes": disk,
+                "float32_bytes": count * dim * 4,
+            }
+
+    def recall_report(self, k: int = 10, nprobes: Iterable[int] = (1, 2, 4, 8, 16, 32, 64), queries: int = 100, seed: int = 0):
+        """Recall@k of the IVF search against exact search over the same vectors, with latency, per nprobe."""
+        with self._lock:
+            maps = self._open()
+            if maps is None or self.centroids() is None:
+                return []
+            alive_rows = np.flatnonzero(maps["alive.u8"])
+            sample = np.random.default_rng(seed).choice(alive_rows, min(queries, len(alive_rows)), replace=False)
+            vectors = maps["vectors.i8"][sample].astype(np.float32) * maps["scales.f32"][sample][:, None]
+            start = time.perf_counter()
+            truth = [set(self.search_rows(vector, k, exact=True)[1].tolist()) for vector in vectors]
+            exact_ms = (time.perf_counter() - start) * 1000 / len(vectors)
+            report = []
+            for nprobe in nprobes:
+                start = time.perf_counter()
+                found = [set(self.search_rows(vector, k, nprobe=nprobe)[1].tolist()) for vector in vectors]
+                report.append({
+                    "nprobe": nprobe,
+                    f"recall@{k}": sum(len(a & b) / max(len(b), 1) for a, b in zip(found, truth)) / len(vectors),
+                    "ms/query": (time.perf_counter() - start) * 1000 / len(vectors),
+                    "exact ms/query": exact_ms,
+                })
+            return report
+
+    @classmethod
+    def from_texts(
+            cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, directory: str = "", **kwargs: Any
+    ) -> "QuantizedVectorStore":
+        store = cls(directory, embedding, **kwargs)
+        store.add_texts(texts, metadatas)
+        return store
@@ -0,0 +1,188 @@
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from tools.deadline import Deadline, deadline_scope
+from tools.sandbox import CODE_BLOCK_RE, Sandbox, check_isolation, extract_code, shared_sandbox, syntax_error
+from tools.tracing import span
+
+VERIFY_CANDIDATES = int(os.getenv("SAGE_VERIFY_CANDIDATES", "3"))
+# Whole generate-verify-repair budget; past it the best unverified candidate is returned
+VERIFY_BUDGET_SECONDS = float(os.getenv("SAGE_VERIFY_BUDGET", "30"))
+TEST_TIMEOUT_SECONDS = 10.0
+
+
+@dataclass
+class Candidate:
+    answer: str
+    code: str = ""
+    status: str = "pending"
+    error: Optional[str] = None
+    repair: bool = False
+
+
+@dataclass
+class Verification:
+    answer: Optional[str]
+    status: str
+    tests: str = ""
+    candidates: List[Candidate] = field(default_factory=list)
+    seconds: float = 0.0
+    # Why the answer is untested: tests that failed to generate or were unusable
+    tests_error: Optional[str] = None
+
+    @property
+    def passed(self):
+        return self.status == "passed"
+
+    @property
+    def error(self) -> Optional[str]:
+        """The last generation error, when no answer was produced at all."""
+        errors = [c.error for c in self.candidates if c.status == "error"]
+        return errors[-1] if self.answer is None and errors else None
+
+    def describe(self) -> str:
+        asserts = len(re.findall(r"^\s*assert\b", self.tests, re.M))
+        checked = f"{asserts} test assertion{'s' if asserts != 1 else ''}" if asserts else "the tests"
+        repaired = " after a repair round" if any(c.repair for c in self.candidates) else ""
+        if self.passed:
+            return f"Verified by {checked}{repaired}, {len(self.candidates)} candidates in {self.seconds:.1f}s"
+        if self.error is not None:
+            return f"No answer in {self.seconds:.1f}s, every generation failed: {self.error}"
+        if self.answer is None:
+            return f"No answer was generated in {self.seconds:.1f}s"
+        if self.status == "untested":
+            return (f"Not tested, {self.tests_error or 'no usable tests for the request'}; showing the first "
+                    f"candidate that ran cleanly{repaired}, {len(self.candidates)} candidates in {self.seconds:.1f}s")
+        statuses = ", ".join(c.status for c in self.candidates)
+        compiles = any(c.code and c.status != "syntax_error" for c in self.candidates)
+        shown = "the first candidate that compiles" if compiles else "the first answer, which has no runnable code"
+        return f"Not verified in {self.seconds:.1f}s ({statuses}); showing {shown}"
+
+
+def generate_verified(
+        query: str,
+        generate: Callable[[str], str],
+        tests: Optional[str] = None,
+        write_tests: Optional[Callable[[str, Optional[str]], str]] = None,
+        repair: Optional[Callable[[str, str, str], str]] = None,
+        candidates: int = VERIFY_CANDIDATES,
+        budget: float = VERIFY_BUDGET_SECONDS,
+        sandbox: Optional[Sandbox] = None,
+        entry_point: Optional[str] = None,
+) -> Verification:
+    """Sample ``candidates`` answers concurrently and return the first whose code passes the tests.
+
+    Tests are ``tests`` when given, else written by ``write_tests(query, entry_point)``
+    from the request alone, alongside the generations, so they cannot just restate
+    a candidate. Candidates are syntax-checked, then run in the sandbox as they
+    arrive. If every candidate fails, the failures go through
+    ``repair(query, code, error)`` once, again concurrently. The first pass, or the
+    end of ``budget``, cancels the remaining generations and tests. Without usable
+    tests the first candidate that runs cleanly is returned as "untested".
+    """
+    sandbox = sandbox or shared_sandbox()
+    # Before anything is generated, there would be nowhere to run it
+    check_isolation(sandbox.allow_unisolated)
+    deadline = Deadline(budget)
+    started = time.perf_counter()
+    results: List[Candidate] = []
+    pool = ThreadPoolExecutor(max_workers=candidates + 1, thread_name_prefix="sage-verify")
+
+    def scoped(fn, *args):
+        # The deadline reaches the scheduled model, which stops streaming once it is cancelled
+        with deadline_scope(deadline):
+            return fn(*args)
+
+    generations = {pool.submit(scoped, generate, query): False for _ in range(candidates)}
+    test_future = None
+    tests_error = None
+    if tests is None and write_tests is not None:
+        test_future = pool.submit(scoped, write_tests, query, entry_point)
+    elif tests is None:
+        tests, tests_error = "", "no tests were given"
+    waiting: List[Candidate] = []
+    checks = {}
+    repaired = False
+    winner: Optional[Candidate] = None
+
+    def check(candidate: Candidate):
+        checks[sandbox.submit(candidate.code, tests, TEST_TIMEOUT_SECONDS, deadline)] = candidate
+
+    with span("verify", candidates=candidates) as current:
+        try:
+            while winner is None and not deadline.expired:
+                if not generations and not checks and test_future is None:
+                    failed = [c for c in results if c.status in ("failed", "timeout")]
+                    if repaired or repair is None or not failed:
+                        break
+                    repaired = True
+                    for candidate in failed[:candidates]:
+                        generations[pool.submit(scoped, repair, query, candidate.code, candidate.error)] = True
+                pending = list(generations) + list(checks) + ([test_future] if test_future is not None else [])
+                done, _ = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future is test_future:
+                        test_future = None
+                        try:
+                            tests = extract_code(future.result())
+                        except Exception as e:
+                            tests, tests_error = "", f"writing tests failed ({type(e).__name__}: {e})"
+                        # Unusable generated tests leave only a clean run, and the answer untested
+                        if tests_error is None and (not tests.strip() or syntax_error(tests) is not None):
+                            tests, tests_error = "", "the model wrote no usable tests"
+                        for candidate in waiting:
+                            check(candidate)
+                        waiting = []
+                    elif future in checks:
+                        candidate = checks.pop(future)
+                        result = future.result()
+                        candidate.status = result.status
+                        candidate.error = None if result.passed else result.error()
+                        if result.passed and winner is None:
+                            winner = candidate
+                    else:
+                        is_repair = generations.pop(future)
+                        try:
+                            answer = future.result()
+                        except Exception as e:
+                            # An API or auth error is reported, not mistaken for running out of time
+                            error = f"{type(e).__name__}: {e}"
+                            results.append(Candidate("", status="error", error=error, repair=is_repair))
+                            continue
+                        candidate = Candidate(answer, repair=is_repair)
+                        results.append(candidate)
+                        if not CODE_BLOCK_RE.search(answer):
+                            # Nothing to run, e.g. an answer in another language
+                            candidate.status = "no_code"
+                            continue
+                        candidate.code = extract_code(answer, entry_point)
+                        candidate.error = syntax_error(candidate.code)
+                        if candidate.error is not None:
+                            candidate.status = "syntax_error"
+                        elif tests is not None:
+                            check(candidate)
+                        else:
+                            waiting.append(candidate)
+        finally:
+            # Stops the losing generations and kills their test processes
+            deadline.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+        current.set("generated", len(results))
+        current.set("repaired", repaired)
+        current.set("passed", winner is not None and bool(tests))
+
+    for candidate in results:
+        if candidate.status == "pending":
+            candidate.status = "cancelled"
+    seconds = time.perf_counter() - started
+    if winner is not None:
+        return Verification(
+            winner.answer, "passed" if tests else "untested", tests or "", results, seconds, tests_error,
+        )
+    answered = [c for c in results if c.status != "error"]
+    fallback = next((c for c in answered if c.code and c.status != "syntax_error"), None) or next(iter(answered), None)
+    return Verification(fallback.answer if fallback else None, "unverified", tests or "", results, seconds, tests_error)